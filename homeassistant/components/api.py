@@ -18,11 +18,12 @@ from homeassistant.const import (
     HTTP_UNPROCESSABLE_ENTITY, MATCH_ALL, URL_API, URL_API_COMPONENTS,
     URL_API_CONFIG, URL_API_DISCOVERY_INFO, URL_API_ERROR_LOG,
     URL_API_EVENT_FORWARD, URL_API_EVENTS, URL_API_SERVICES,
-    URL_API_STATES, URL_API_STATES_ENTITY, URL_API_STREAM, URL_API_TEMPLATE,
-    __version__)
+    URL_API_RECORDER_QUEUE, URL_API_STATES, URL_API_STATES_ENTITY,
+    URL_API_STREAM, URL_API_TEMPLATE, URL_API_WORKER_POOL, __version__)
 from homeassistant.exceptions import TemplateError
 from homeassistant.helpers.state import TrackStates
 from homeassistant.helpers import template
+from homeassistant.components import recorder
 from homeassistant.components.http import HomeAssistantView
 
 DOMAIN = 'api'
@@ -50,6 +51,8 @@ def setup(hass, config):
     hass.wsgi.register_view(APIComponentsView)
     hass.wsgi.register_view(APIErrorLogView)
     hass.wsgi.register_view(APITemplateView)
+    hass.wsgi.register_view(APIWorkerPoolView)
+    hass.wsgi.register_view(APIRecorderQueueView)
 
     return True
 
@@ -385,9 +388,39 @@ class APITemplateView(HomeAssistantView):
                                      HTTP_BAD_REQUEST)
 
 
+class APIWorkerPoolView(HomeAssistantView):
+    """View to handle worker pool requests."""
+
+    url = URL_API_WORKER_POOL
+    name = "api:worker-pool"
+
+    def get(self, request):
+        """Get the worker pool size and per job timing statistics."""
+        return self.json({
+            'worker_count': self.hass.pool.worker_count,
+            'queue_size': self.hass.pool.queue_size,
+            'jobs': self.hass.pool.job_stats,
+        })
+
+
+class APIRecorderQueueView(HomeAssistantView):
+    """View to handle recorder queue requests."""
+
+    url = URL_API_RECORDER_QUEUE
+    name = "api:recorder-queue"
+
+    def get(self, request):
+        """Get the depth of the recorder queue and the overflow counters."""
+        instance = recorder.get_instance()
+        if instance is None:
+            return self.json_message('Recorder not running', HTTP_NOT_FOUND)
+        return self.json(instance.queue_stats)
+
+
 def services_json(hass):
     """Generate services data to JSONify."""
-    return [{"domain": key, "services": value}
+    stats = hass.services.stats
+    return [{"domain": key, "services": value, "stats": stats.get(key, {})}
             for key, value in hass.services.services.items()]
 
 
@@ -161,7 +161,7 @@ def setup(hass, config):
     def trigger_service_handler(service_call):
         """Handle automation triggers."""
         for entity in component.extract_from_service(service_call):
-            hass.loop.create_task(entity.async_trigger(
+            hass.async_add_job(entity.async_trigger(
                 service_call.data.get(ATTR_VARIABLES), True))
 
     @asyncio.coroutine
@@ -169,16 +169,16 @@ def setup(hass, config):
         """Handle automation turn on/off service calls."""
         method = 'async_{}'.format(service_call.service)
         for entity in component.extract_from_service(service_call):
-            hass.loop.create_task(getattr(entity, method)())
+            hass.async_add_job(getattr(entity, method)())
 
     @asyncio.coroutine
     def toggle_service_handler(service_call):
         """Handle automation toggle service calls."""
         for entity in component.extract_from_service(service_call):
             if entity.is_on:
-                hass.loop.create_task(entity.async_turn_off())
+                hass.async_add_job(entity.async_turn_off())
             else:
-                hass.loop.create_task(entity.async_turn_on())
+                hass.async_add_job(entity.async_turn_on())
 
     @asyncio.coroutine
     def reload_service_handler(service_call):
@@ -187,7 +187,7 @@ def setup(hass, config):
             None, component.prepare_reload)
         if conf is None:
             return
-        hass.loop.create_task(_async_process_config(hass, conf, component))
+        hass.async_add_job(_async_process_config(hass, conf, component))
 
     hass.services.register(DOMAIN, SERVICE_TRIGGER, trigger_service_handler,
                            descriptions.get(SERVICE_TRIGGER),
@@ -260,7 +260,7 @@ class AutomationEntity(ToggleEntity):
             return
 
         yield from self.async_enable()
-        self.hass.loop.create_task(self.async_update_ha_state())
+        self.hass.async_add_job(self.async_update_ha_state())
 
     @asyncio.coroutine
     def async_turn_off(self, **kwargs) -> None:
@@ -271,7 +271,7 @@ class AutomationEntity(ToggleEntity):
         self._async_detach_triggers()
         self._async_detach_triggers = None
         self._enabled = False
-        self.hass.loop.create_task(self.async_update_ha_state())
+        self.hass.async_add_job(self.async_update_ha_state())
 
     @asyncio.coroutine
     def async_trigger(self, variables, skip_condition=False):
@@ -282,7 +282,7 @@ class AutomationEntity(ToggleEntity):
         if skip_condition or self._cond_func(variables):
             yield from self._async_action(variables)
             self._last_triggered = utcnow()
-            self.hass.loop.create_task(self.async_update_ha_state())
+            self.hass.async_add_job(self.async_update_ha_state())
 
     def remove(self):
         """Remove automation from HASS."""
@@ -341,7 +341,7 @@ def _async_process_config(hass, config, component):
             entity = AutomationEntity(name, async_attach_triggers, cond_func,
                                       action, hidden)
             if config_block[CONF_INITIAL_STATE]:
-                tasks.append(hass.loop.create_task(entity.async_enable()))
+                tasks.append(hass.async_add_job(entity.async_enable()))
             entities.append(entity)
 
     yield from asyncio.gather(*tasks, loop=hass.loop)
@@ -360,7 +360,7 @@ def _async_get_action(hass, config, name):
         """Action to be executed."""
         _LOGGER.info('Executing %s', name)
         logbook.async_log_entry(hass, name, 'has been triggered', DOMAIN)
-        hass.loop.create_task(script_obj.async_run(variables))
+        hass.async_add_job(script_obj.async_run(variables))
 
     return action
 
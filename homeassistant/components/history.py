@@ -6,12 +6,17 @@ https://home-assistant.io/components/history/
 """
 from collections import defaultdict
 from datetime import timedelta
-from itertools import groupby
+from itertools import chain, groupby
+import json
+import math
 
+from homeassistant.const import CONTENT_TYPE_JSON, HTTP_BAD_REQUEST
+from homeassistant.core import State
 import homeassistant.util.dt as dt_util
 from homeassistant.components import recorder, script
 from homeassistant.components.frontend import register_built_in_panel
 from homeassistant.components.http import HomeAssistantView
+from homeassistant.components.recorder.statistics import STATISTICS_PERIODS
 
 DOMAIN = 'history'
 DEPENDENCIES = ['recorder', 'http']
@@ -19,11 +24,19 @@ DEPENDENCIES = ['recorder', 'http']
 SIGNIFICANT_DOMAINS = ('thermostat',)
 IGNORE_DOMAINS = ('zone', 'scene',)
 
+# Pieces of JSON collected before they are written to a streamed response
+STREAM_BUFFER_SIZE = 500
+
 
 def last_5_states(entity_id):
     """Return the last 5 states for entity_id."""
     entity_id = entity_id.lower()
 
+    changes = [state for state in recorder.recent_states(entity_id)
+               if state.last_changed == state.last_updated]
+    if len(changes) >= 5:
+        return changes[:-6:-1]
+
     states = recorder.get_model('States')
     return recorder.execute(
         recorder.query('States').filter(
@@ -40,6 +53,93 @@ def get_significant_states(start_time, end_time=None, entity_id=None):
     as well as all states from certain domains (for instance
     thermostat so that we get current temperature in our graphs).
     """
+    if entity_id is not None:
+        result = _recent_significant_states(start_time, end_time, entity_id)
+        if result is not None:
+            return result
+
+    states = (
+        state for state in recorder.execute(
+            _significant_states_query(start_time, end_time, entity_id))
+        if _is_significant(state))
+
+    return states_to_json(states, start_time, entity_id)
+
+
+def stream_significant_states(start_time, end_time=None, entity_id=None,
+                              max_points=None):
+    """Yield the JSON of the significant states during a UTC period.
+
+    Together the pieces form a JSON list with a list of states per entity,
+    the values of get_significant_states. Rows are fetched in chunks and
+    their attributes are written as stored, so memory is bounded by the
+    chunk size instead of the length of the period.
+
+    With max_points the period is divided in that many buckets and the
+    states of each entity are downsampled to at most max_points states, see
+    _downsample_rows.
+    """
+    if max_points is not None:
+        bucket = (end_time - start_time) / max_points
+
+    elif entity_id is not None:
+        result = _recent_significant_states(start_time, end_time, entity_id)
+        if result is not None:
+            yield '[{}]'.format(','.join(
+                '[{}]'.format(','.join(state.as_json() for state in states))
+                for states in result.values()))
+            return
+
+    entity_ids = [entity_id] if entity_id is not None else None
+
+    # The synthetic zero data points, see states_to_json
+    start_states = {
+        state.entity_id: State(
+            state.entity_id, state.state, state.attributes,
+            start_time, start_time).as_json()
+        for state in get_states(start_time, entity_ids)}
+
+    rows = (
+        row for row in recorder.stream(
+            _significant_states_query(start_time, end_time, entity_id))
+        if _is_significant_row(row))
+
+    def entity_states():
+        """Yield the JSON of the states of each entity."""
+        for entity, group in groupby(rows, lambda row: row.entity_id):
+            start_state = start_states.pop(entity, None)
+            if max_points is None:
+                yield chain(() if start_state is None else (start_state,),
+                            (row.to_json() for row in group))
+            else:
+                yield _downsample_rows(group, start_time, bucket,
+                                       max_points, start_state)
+
+        for start_state in start_states.values():
+            yield (start_state,)
+
+    buffer = ['[']
+
+    for entity_idx, states in enumerate(entity_states()):
+        buffer.append(',[' if entity_idx else '[')
+
+        for state_idx, state in enumerate(states):
+            if state_idx:
+                buffer.append(',')
+            buffer.append(state)
+
+            if len(buffer) >= STREAM_BUFFER_SIZE:
+                yield ''.join(buffer)
+                buffer = []
+
+        buffer.append(']')
+
+    buffer.append(']')
+    yield ''.join(buffer)
+
+
+def _significant_states_query(start_time, end_time, entity_id):
+    """Return the query for the significant states during a period."""
     states = recorder.get_model('States')
     query = recorder.query('States').filter(
         (states.domain.in_(SIGNIFICANT_DOMAINS) |
@@ -53,12 +153,7 @@ def get_significant_states(start_time, end_time=None, entity_id=None):
     if entity_id is not None:
         query = query.filter_by(entity_id=entity_id.lower())
 
-    states = (
-        state for state in recorder.execute(
-            query.order_by(states.entity_id, states.last_updated))
-        if _is_significant(state))
-
-    return states_to_json(states, start_time, entity_id)
+    return query.order_by(states.entity_id, states.last_updated)
 
 
 def state_changes_during_period(start_time, end_time=None, entity_id=None):
@@ -80,6 +175,32 @@ def state_changes_during_period(start_time, end_time=None, entity_id=None):
     return states_to_json(states, start_time, entity_id)
 
 
+def get_statistics(start_time, end_time=None, entity_id=None,
+                   period=STATISTICS_PERIODS[-1]):
+    """Return the rollups of numeric states during UTC period.
+
+    Returns {'entity_id': [list of rollups]} of the periods of period
+    seconds that end after start_time. The periods still in progress are
+    stored by the recorder once they end.
+    """
+    statistics = recorder.get_model('Statistics')
+    query = recorder.query('Statistics').filter(
+        (statistics.period == period) &
+        (statistics.start > start_time - timedelta(seconds=period)))
+
+    if end_time is not None:
+        query = query.filter(statistics.start < end_time)
+
+    if entity_id is not None:
+        query = query.filter_by(entity_id=entity_id.lower())
+
+    result = defaultdict(list)
+    for rollup in recorder.execute(
+            query.order_by(statistics.entity_id, statistics.start)):
+        result[rollup['entity_id']].append(rollup)
+    return result
+
+
 def get_states(utc_point_in_time, entity_ids=None, run=None):
     """Return the states at a specific point in time."""
     if run is None:
@@ -128,9 +249,9 @@ def states_to_json(states, start_time, entity_id):
 
     # Get the states at the start time
     for state in get_states(start_time, entity_ids):
-        state.last_changed = start_time
-        state.last_updated = start_time
-        result[state.entity_id].append(state)
+        result[state.entity_id].append(State(
+            state.entity_id, state.state, state.attributes,
+            start_time, start_time))
 
     # Append all changes to it
     for entity_id, group in groupby(states, lambda state: state.entity_id):
@@ -140,6 +261,13 @@ def states_to_json(states, start_time, entity_id):
 
 def get_state(utc_point_in_time, entity_id, run=None):
     """Return a state at a specific point in time."""
+    if run is None:
+        # The recent states hold it if they reach back to the point in time
+        recent = [state for state in recorder.recent_states(entity_id)
+                  if state.last_updated < utc_point_in_time]
+        if recent:
+            return recent[-1]
+
     states = get_states(utc_point_in_time, (entity_id,), run)
 
     return states[0] if states else None
@@ -150,6 +278,7 @@ def setup(hass, config):
     """Setup the history hooks."""
     hass.wsgi.register_view(Last5StatesView)
     hass.wsgi.register_view(HistoryPeriodView)
+    hass.wsgi.register_view(StatisticsPeriodView)
     register_built_in_panel(hass, 'history', 'History', 'mdi:poll-box')
 
     return True
@@ -175,18 +304,196 @@ class HistoryPeriodView(HomeAssistantView):
 
     def get(self, request, datetime=None):
         """Return history over a period of time."""
-        one_day = timedelta(days=1)
-
-        if datetime:
-            start_time = dt_util.as_utc(datetime)
-        else:
-            start_time = dt_util.utcnow() - one_day
+        start_time, end_time = _period_from_request(request, datetime)
+        if end_time is None:
+            return self.json_message('Invalid end_time', HTTP_BAD_REQUEST)
 
-        end_time = start_time + one_day
         entity_id = request.args.get('filter_entity_id')
 
-        return self.json(
-            get_significant_states(start_time, end_time, entity_id).values())
+        max_points = request.args.get('max_points')
+        if max_points is not None:
+            try:
+                max_points = int(max_points)
+            except ValueError:
+                max_points = 0
+            if max_points < 1:
+                return self.json_message('Invalid max_points',
+                                         HTTP_BAD_REQUEST)
+
+        return self.Response(
+            stream_significant_states(
+                start_time, end_time, entity_id, max_points),
+            mimetype=CONTENT_TYPE_JSON)
+
+
+class StatisticsPeriodView(HomeAssistantView):
+    """Handle statistics period requests."""
+
+    url = '/api/history/statistics'
+    name = 'api:history:statistics-period'
+    extra_urls = ['/api/history/statistics/<datetime:datetime>']
+
+    def get(self, request, datetime=None):
+        """Return the rollups of numeric states over a period of time."""
+        start_time, end_time = _period_from_request(request, datetime)
+        if end_time is None:
+            return self.json_message('Invalid end_time', HTTP_BAD_REQUEST)
+
+        try:
+            period = int(request.args.get(
+                'period', STATISTICS_PERIODS[-1]))
+        except ValueError:
+            period = None
+        if period not in STATISTICS_PERIODS:
+            return self.json_message('Invalid period', HTTP_BAD_REQUEST)
+
+        return self.json(get_statistics(
+            start_time, end_time, request.args.get('filter_entity_id'),
+            period))
+
+
+def _period_from_request(request, datetime):
+    """Return the UTC start and end time requested.
+
+    The period starts a day ago and lasts a day by default. The end time is
+    None if the end_time argument is invalid.
+    """
+    one_day = timedelta(days=1)
+
+    if datetime:
+        start_time = dt_util.as_utc(datetime)
+    else:
+        start_time = dt_util.utcnow() - one_day
+
+    end_time = request.args.get('end_time')
+    if end_time is None:
+        return start_time, start_time + one_day
+
+    end_time = dt_util.parse_datetime(end_time)
+    if end_time is None:
+        return start_time, None
+
+    end_time = dt_util.as_utc(end_time)
+    return start_time, end_time if end_time > start_time else None
+
+
+def _recent_significant_states(start_time, end_time, entity_id):
+    """Return the significant states of an entity from its recent states.
+
+    Returns None if the recent states do not reach back to start_time.
+    """
+    recent = recorder.recent_states(entity_id.lower())
+    if not recent or recent[0].last_updated > start_time:
+        return None
+
+    result = defaultdict(list)
+
+    for state in recent:
+        if state.last_updated <= start_time:
+            # Only the last of these is kept, as zero data point
+            result[state.entity_id] = [State(
+                state.entity_id, state.state, state.attributes,
+                start_time, start_time)]
+
+        elif (end_time is None or state.last_updated < end_time) and \
+                _is_significant_change(state):
+            result[state.entity_id].append(state)
+
+    return result
+
+
+def _is_significant_change(state):
+    """Test if a state is significant like get_significant_states does."""
+    if state.domain in IGNORE_DOMAINS:
+        return False
+
+    return (state.domain in SIGNIFICANT_DOMAINS or
+            state.last_changed == state.last_updated) and \
+        _is_significant(state)
+
+
+def _downsample_rows(rows, start_time, bucket, max_points, start_state):
+    """Yield the JSON of the downsampled states rows of an entity.
+
+    Every bucket with rows gives one state, stamped with the start of the
+    bucket. If the last row of the bucket is numeric, the state holds the
+    mean of the numeric rows with min, max and mean next to it. Otherwise it
+    is the last state with the number of state changes in the bucket, and
+    it is left out if nothing changed since the previous state. The start
+    state is only kept when the first bucket has no rows, so at most
+    max_points states are returned.
+    """
+    def bucket_of(row):
+        """Return the index of the bucket a row falls in."""
+        last_updated = row.last_updated
+        if last_updated.tzinfo is None:
+            last_updated = last_updated.replace(tzinfo=dt_util.UTC)
+        return min(int((last_updated - start_time) / bucket), max_points - 1)
+
+    # Changes in the first bucket are counted from the start state
+    last_state = emitted_state = \
+        None if start_state is None else json.loads(start_state)['state']
+
+    for bucket_idx, bucket_rows in groupby(rows, bucket_of):
+        bucket_start = json.dumps(
+            (start_time + bucket * bucket_idx).isoformat())
+        row, changes, values = _summarize_bucket(bucket_rows, last_state)
+        last_state = row.state
+
+        if start_state is not None:
+            if bucket_idx:
+                yield start_state
+            start_state = None
+
+        if values is not None:
+            emitted_state = None
+            mean = sum(values) / len(values)
+            yield (
+                '{{"attributes": {}, "entity_id": {}, "last_changed": {}, '
+                '"last_updated": {}, "max": {}, "mean": {}, "min": {}, '
+                '"state": {}}}').format(
+                    row.attributes_json(), json.dumps(row.entity_id),
+                    bucket_start, bucket_start, json.dumps(max(values)),
+                    json.dumps(mean), json.dumps(min(values)),
+                    json.dumps(str(mean)))
+        elif changes or row.state != emitted_state:
+            emitted_state = row.state
+            yield (
+                '{{"attributes": {}, "changes": {}, "entity_id": {}, '
+                '"last_changed": {}, "last_updated": {}, '
+                '"state": {}}}').format(
+                    row.attributes_json(), changes,
+                    json.dumps(row.entity_id), bucket_start, bucket_start,
+                    json.dumps(row.state))
+
+    if start_state is not None:
+        yield start_state
+
+
+def _summarize_bucket(rows, last_state):
+    """Return the last row, state changes and numeric values of a bucket.
+
+    The values are None if the last row is not numeric.
+    """
+    changes = 0
+    values = []
+
+    for row in rows:
+        if last_state is not None and row.state != last_state:
+            changes += 1
+        last_state = row.state
+        last_row = row
+
+        try:
+            value = float(row.state)
+        except ValueError:
+            value = None
+
+        numeric = value is not None and math.isfinite(value)
+        if numeric:
+            values.append(value)
+
+    return last_row, changes, values if numeric else None
 
 
 def _is_significant(state):
@@ -197,3 +504,12 @@ def _is_significant(state):
     # scripts that are not cancellable will never change state
     return (state.domain != 'script' or
             state.attributes.get(script.ATTR_CAN_CANCEL))
+
+
+def _is_significant_row(row):
+    """Test if a states row is significant for history charts.
+
+    Only the attributes of scripts are decoded.
+    """
+    return (row.domain != 'script' or
+            json.loads(row.attributes_json()).get(script.ATTR_CAN_CANCEL))
@@ -21,7 +21,7 @@ from homeassistant.const import (
     HTTP_HEADER_ACCESS_CONTROL_ALLOW_ORIGIN, CONTENT_TYPE_JSON,
     HTTP_HEADER_ACCESS_CONTROL_ALLOW_HEADERS, ALLOWED_CORS_HEADERS,
     EVENT_HOMEASSISTANT_STOP, EVENT_HOMEASSISTANT_START)
-from homeassistant.core import split_entity_id
+from homeassistant.core import State, split_entity_id
 import homeassistant.util.dt as dt_util
 import homeassistant.helpers.config_validation as cv
 from homeassistant.components import persistent_notification
@@ -518,8 +518,16 @@ class HomeAssistantView(object):
 
     def json(self, result, status_code=200):
         """Return a JSON response."""
-        msg = json.dumps(
-            result, sort_keys=True, cls=rem.JSONEncoder).encode('UTF-8')
+        if isinstance(result, State):
+            msg = result.as_json()
+        elif isinstance(result, list) and \
+                all(isinstance(item, State) for item in result):
+            # Reuse the cached JSON of the states
+            msg = '[{}]'.format(', '.join(item.as_json() for item in result))
+        else:
+            msg = json.dumps(result, sort_keys=True, cls=rem.JSONEncoder)
+
+        msg = msg.encode('UTF-8')
         return self.Response(
             msg, mimetype=CONTENT_TYPE_JSON, status=status_code)
 
@@ -4,6 +4,7 @@ Provides functionality to interact with lights.
 For more details about this component, please refer to the documentation at
 https://home-assistant.io/components/light/
 """
+from collections import OrderedDict
 import logging
 import os
 import csv
@@ -212,63 +213,108 @@ def setup(hass, config):
         target_lights = component.extract_from_service(service)
         params.pop(ATTR_ENTITY_ID, None)
 
-        service_fun = None
-        if service.service == SERVICE_TURN_OFF:
-            service_fun = 'turn_off'
-        elif service.service == SERVICE_TOGGLE:
-            service_fun = 'toggle'
+        if service.service == SERVICE_TURN_ON:
+            # Processing extra data for turn light on request.
+            profile = profiles.get(params.pop(ATTR_PROFILE, None))
 
-        if service_fun:
-            for light in target_lights:
-                getattr(light, service_fun)(**params)
+            if profile:
+                params.setdefault(ATTR_XY_COLOR, profile[:2])
+                params.setdefault(ATTR_BRIGHTNESS, profile[2])
 
-            for light in target_lights:
-                if light.should_poll:
-                    light.update_ha_state(True)
-            return
+            color_name = params.pop(ATTR_COLOR_NAME, None)
 
-        # Processing extra data for turn light on request.
-        profile = profiles.get(params.pop(ATTR_PROFILE, None))
-
-        if profile:
-            params.setdefault(ATTR_XY_COLOR, profile[:2])
-            params.setdefault(ATTR_BRIGHTNESS, profile[2])
-
-        color_name = params.pop(ATTR_COLOR_NAME, None)
-
-        if color_name is not None:
-            params[ATTR_RGB_COLOR] = color_util.color_name_to_rgb(color_name)
+            if color_name is not None:
+                params[ATTR_RGB_COLOR] = \
+                    color_util.color_name_to_rgb(color_name)
 
+        # Lights of the same platform are switched in one batch, batches of
+        # different platforms run concurrently in the executor.
+        platforms = OrderedDict()
         for light in target_lights:
-            light.turn_on(**params)
+            platforms.setdefault(type(light), []).append(light)
 
-        for light in target_lights:
-            if light.should_poll:
-                light.update_ha_state(True)
+        jobs = [(_switch_lights, platform, lights, service.service, params)
+                for platform, lights in platforms.items()]
+
+        if len(jobs) == 1:
+            _switch_lights(*jobs[0][1:])
+        else:
+            for future in [hass.executor.submit(*job) for job in jobs]:
+                future.result()
 
     # Listen for light on and light off service calls.
     descriptions = load_yaml_config_file(
         os.path.join(os.path.dirname(__file__), 'services.yaml'))
     hass.services.register(DOMAIN, SERVICE_TURN_ON, handle_light_service,
                            descriptions.get(SERVICE_TURN_ON),
-                           schema=LIGHT_TURN_ON_SCHEMA)
+                           schema=cv.MemoizedSchema(LIGHT_TURN_ON_SCHEMA))
 
     hass.services.register(DOMAIN, SERVICE_TURN_OFF, handle_light_service,
                            descriptions.get(SERVICE_TURN_OFF),
-                           schema=LIGHT_TURN_OFF_SCHEMA)
+                           schema=cv.MemoizedSchema(LIGHT_TURN_OFF_SCHEMA))
 
     hass.services.register(DOMAIN, SERVICE_TOGGLE, handle_light_service,
                            descriptions.get(SERVICE_TOGGLE),
-                           schema=LIGHT_TOGGLE_SCHEMA)
+                           schema=cv.MemoizedSchema(LIGHT_TOGGLE_SCHEMA))
 
     return True
 
 
+def _switch_lights(platform, lights, service, params):
+    """Switch lights of one platform and update the polled ones."""
+    if service == SERVICE_TOGGLE:
+        lights_on, lights_off = [], []
+        for light in lights:
+            (lights_on if light.is_on else lights_off).append(light)
+
+        if lights_on:
+            _call_many(platform, 'turn_off', lights_on, params)
+        if lights_off:
+            _call_many(platform, 'turn_on', lights_off, params)
+    else:
+        _call_many(platform, service, lights, params)
+
+    for light in lights:
+        if light.should_poll:
+            light.update_ha_state(True)
+
+
+def _call_many(platform, method, lights, params):
+    """Call the batch method of a platform or else the method per light."""
+    method_many = getattr(platform, method + '_many', None)
+
+    if method_many is not None:
+        method_many(lights, **params)
+    else:
+        for light in lights:
+            getattr(light, method)(**params)
+
+
 class Light(ToggleEntity):
     """Representation of a light."""
 
     # pylint: disable=no-self-use, abstract-method
 
+    @classmethod
+    def turn_on_many(cls, lights, **kwargs):
+        """Turn on several lights of this platform at once.
+
+        Platforms that can switch several lights with one request to their
+        hub override this.
+        """
+        for light in lights:
+            light.turn_on(**kwargs)
+
+    @classmethod
+    def turn_off_many(cls, lights, **kwargs):
+        """Turn off several lights of this platform at once.
+
+        Platforms that can switch several lights with one request to their
+        hub override this.
+        """
+        for light in lights:
+            light.turn_off(**kwargs)
+
     @property
     def brightness(self):
         """Return the brightness of this light between 0..255."""
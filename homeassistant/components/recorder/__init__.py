@@ -7,25 +7,36 @@ to query this database.
 For more details about this component, please refer to the documentation at
 https://home-assistant.io/components/recorder/
 """
-import asyncio
+from collections import ChainMap
+from concurrent.futures import ThreadPoolExecutor
+import json
 import logging
+import os
 import queue
 import threading
 import time
 from datetime import timedelta, datetime
-from typing import Any, Union, Optional, List
+from typing import Any, Dict, Iterator, Union, Optional, List, Tuple
 
 import voluptuous as vol
 
-from homeassistant.core import HomeAssistant
+from homeassistant.core import (
+    Event, EventOrigin, HomeAssistant, State, callback, split_entity_id)
 from homeassistant.const import (EVENT_HOMEASSISTANT_START,
                                  EVENT_HOMEASSISTANT_STOP, EVENT_STATE_CHANGED,
                                  EVENT_TIME_CHANGED, MATCH_ALL)
 import homeassistant.helpers.config_validation as cv
 from homeassistant.helpers.event import track_point_in_utc_time
 from homeassistant.helpers.typing import ConfigType, QueryType
+from homeassistant.remote import JSONEncoder
 import homeassistant.util.dt as dt_util
 
+from homeassistant.components.recorder.purge import (
+    purge_conditions, vacuum_steps)
+from homeassistant.components.recorder.recent import RecentStates
+from homeassistant.components.recorder.statistics import (
+    save_open_statistics, save_statistics)
+
 DOMAIN = "recorder"
 
 REQUIREMENTS = ['sqlalchemy==1.0.15']
@@ -35,16 +46,77 @@ DEFAULT_DB_FILE = "home-assistant_v2.db"
 
 CONF_DB_URL = "db_url"
 CONF_PURGE_DAYS = "purge_days"
+CONF_BATCH_SIZE = "batch_size"
+CONF_COMMIT_INTERVAL = "commit_interval"
+CONF_QUEUE_SIZE = "queue_size"
+CONF_OVERFLOW = "overflow"
+CONF_INCLUDE = "include"
+CONF_EXCLUDE = "exclude"
+CONF_DOMAINS = "domains"
+CONF_ENTITIES = "entities"
+CONF_EVENT_TYPES = "event_types"
+CONF_RECENT_STATES = "recent_states"
+CONF_RECENT_ENTITIES = "recent_entities"
+
+OVERFLOW_DROP = "drop"
+OVERFLOW_SPILL = "spill"
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_COMMIT_INTERVAL = 1
+DEFAULT_QUEUE_SIZE = 30000
+DEFAULT_OVERFLOW = OVERFLOW_DROP
+DEFAULT_RECENT_STATES = 20
+DEFAULT_RECENT_ENTITIES = 1000
+
+# Journal that holds the events that did not fit in the queue
+SPILL_FILE = "home-assistant_v2.spill"
+
+# Per connection tuning of SQLite databases, the cache size is in KiB
+SQLITE_CACHE_SIZE = 16384
+SQLITE_MMAP_SIZE = 256 * 1024 * 1024
+SQLITE_READ_POOL_SIZE = 5
+
+# Number of attribute hashes the recorder remembers the row id of
+ATTRIBUTES_CACHE_SIZE = 2048
+
+# Rows deleted per transaction of a purge
+PURGE_CHUNK_SIZE = 2000
+
+# Rows fetched at a time when streaming query results
+STREAM_CHUNK_SIZE = 1000
 
 RETRIES = 3
 CONNECT_RETRY_WAIT = 10
 QUERY_RETRY_WAIT = 0.1
 
+FILTER_SCHEMA = vol.Schema({
+    vol.Optional(CONF_DOMAINS, default=[]):
+        vol.All(cv.ensure_list, [cv.string]),
+    vol.Optional(CONF_ENTITIES, default=[]): cv.entity_ids,
+})
+
 CONFIG_SCHEMA = vol.Schema({
     DOMAIN: vol.Schema({
         vol.Optional(CONF_PURGE_DAYS):
             vol.All(vol.Coerce(int), vol.Range(min=1)),
         vol.Optional(CONF_DB_URL): cv.string,
+        vol.Optional(CONF_BATCH_SIZE, default=DEFAULT_BATCH_SIZE):
+            vol.All(vol.Coerce(int), vol.Range(min=1)),
+        vol.Optional(CONF_COMMIT_INTERVAL, default=DEFAULT_COMMIT_INTERVAL):
+            vol.All(vol.Coerce(float), vol.Range(min=0)),
+        vol.Optional(CONF_QUEUE_SIZE, default=DEFAULT_QUEUE_SIZE):
+            vol.All(vol.Coerce(int), vol.Range(min=1)),
+        vol.Optional(CONF_OVERFLOW, default=DEFAULT_OVERFLOW):
+            vol.In([OVERFLOW_DROP, OVERFLOW_SPILL]),
+        vol.Optional(CONF_RECENT_STATES, default=DEFAULT_RECENT_STATES):
+            vol.All(vol.Coerce(int), vol.Range(min=0)),
+        vol.Optional(CONF_RECENT_ENTITIES, default=DEFAULT_RECENT_ENTITIES):
+            vol.All(vol.Coerce(int), vol.Range(min=1)),
+        vol.Optional(CONF_INCLUDE, default={}): FILTER_SCHEMA,
+        vol.Optional(CONF_EXCLUDE, default={}): FILTER_SCHEMA.extend({
+            vol.Optional(CONF_EVENT_TYPES, default=[]):
+                vol.All(cv.ensure_list, [cv.string]),
+        }),
     })
 }, extra=vol.ALLOW_EXTRA)
 
@@ -54,6 +126,12 @@ _LOGGER = logging.getLogger(__name__)
 # These classes will be populated during setup()
 # pylint: disable=invalid-name,no-member
 Session = None  # pylint: disable=no-member
+ReadSession = None  # pylint: disable=no-member
+
+# Queued by block_till_done to commit the pending events right away
+_FLUSH = object()
+# Queued to start purging old data between the batches
+_PURGE = object()
 
 
 def execute(q: QueryType) \
@@ -71,12 +149,53 @@ def execute(q: QueryType) \
                     (row.to_native() for row in q)
                     if row is not None]
             except sqlalchemy.exc.SQLAlchemyError as e:
-                log_error(e, retry_wait=QUERY_RETRY_WAIT, rollback=True)
+                # The query ran on the read session, not the writer's
+                ReadSession.rollback()
+                log_error(e, retry_wait=QUERY_RETRY_WAIT, rollback=False)
     finally:
-        Session.close()
+        ReadSession.close()
     return []
 
 
+def stream(q: QueryType, chunk_size: int=STREAM_CHUNK_SIZE) \
+        -> Iterator[Any]:  # pylint: disable=invalid-sequence-index
+    """Query the database and yield the rows as they are fetched.
+
+    Rows are loaded chunk_size at a time and are not converted to HA native
+    form, so memory is bounded by the chunk size instead of the result.
+    Unlike execute, the query is not retried.
+    """
+    try:
+        yield from q.yield_per(chunk_size)
+    finally:
+        ReadSession.close()
+
+
+def recent_states(entity_id: str) -> List[State]:
+    """Return the latest states recorded of an entity, oldest first.
+
+    No state of the entity was recorded in between the states returned. The
+    recorder keeps the states of the entities that changed most recently.
+    """
+    _verify_instance()
+    return _INSTANCE.recent.get(entity_id)
+
+
+def recorded_entity_ids(run: Any) -> Optional[List[str]]:
+    """Return the entities recorded in run if it is the current run."""
+    # Runs read from the database have naive UTC times
+    if _INSTANCE is None or run.end is not None or \
+       run.start.replace(tzinfo=None) != \
+       _INSTANCE.recording_start.replace(tzinfo=None):
+        return None
+    return _INSTANCE.recent.entity_ids()
+
+
+def get_instance() -> Any:
+    """Return the recorder, None if it is not set up."""
+    return _INSTANCE
+
+
 def run_information(point_in_time: Optional[datetime]=None):
     """Return information about current run.
 
@@ -104,25 +223,41 @@ def setup(hass: HomeAssistant, config: ConfigType) -> bool:
         _LOGGER.error('Only a single instance allowed.')
         return False
 
-    purge_days = config.get(DOMAIN, {}).get(CONF_PURGE_DAYS)
+    conf = config.get(DOMAIN, {})
+    purge_days = conf.get(CONF_PURGE_DAYS)
 
-    db_url = config.get(DOMAIN, {}).get(CONF_DB_URL, None)
+    db_url = conf.get(CONF_DB_URL, None)
     if not db_url:
         db_url = DEFAULT_URL.format(
             hass_config_path=hass.config.path(DEFAULT_DB_FILE))
 
-    _INSTANCE = Recorder(hass, purge_days=purge_days, uri=db_url)
+    _INSTANCE = Recorder(
+        hass, purge_days=purge_days, uri=db_url,
+        batch_size=conf.get(CONF_BATCH_SIZE, DEFAULT_BATCH_SIZE),
+        commit_interval=conf.get(CONF_COMMIT_INTERVAL,
+                                 DEFAULT_COMMIT_INTERVAL),
+        queue_size=conf.get(CONF_QUEUE_SIZE, DEFAULT_QUEUE_SIZE),
+        overflow=conf.get(CONF_OVERFLOW, DEFAULT_OVERFLOW),
+        spill_path=hass.config.path(SPILL_FILE),
+        include=conf.get(CONF_INCLUDE), exclude=conf.get(CONF_EXCLUDE),
+        recent_depth=conf.get(CONF_RECENT_STATES, DEFAULT_RECENT_STATES),
+        recent_entities=conf.get(CONF_RECENT_ENTITIES,
+                                 DEFAULT_RECENT_ENTITIES))
 
     return True
 
 
 def query(model_name: Union[str, Any], *args) -> QueryType:
-    """Helper to return a query handle."""
+    """Helper to return a query handle.
+
+    Queries run on the read connections, which do not wait for the recorder
+    to commit on SQLite.
+    """
     _verify_instance()
 
     if isinstance(model_name, str):
-        return Session.query(get_model(model_name), *args)
-    return Session.query(model_name, *args)
+        return ReadSession.query(get_model(model_name), *args)
+    return ReadSession.query(model_name, *args)
 
 
 def get_model(model_name: str) -> Any:
@@ -154,19 +289,61 @@ def log_error(e: Exception, retry_wait: Optional[float]=0,
 class Recorder(threading.Thread):
     """A threaded recorder class."""
 
-    # pylint: disable=too-many-instance-attributes
-    def __init__(self, hass: HomeAssistant, purge_days: int, uri: str) \
-            -> None:
+    # pylint: disable=too-many-instance-attributes, too-many-arguments
+    def __init__(self, hass: HomeAssistant, purge_days: int, uri: str,
+                 batch_size: int=DEFAULT_BATCH_SIZE,
+                 commit_interval: float=DEFAULT_COMMIT_INTERVAL,
+                 queue_size: int=DEFAULT_QUEUE_SIZE,
+                 overflow: str=DEFAULT_OVERFLOW,
+                 spill_path: Optional[str]=None,
+                 include: Optional[Dict[str, List[str]]]=None,
+                 exclude: Optional[Dict[str, List[str]]]=None,
+                 recent_depth: int=DEFAULT_RECENT_STATES,
+                 recent_entities: int=DEFAULT_RECENT_ENTITIES) -> None:
         """Initialize the recorder."""
         threading.Thread.__init__(self)
 
         self.hass = hass
         self.purge_days = purge_days
+        self.batch_size = batch_size
+        self.commit_interval = commit_interval
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self.spill_path = spill_path
         self.queue = queue.Queue()  # type: Any
+        include = include or {}
+        exclude = exclude or {}
+        self.include_domains = set(include.get(CONF_DOMAINS, []))
+        self.include_entities = set(include.get(CONF_ENTITIES, []))
+        self.exclude_domains = set(exclude.get(CONF_DOMAINS, []))
+        self.exclude_entities = set(exclude.get(CONF_ENTITIES, []))
+        self.exclude_event_types = set(exclude.get(CONF_EVENT_TYPES, []))
+        self.exclude_event_types.add(EVENT_TIME_CHANGED)
+        self.dropped = 0
+        self.spilled = 0
+        self.replayed = 0
+        # Spilled events are written by a worker of their own, in order
+        self._spill_executor = None  # type: Any
+        self._spill_pending = 0
+        self._spill_lock = threading.Lock()
+        self._spill_file_lock = threading.Lock()
+        self._spill_file = None  # type: Any
+        # Once events are spilled all events are, till the journal is
+        # replayed, so they are recorded in order.
+        self._spilling = spill_path is not None and (
+            os.path.isfile(spill_path + '.replay') or
+            os.path.isfile(spill_path) and os.path.getsize(spill_path) > 0)
         self.recording_start = dt_util.utcnow()
         self.db_url = uri
         self.db_ready = threading.Event()
         self.engine = None  # type: Any
+        self.read_engine = None  # type: Any
+        self._attributes_ids = {}  # type: Dict[str, int]
+        # The rollups of the periods in progress by entity and period
+        self._rollups = {}  # type: Dict[Tuple[str, int], Tuple]
+        self.recent = RecentStates(recent_depth, recent_entities)
+        self._purge_task = None  # type: Any
+        self.last_purge = None  # type: Optional[Dict[str, Any]]
         self._run = None  # type: Any
 
         def start_recording(event):
@@ -179,7 +356,6 @@ class Recorder(threading.Thread):
 
     def run(self):
         """Start processing events to save."""
-        from homeassistant.components.recorder.models import Events, States
         import sqlalchemy.exc
 
         while True:
@@ -194,42 +370,292 @@ class Recorder(threading.Thread):
         if self.purge_days is not None:
             def purge_ticker(event):
                 """Rerun purge every second day."""
-                self._purge_old_data()
+                self.queue.put(_PURGE)
                 track_point_in_utc_time(self.hass, purge_ticker,
                                         dt_util.utcnow() + timedelta(days=2))
             track_point_in_utc_time(self.hass, purge_ticker,
                                     dt_util.utcnow() + timedelta(minutes=5))
 
         while True:
-            event = self.queue.get()
+            if self._spilling and self.queue.empty():
+                self._replay_spilled()
+                continue
 
-            if event is None:
+            # A purge runs a chunk at a time in between the batches
+            if self._purge_task is not None and self.queue.empty():
+                self._purge_step()
+                continue
+
+            items = self._get_batch()
+            events = [item for item in items if isinstance(item, Event)]
+
+            if any(item is _PURGE for item in items) and \
+               self._purge_task is None:
+                self._purge_task = self._purge_steps()
+
+            if events:
+                self._save_batch(events)
+
+            if items[-1] is None:
+                self._close_spill_file()
+                self._commit(lambda session: save_open_statistics(
+                    session, self._rollups))
                 self._close_run()
                 self._close_connection()
+
+                if self._spill_executor is not None:
+                    self._spill_executor.shutdown(wait=True)
+
+            # Only now block_till_done may return, the batch is in the db.
+            for _ in items:
                 self.queue.task_done()
+
+            if items[-1] is None:
                 return
 
-            if event.event_type == EVENT_TIME_CHANGED:
-                self.queue.task_done()
-                continue
+            if self._purge_task is not None:
+                self._purge_step()
+
+    def _save_batch(self, events):
+        """Write a batch of events in one transaction."""
+        new_attributes_ids = {}
+        rollups = {}
+
+        def save(session):
+            """Save the events and the rollups of the periods that ended."""
+            self._save_events(session, events, new_attributes_ids)
+            save_statistics(session, events, self._rollups, rollups)
+
+        if self._commit(save):
+            # Only remember the rows that were committed
+            if len(self._attributes_ids) > ATTRIBUTES_CACHE_SIZE:
+                self._attributes_ids.clear()
+            self._attributes_ids.update(new_attributes_ids)
+            self._rollups = rollups
+            self.recent.add(events, self.recording_start)
+
+    def _replay_spilled(self):
+        """Write the events of the journal to the database.
+
+        The journal is renamed first so new events can be spilled meanwhile.
+        A journal left by an interrupted replay is replayed first. Spilling
+        ends once the journal is found empty with no spills pending.
+        """
+        replay_path = self.spill_path + '.replay'
+
+        if not os.path.isfile(replay_path):
+            self._wait_for_spills()
+
+            with self._spill_file_lock:
+                # The next spill opens a new journal
+                if self._spill_file is not None:
+                    self._spill_file.close()
+                    self._spill_file = None
+
+                with self._spill_lock:
+                    if not os.path.isfile(self.spill_path) or \
+                       os.path.getsize(self.spill_path) == 0:
+                        if self._spill_pending == 0:
+                            self._spilling = False
+                        return
+
+                os.rename(self.spill_path, replay_path)
+
+        _LOGGER.info("Recording the events spilled to %s", self.spill_path)
+        events = []
+
+        with open(replay_path) as replay:
+            for line in replay:
+                try:
+                    events.append(_event_from_json(line))
+                except ValueError:
+                    _LOGGER.warning("Skipping invalid line in %s: %s",
+                                    replay_path, line)
+                    continue
+
+                if len(events) >= self.batch_size:
+                    self._save_batch(events)
+                    self.replayed += len(events)
+                    events = []
+
+        if events:
+            self._save_batch(events)
+            self.replayed += len(events)
+
+        os.remove(replay_path)
+
+    def _get_batch(self):
+        """Wait for queued items and return them as a batch.
+
+        The batch is closed when it holds batch_size items, once
+        commit_interval seconds passed since its first item arrived or when
+        a shutdown or flush was queued.
+        """
+        items = [self.queue.get()]
+        deadline = time.monotonic() + self.commit_interval
+
+        while len(items) < self.batch_size and \
+                items[-1] is not None and items[-1] is not _FLUSH:
+            timeout = deadline - time.monotonic()
+
+            try:
+                if timeout > 0:
+                    items.append(self.queue.get(timeout=timeout))
+                else:
+                    items.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
 
-            dbevent = Events.from_event(event)
-            self._commit(dbevent)
+        return items
 
+    def _save_events(self, session, events, new_attributes_ids):
+        """Add events and the states they changed to the session.
+
+        The events are flushed first to learn their ids, the states are then
+        written with a single multi-row insert. Attributes are stored once
+        per distinct value, new_attributes_ids collects the rows added.
+        """
+        from homeassistant.components.recorder.models import (
+            Events, States, get_attributes_id)
+
+        dbevents = [Events.from_event(event) for event in events]
+        session.add_all(dbevents)
+        session.flush()
+
+        new_attributes_ids.clear()
+        attributes_ids = ChainMap(new_attributes_ids, self._attributes_ids)
+        dbstates = []
+        for event, dbevent in zip(events, dbevents):
             if event.event_type != EVENT_STATE_CHANGED:
-                self.queue.task_done()
                 continue
 
             dbstate = States.from_event(event)
             dbstate.event_id = dbevent.event_id
-            self._commit(dbstate)
+            dbstate.attributes_id = get_attributes_id(
+                session, dbstate.attributes, attributes_ids)
+            dbstate.attributes = None
+            dbstates.append(dbstate)
 
-            self.queue.task_done()
+        session.bulk_save_objects(dbstates)
 
-    @asyncio.coroutine
+    @callback
     def event_listener(self, event):
-        """Listen for new events and put them in the process queue."""
-        self.queue.put(event)
+        """Listen for new events and put them in the process queue.
+
+        Excluded events are left out before anything is serialized. Events
+        that do not fit in the queue are spilled to the journal or dropped.
+        """
+        if event.event_type in self.exclude_event_types:
+            return
+
+        if event.event_type == EVENT_STATE_CHANGED and \
+           not self._is_entity_recorded(event.data.get('entity_id')):
+            return
+
+        spill = self.overflow == OVERFLOW_SPILL
+
+        if not (spill and self._spilling) and \
+           self.queue.qsize() < self.queue_size:
+            self.queue.put(event)
+            return
+
+        if spill:
+            with self._spill_lock:
+                self._spilling = True
+                self._spill_pending += 1
+
+            if self._spill_executor is None:
+                self._spill_executor = ThreadPoolExecutor(max_workers=1)
+
+            try:
+                self._spill_executor.submit(self._spill, event)
+                return
+            except RuntimeError:
+                # The spill worker is shut down with the recorder
+                with self._spill_lock:
+                    self._spill_pending -= 1
+
+        self._drop()
+
+    def _drop(self):
+        """Count an event that was not recorded."""
+        if not self.dropped:
+            _LOGGER.warning("Recorder queue is full, dropping events")
+        self.dropped += 1
+
+    def _is_entity_recorded(self, entity_id):
+        """Return if the state changes of an entity are recorded.
+
+        An excluded entity or domain is never recorded, an included entity
+        always is. If anything is included other entities are only recorded
+        when their domain is included.
+        """
+        if entity_id in self.exclude_entities:
+            return False
+        elif entity_id in self.include_entities:
+            return True
+
+        domain = split_entity_id(entity_id)[0]
+
+        if domain in self.exclude_domains:
+            return False
+        elif self.include_domains or self.include_entities:
+            return domain in self.include_domains
+
+        return True
+
+    def _spill(self, event):
+        """Append an event to the journal or drop it if that fails.
+
+        Runs in the spill worker.
+        """
+        line = json.dumps(event.as_dict(), cls=JSONEncoder) + '\n'
+
+        try:
+            with self._spill_file_lock:
+                if self._spill_file is None:
+                    self._spill_file = open(self.spill_path, 'a')
+                    _LOGGER.warning("Recorder queue is full, spilling events "
+                                    "to %s", self.spill_path)
+
+                self._spill_file.write(line)
+                self._spill_file.flush()
+            self.spilled += 1
+        except OSError:
+            _LOGGER.exception("Unable to spill event to %s", self.spill_path)
+            self._drop()
+        finally:
+            with self._spill_lock:
+                self._spill_pending -= 1
+
+    def _close_spill_file(self):
+        """Close the journal once the pending events are written to it."""
+        self._wait_for_spills()
+
+        with self._spill_file_lock:
+            if self._spill_file is not None:
+                self._spill_file.close()
+                self._spill_file = None
+
+    def _wait_for_spills(self):
+        """Block until the events handed to the spill worker are written."""
+        if self._spill_executor is not None:
+            self._spill_executor.submit(lambda: None).result()
+
+    @property
+    def queue_stats(self):
+        """Return the depth of the queue and what happened to overflow.
+
+        Served by the API at /api/recorder/queue.
+        """
+        return {
+            'queue_depth': self.queue.qsize(),
+            'queue_size': self.queue_size,
+            'spilling': self._spilling,
+            'dropped': self.dropped,
+            'spilled': self.spilled,
+            'replayed': self.replayed,
+        }
 
     def shutdown(self, event):
         """Tell the recorder to shut down."""
@@ -241,6 +667,8 @@ class Recorder(threading.Thread):
 
     def block_till_done(self):
         """Block till all events processed."""
+        if self.is_alive():
+            self.queue.put(_FLUSH)
         self.queue.join()
 
     def block_till_db_ready(self):
@@ -249,38 +677,61 @@ class Recorder(threading.Thread):
 
     def _setup_connection(self):
         """Ensure database is ready to fly."""
-        global Session  # pylint: disable=global-statement
+        global Session, ReadSession  # pylint: disable=global-statement
 
         import homeassistant.components.recorder.models as models
-        from sqlalchemy import create_engine
+        from sqlalchemy import create_engine, event
         from sqlalchemy.orm import scoped_session
         from sqlalchemy.orm import sessionmaker
+        from sqlalchemy.pool import QueuePool, StaticPool
 
         if self.db_url == 'sqlite://' or ':memory:' in self.db_url:
-            from sqlalchemy.pool import StaticPool
             self.engine = create_engine(
                 'sqlite://',
                 connect_args={'check_same_thread': False},
                 poolclass=StaticPool)
+            self.read_engine = self.engine
+        elif self.db_url.startswith('sqlite:'):
+            # Keep the connections open so the page cache survives between
+            # commits. With WAL the readers do not wait for the writer.
+            self.engine = create_engine(
+                self.db_url, echo=False,
+                connect_args={'check_same_thread': False},
+                poolclass=QueuePool, pool_size=1)
+            event.listen(self.engine, 'connect', _setup_sqlite_connection)
+
+            self.read_engine = create_engine(
+                self.db_url, echo=False,
+                connect_args={'check_same_thread': False},
+                poolclass=QueuePool, pool_size=SQLITE_READ_POOL_SIZE)
+            event.listen(self.read_engine, 'connect',
+                         _setup_sqlite_read_connection)
         else:
             self.engine = create_engine(self.db_url, echo=False)
+            self.read_engine = self.engine
 
         models.Base.metadata.create_all(self.engine)
+        migrate_schema(self.engine)
         session_factory = sessionmaker(bind=self.engine)
         Session = scoped_session(session_factory)
+        ReadSession = scoped_session(sessionmaker(bind=self.read_engine))
         self.db_ready.set()
 
     def _close_connection(self):
         """Close the connection."""
-        global Session  # pylint: disable=global-statement
+        global Session, ReadSession  # pylint: disable=global-statement
+        if self.read_engine is not self.engine:
+            self.read_engine.dispose()
         self.engine.dispose()
         self.engine = None
+        self.read_engine = None
         Session = None
+        ReadSession = None
 
     def _setup_run(self):
         """Log the start of the current run."""
         recorder_runs = get_model('RecorderRuns')
-        for run in query('RecorderRuns').filter_by(end=None):
+        for run in Session.query(recorder_runs).filter_by(end=None):
             run.closed_incorrect = True
             run.end = self.recording_start
             _LOGGER.warning("Ended unfinished session (id=%s from %s)",
@@ -303,39 +754,96 @@ class Recorder(threading.Thread):
 
     def _purge_old_data(self):
         """Purge events and states older than purge_days ago."""
-        from homeassistant.components.recorder.models import Events, States
-
+        for _ in self._purge_steps():
+            pass
+
+    def _purge_step(self):
+        """Run the next step of the purge in progress."""
+        try:
+            next(self._purge_task)
+        except StopIteration:
+            self._purge_task = None
+
+    def _purge_steps(self):
+        """Purge old data in chunks and yield after every transaction.
+
+        States and events are deleted PURGE_CHUNK_SIZE rows at a time, then
+        attributes no state refers to anymore. SQLite databases give the free
+        pages back to the file system PURGE_VACUUM_PAGES at a time.
+        """
         if not self.purge_days or self.purge_days < 1:
             _LOGGER.debug("purge_days set to %s, will not purge any old data.",
                           self.purge_days)
             return
 
         purge_before = dt_util.utcnow() - timedelta(days=self.purge_days)
+        stats = {'states': 0, 'events': 0, 'attributes': 0,
+                 'lock_seconds': 0.0}
+        start = time.monotonic()
+
+        for key, id_column, condition in purge_conditions(purge_before):
+            while True:
+                deleted_ids = set() if key == 'attributes' else None
+                deleted = self._purge_chunk(
+                    id_column, condition, stats, deleted_ids)
+                stats[key] += deleted
+
+                if deleted_ids:
+                    # A batch saved before the next chunk must not reuse them
+                    self._attributes_ids = {
+                        attrs_hash: attributes_id for attrs_hash, attributes_id
+                        in self._attributes_ids.items()
+                        if attributes_id not in deleted_ids}
+                yield
+
+                if deleted < PURGE_CHUNK_SIZE:
+                    break
 
-        def _purge_states(session):
-            deleted_rows = session.query(States) \
-                                  .filter((States.created < purge_before)) \
-                                  .delete(synchronize_session=False)
-            _LOGGER.debug("Deleted %s states", deleted_rows)
+        Session.expire_all()
+        yield from vacuum_steps(self.engine, stats)
 
-        if self._commit(_purge_states):
-            _LOGGER.info("Purged states created before %s", purge_before)
+        stats['seconds'] = time.monotonic() - start
+        rows = stats['states'] + stats['events'] + stats['attributes']
+        stats['rows_per_second'] = rows / stats['seconds'] \
+            if stats['seconds'] else None
+        self.last_purge = stats
 
-        def _purge_events(session):
-            deleted_rows = session.query(Events) \
-                                  .filter((Events.created < purge_before)) \
-                                  .delete(synchronize_session=False)
-            _LOGGER.debug("Deleted %s events", deleted_rows)
+        _LOGGER.info("Purged %d states, %d events and %d attributes created "
+                     "before %s in %.1f seconds, %.1f seconds holding locks",
+                     stats['states'], stats['events'], stats['attributes'],
+                     purge_before, stats['seconds'], stats['lock_seconds'])
 
-        if self._commit(_purge_events):
-            _LOGGER.info("Purged events created before %s", purge_before)
+    def _purge_chunk(self, id_column, condition, stats, deleted_ids=None):
+        """Delete up to PURGE_CHUNK_SIZE rows that match condition.
 
-        Session.expire_all()
+        Returns the number of deleted rows. The ids of the rows are added to
+        deleted_ids if it is given.
+        """
+        deleted = []
+
+        def _purge(session):
+            """Delete the rows up to the id of the last row of the chunk."""
+            del deleted[:]
+            chunk = session.query(id_column.class_).filter(condition)
+            last_id = session.query(id_column).filter(condition) \
+                             .order_by(id_column) \
+                             .offset(PURGE_CHUNK_SIZE - 1).limit(1).scalar()
+
+            if last_id is not None:
+                chunk = chunk.filter(id_column <= last_id)
+
+            if deleted_ids is not None:
+                deleted_ids.clear()
+                deleted_ids.update(row[0] for row in chunk.with_entities(
+                    id_column))
 
-        # Execute sqlite vacuum command to free up space on disk
-        if self.engine.driver == 'sqlite':
-            _LOGGER.info("Vacuuming SQLite to free space")
-            self.engine.execute("VACUUM")
+            deleted.append(chunk.delete(synchronize_session=False))
+
+        start = time.monotonic()
+        self._commit(_purge)
+        stats['lock_seconds'] += time.monotonic() - start
+
+        return deleted[0] if deleted else 0
 
     @staticmethod
     def _commit(work):
@@ -355,6 +863,64 @@ class Recorder(threading.Thread):
         return False
 
 
+def _event_from_json(line):
+    """Restore an event spilled to the journal."""
+    data = json.loads(line)
+    event_data = data['data']
+
+    if data['event_type'] == EVENT_STATE_CHANGED:
+        for key in ('old_state', 'new_state'):
+            event_data[key] = State.from_dict(event_data.get(key))
+
+    return Event(data['event_type'], event_data, EventOrigin(data['origin']),
+                 dt_util.parse_datetime(data['time_fired']))
+
+
+def migrate_schema(engine):
+    """Add the columns and indexes create_all does not add to tables."""
+    from sqlalchemy import inspect
+
+    columns = [column['name'] for column
+               in inspect(engine).get_columns('states')]
+    indexes = [index['name'] for index
+               in inspect(engine).get_indexes('states')]
+
+    if 'attributes_id' not in columns:
+        _LOGGER.warning("Adding attributes_id column to the states table")
+        engine.execute('ALTER TABLE states ADD COLUMN attributes_id INTEGER '
+                       'REFERENCES state_attributes(attributes_id)')
+        engine.execute('CREATE INDEX ix_states_attributes_id '
+                       'ON states (attributes_id)')
+
+    if 'states__entity_created' not in indexes:
+        _LOGGER.warning("Adding states__entity_created index to the states "
+                        "table, this can take a while")
+        engine.execute('CREATE INDEX states__entity_created '
+                       'ON states (entity_id, created)')
+
+
+def _setup_sqlite_connection(dbapi_connection, connection_record):
+    """Enable WAL and tune a new SQLite connection."""
+    # pylint: disable=unused-argument
+    cursor = dbapi_connection.cursor()
+    # Only has effect before the tables are created
+    cursor.execute('PRAGMA auto_vacuum=INCREMENTAL')
+    cursor.execute('PRAGMA journal_mode=WAL')
+    # Safe with WAL, a power loss can only lose the last commits
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute('PRAGMA cache_size=-{}'.format(SQLITE_CACHE_SIZE))
+    cursor.execute('PRAGMA mmap_size={}'.format(SQLITE_MMAP_SIZE))
+    cursor.close()
+
+
+def _setup_sqlite_read_connection(dbapi_connection, connection_record):
+    """Tune a new SQLite connection and refuse writes on it."""
+    _setup_sqlite_connection(dbapi_connection, connection_record)
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA query_only=ON')
+    cursor.close()
+
+
 def _verify_instance() -> None:
     """Throw error if recorder not initialized."""
     if _INSTANCE is None:
@@ -1,14 +1,17 @@
 """Models for SQLAlchemy."""
 
+import hashlib
 import json
 from datetime import datetime
 import logging
 
-from sqlalchemy import (Boolean, Column, DateTime, ForeignKey, Index, Integer,
-                        String, Text, distinct)
+from sqlalchemy import (Boolean, Column, DateTime, Float, ForeignKey, Index,
+                        Integer, String, Text, distinct)
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import relationship
 
 import homeassistant.util.dt as dt_util
+from homeassistant.const import EVENT_STATE_CHANGED
 from homeassistant.core import Event, EventOrigin, State, split_entity_id
 from homeassistant.remote import JSONEncoder
 
@@ -31,20 +34,45 @@ class Events(Base):  # type: ignore
     time_fired = Column(DateTime(timezone=True))
     created = Column(DateTime(timezone=True), default=datetime.utcnow)
 
+    # The state written for a state_changed event
+    states = relationship('States', lazy='joined')
+
     @staticmethod
     def from_event(event):
-        """Create an event database object from a native event."""
+        """Create an event database object from a native event.
+
+        The states of a state_changed event are not stored with the event,
+        the new state is in the states row that references the event. The
+        old state is not recorded.
+        """
+        if event.event_type == EVENT_STATE_CHANGED:
+            data = {'entity_id': event.data['entity_id']}
+        else:
+            data = event.data
+
         return Events(event_type=event.event_type,
-                      event_data=json.dumps(event.data, cls=JSONEncoder),
+                      event_data=json.dumps(data, cls=JSONEncoder),
                       origin=str(event.origin),
                       time_fired=event.time_fired)
 
     def to_native(self):
-        """Convert to a natve HA Event."""
+        """Convert to a natve HA Event.
+
+        The new state of a state_changed event is rebuilt from its states
+        row. Recorded state_changed events do not have an old_state.
+        """
         try:
+            data = json.loads(self.event_data)
+
+            if self.event_type == EVENT_STATE_CHANGED and \
+               'new_state' not in data and self.states:
+                new_state = self.states[0].to_native()
+                data['new_state'] = \
+                    new_state.as_dict() if new_state.state else None
+
             return Event(
                 self.event_type,
-                json.loads(self.event_data),
+                data,
                 EventOrigin(self.origin),
                 _process_timestamp(self.time_fired)
             )
@@ -54,9 +82,55 @@ class Events(Base):  # type: ignore
             return None
 
 
+class StateAttributes(Base):   # type: ignore
+    # pylint: disable=too-few-public-methods
+    """State attributes shared by the states that have them."""
+
+    __tablename__ = 'state_attributes'
+    attributes_id = Column(Integer, primary_key=True)
+    hash = Column(String(40), unique=True)
+    shared_attrs = Column(Text)
+
+    @staticmethod
+    def hash_shared_attrs(shared_attrs):
+        """Return the hash that identifies serialized attributes."""
+        return hashlib.sha1(shared_attrs.encode('utf-8')).hexdigest()
+
+
+def get_attributes_id(session, shared_attrs, cache):
+    """Return the id of the row that holds shared_attrs.
+
+    The row is added if it does not exist yet. Cache maps hashes to ids and
+    is updated with the rows found or added.
+    """
+    attrs_hash = StateAttributes.hash_shared_attrs(shared_attrs)
+    attributes_id = cache.get(attrs_hash)
+
+    if attributes_id is None:
+        row = session.query(StateAttributes.attributes_id).filter_by(
+            hash=attrs_hash).first()
+
+        if row is None:
+            dbattrs = StateAttributes(hash=attrs_hash,
+                                      shared_attrs=shared_attrs)
+            session.add(dbattrs)
+            session.flush()
+            attributes_id = dbattrs.attributes_id
+        else:
+            attributes_id = row[0]
+
+        cache[attrs_hash] = attributes_id
+
+    return attributes_id
+
+
 class States(Base):   # type: ignore
     # pylint: disable=too-few-public-methods
-    """State change history."""
+    """State change history.
+
+    Attributes are stored in state_attributes, rows written before that
+    table existed have them in the attributes column.
+    """
 
     __tablename__ = 'states'
     state_id = Column(Integer, primary_key=True)
@@ -64,6 +138,9 @@ class States(Base):   # type: ignore
     entity_id = Column(String(255))
     state = Column(String(255))
     attributes = Column(Text)
+    attributes_id = Column(Integer,
+                           ForeignKey('state_attributes.attributes_id'),
+                           index=True)
     event_id = Column(Integer, ForeignKey('events.event_id'))
     last_changed = Column(DateTime(timezone=True), default=datetime.utcnow)
     last_updated = Column(DateTime(timezone=True), default=datetime.utcnow)
@@ -72,7 +149,11 @@ class States(Base):   # type: ignore
     __table_args__ = (Index('states__state_changes',
                             'last_changed', 'last_updated', 'entity_id'),
                       Index('states__significant_changes',
-                            'domain', 'last_updated', 'entity_id'), )
+                            'domain', 'last_updated', 'entity_id'),
+                      Index('states__entity_created',
+                            'entity_id', 'created'), )
+
+    state_attributes = relationship(StateAttributes, lazy='joined')
 
     @staticmethod
     def from_event(event):
@@ -99,21 +180,98 @@ class States(Base):   # type: ignore
 
         return dbstate
 
+    def attributes_json(self):
+        """Return the attributes as the JSON they are stored in."""
+        if self.state_attributes is not None:
+            return self.state_attributes.shared_attrs
+        return self.attributes or '{}'
+
+    def to_json(self):
+        """Convert to the JSON of an HA state object.
+
+        The attributes are written as stored instead of being decoded and
+        encoded again.
+        """
+        return (
+            '{{"attributes": {}, "entity_id": {}, "last_changed": {}, '
+            '"last_updated": {}, "state": {}}}').format(
+                self.attributes_json(), json.dumps(self.entity_id),
+                json.dumps(_process_timestamp(self.last_changed).isoformat()),
+                json.dumps(_process_timestamp(self.last_updated).isoformat()),
+                json.dumps(self.state))
+
     def to_native(self):
         """Convert to an HA state object."""
         try:
             return State(
                 self.entity_id, self.state,
-                json.loads(self.attributes),
+                json.loads(self.attributes_json()),
                 _process_timestamp(self.last_changed),
                 _process_timestamp(self.last_updated)
             )
-        except ValueError:
+        except (TypeError, ValueError):
             # When json.loads fails
             _LOGGER.exception("Error converting row to state: %s", self)
             return None
 
 
+class Statistics(Base):   # type: ignore
+    # pylint: disable=too-few-public-methods
+    """Rollup of the numeric states of an entity during a period.
+
+    Rollups are not purged with the states they were computed from.
+    """
+
+    __tablename__ = 'statistics'
+    statistic_id = Column(Integer, primary_key=True)
+    entity_id = Column(String(255))
+    period = Column(Integer)
+    start = Column(DateTime(timezone=True))
+    count = Column(Integer)
+    min = Column(Float)
+    max = Column(Float)
+    mean = Column(Float)
+    last = Column(Float)
+
+    __table_args__ = (Index('statistics__entity_period_start',
+                            'entity_id', 'period', 'start', unique=True), )
+
+    def to_native(self):
+        """Return the rollup as a dict."""
+        return {
+            'entity_id': self.entity_id,
+            'period': self.period,
+            'start': _process_timestamp(self.start),
+            'count': self.count,
+            'min': self.min,
+            'max': self.max,
+            'mean': self.mean,
+            'last': self.last,
+        }
+
+
+def save_statistic(session, entity_id, period, rollup):
+    """Add a rollup to the session or merge it into the stored one.
+
+    Rollup is a tuple of start, count, total, min, max and last value.
+    """
+    start, count, total, minimum, maximum, last = rollup
+    row = session.query(Statistics).filter_by(
+        entity_id=entity_id, period=period, start=start).first()
+
+    if row is None:
+        session.add(Statistics(
+            entity_id=entity_id, period=period, start=start, count=count,
+            min=minimum, max=maximum, mean=total / count, last=last))
+        return
+
+    row.mean = (row.mean * row.count + total) / (row.count + count)
+    row.count += count
+    row.min = min(row.min, minimum)
+    row.max = max(row.max, maximum)
+    row.last = last
+
+
 class RecorderRuns(Base):   # type: ignore
     # pylint: disable=too-few-public-methods
     """Representation of recorder run."""
@@ -132,6 +290,13 @@ class RecorderRuns(Base):   # type: ignore
         in time inside the run.
         """
         from sqlalchemy.orm.session import Session
+        from homeassistant.components.recorder import recorded_entity_ids
+
+        if point_in_time is None:
+            # The recorder knows the entities of the run in progress
+            entity_ids = recorded_entity_ids(self)
+            if entity_ids is not None:
+                return entity_ids
 
         session = Session.object_session(self)
 
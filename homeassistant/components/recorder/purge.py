@@ -0,0 +1,49 @@
+"""Helpers the recorder uses to purge old data."""
+import time
+
+# SQLite pages freed per step of a purge
+PURGE_VACUUM_PAGES = 1000
+
+
+def purge_conditions(purge_before):
+    """Return what to purge in order as statistic, id column and condition.
+
+    Attributes are purged last, once no state refers to them anymore.
+    """
+    from homeassistant.components.recorder.models import (
+        Events, States, StateAttributes)
+    from sqlalchemy import select
+
+    unused_attributes = ~StateAttributes.attributes_id.in_(
+        select([States.attributes_id]).where(
+            States.attributes_id.isnot(None)))
+
+    return (
+        ('states', States.state_id, States.created < purge_before),
+        ('events', Events.event_id, Events.created < purge_before),
+        ('attributes', StateAttributes.attributes_id, unused_attributes))
+
+
+def vacuum_steps(engine, stats):
+    """Free SQLite pages and yield after every step.
+
+    Without auto_vacuum=INCREMENTAL the free pages are only reused. The time
+    spent is added to the lock_seconds of stats.
+    """
+    if engine.dialect.name != 'sqlite' or \
+       engine.execute('PRAGMA auto_vacuum').scalar() != 2:
+        return
+
+    free_pages = engine.execute('PRAGMA freelist_count').scalar()
+
+    while free_pages > 0:
+        start = time.monotonic()
+        engine.execute('PRAGMA incremental_vacuum({})'.format(
+            PURGE_VACUUM_PAGES))
+        stats['lock_seconds'] += time.monotonic() - start
+        yield
+
+        last_free_pages, free_pages = free_pages, engine.execute(
+            'PRAGMA freelist_count').scalar()
+        if free_pages >= last_free_pages:
+            break
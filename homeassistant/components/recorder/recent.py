@@ -0,0 +1,74 @@
+"""Recent states the recorder keeps in memory after writing them."""
+from collections import OrderedDict, deque
+import threading
+from typing import Any, List
+
+from homeassistant.const import EVENT_STATE_CHANGED
+from homeassistant.core import State
+
+
+class RecentStates(object):
+    """The latest committed states of the latest changed entities.
+
+    Holds up to depth states of up to max_entities entities, the entity
+    used least recently is forgotten first. It also knows every entity
+    recorded since the recorder started.
+    """
+
+    def __init__(self, depth: int, max_entities: int) -> None:
+        """Initialize the recent states."""
+        self.depth = depth
+        self.max_entities = max_entities
+        self._states = OrderedDict()
+        self._entity_ids = set()  # type: Any
+        self._lock = threading.Lock()
+
+    def add(self, events: List[Any], recording_start: Any) -> None:
+        """Add the states of committed state_changed events."""
+        with self._lock:
+            for event in events:
+                if event.event_type != EVENT_STATE_CHANGED:
+                    continue
+
+                entity_id = event.data['entity_id']
+                state = event.data.get('new_state')
+
+                # Like the states of the run in the database
+                if (event.time_fired if state is None
+                        else state.last_updated) >= recording_start:
+                    self._entity_ids.add(entity_id)
+
+                if state is None or not self.depth:
+                    # The removal is only recorded in the database
+                    self._states.pop(entity_id, None)
+                    continue
+
+                states = self._states.get(entity_id)
+                if states is None:
+                    states = self._states[entity_id] = deque(
+                        maxlen=self.depth)
+                else:
+                    self._states.move_to_end(entity_id)
+                states.append(state)
+
+            while len(self._states) > self.max_entities:
+                self._states.popitem(last=False)
+
+    def get(self, entity_id: str) -> List[State]:
+        """Return the recent states of an entity, oldest first."""
+        with self._lock:
+            states = self._states.get(entity_id)
+            if states is None:
+                return []
+            self._states.move_to_end(entity_id)
+            return list(states)
+
+    def clear(self) -> None:
+        """Forget the recent states."""
+        with self._lock:
+            self._states.clear()
+
+    def entity_ids(self) -> List[str]:
+        """Return the entities recorded since the recorder started."""
+        with self._lock:
+            return list(self._entity_ids)
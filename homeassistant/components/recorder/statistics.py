@@ -0,0 +1,82 @@
+"""Rollups of numeric states that the recorder keeps per period."""
+from datetime import timedelta
+import math
+
+from homeassistant.const import EVENT_STATE_CHANGED
+import homeassistant.util.dt as dt_util
+
+# Periods in seconds numeric states are rolled up in, 5 minutes and an hour
+STATISTICS_PERIODS = (300, 3600)
+
+
+def save_statistics(session, events, committed, rollups):
+    """Roll up the numeric states and add the periods that ended.
+
+    Committed holds the rollups of the periods in progress by entity and
+    period. Rollups starts as a copy of it and holds them after the batch,
+    so a retried transaction starts over.
+    """
+    from homeassistant.components.recorder.models import save_statistic
+
+    rollups.clear()
+    rollups.update(committed)
+
+    for event in events:
+        state = event.data.get('new_state') \
+            if event.event_type == EVENT_STATE_CHANGED else None
+
+        try:
+            value = float(state.state)
+        except (AttributeError, ValueError):
+            continue
+
+        if not math.isfinite(value):
+            continue
+
+        for period, rollup in add_to_rollups(rollups, state, value):
+            save_statistic(session, state.entity_id, period, rollup)
+
+    now = dt_util.utcnow()
+    for key, rollup in list(rollups.items()):
+        entity_id, period = key
+        if rollup[0] + timedelta(seconds=period) <= now:
+            save_statistic(session, entity_id, period, rollup)
+            del rollups[key]
+
+
+def save_open_statistics(session, rollups):
+    """Add the rollups of the periods in progress.
+
+    They are merged with the rest of the period after a restart.
+    """
+    from homeassistant.components.recorder.models import save_statistic
+
+    for (entity_id, period), rollup in rollups.items():
+        save_statistic(session, entity_id, period, rollup)
+
+
+def add_to_rollups(rollups, state, value):
+    """Add the value of a state to the rollups of its periods.
+
+    Returns the period and rollup of the periods that the state ended.
+    """
+    timestamp = int(dt_util.as_timestamp(state.last_updated))
+    ended = []
+
+    for period in STATISTICS_PERIODS:
+        key = (state.entity_id, period)
+        start = dt_util.utc_from_timestamp(timestamp - timestamp % period)
+        rollup = rollups.get(key)
+
+        if rollup is not None and rollup[0] != start:
+            ended.append((period, rollup))
+            rollup = None
+
+        if rollup is None:
+            rollups[key] = (start, 1, value, value, value, value)
+        else:
+            _, count, total, minimum, maximum, _ = rollup
+            rollups[key] = (start, count + 1, total + value,
+                            min(minimum, value), max(maximum, value), value)
+
+    return ended
@@ -268,9 +268,9 @@ class GoogleTravelTimeSensor(Entity):
         return "%s,%s" % (attr.get(ATTR_LATITUDE), attr.get(ATTR_LONGITUDE))
 
     def _resolve_zone(self, friendly_name):
-        entities = self._hass.states.all()
+        entities = self._hass.states.all('zone')
         for entity in entities:
-            if entity.domain == 'zone' and entity.name == friendly_name:
+            if entity.name == friendly_name:
                 return self._get_location_from_attributes(entity)
 
         return friendly_name
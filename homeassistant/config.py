@@ -13,7 +13,7 @@ from homeassistant.const import (
     CONF_LATITUDE, CONF_LONGITUDE, CONF_NAME, CONF_UNIT_SYSTEM,
     CONF_TIME_ZONE, CONF_CUSTOMIZE, CONF_ELEVATION, CONF_UNIT_SYSTEM_METRIC,
     CONF_UNIT_SYSTEM_IMPERIAL, CONF_TEMPERATURE_UNIT, TEMP_CELSIUS,
-    __version__)
+    CONF_COALESCE, __version__)
 from homeassistant.core import valid_entity_id
 from homeassistant.exceptions import HomeAssistantError
 from homeassistant.util.yaml import load_yaml
@@ -102,6 +102,9 @@ CORE_CONFIG_SCHEMA = vol.Schema({
     CONF_TIME_ZONE: cv.time_zone,
     vol.Required(CONF_CUSTOMIZE,
                  default=MappingProxyType({})): _valid_customize,
+    vol.Optional(CONF_COALESCE, default={}): {
+        vol.Any(cv.entity_id, cv.slug): cv.time_period,
+    },
 })
 
 
@@ -225,9 +228,17 @@ def process_ha_config_upgrade(hass):
         outp.write(__version__)
 
 
+def _set_entity_options(hass, config):
+    """Set the customize and coalesce options of the core config."""
+    set_customize(config.get(CONF_CUSTOMIZE) or {})
+
+    for key, window in config[CONF_COALESCE].items():
+        hass.states.coalesce(key, window.total_seconds())
+
+
 def process_ha_core_config(hass, config):
     """Process the [homeassistant] section from the config."""
-    # pylint: disable=too-many-branches
+    # pylint: disable=too-many-branches, too-many-statements
     config = CORE_CONFIG_SCHEMA(config)
     hac = hass.config
 
@@ -254,7 +265,7 @@ def process_ha_core_config(hass, config):
     if CONF_TIME_ZONE in config:
         set_time_zone(config.get(CONF_TIME_ZONE))
 
-    set_customize(config.get(CONF_CUSTOMIZE) or {})
+    _set_entity_options(hass, config)
 
     if CONF_UNIT_SYSTEM in config:
         if config[CONF_UNIT_SYSTEM] == CONF_UNIT_SYSTEM_IMPERIAL:
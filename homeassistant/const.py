@@ -62,6 +62,7 @@ CONF_BEFORE = 'before'
 CONF_BELOW = 'below'
 CONF_BLACKLIST = 'blacklist'
 CONF_BRIGHTNESS = 'brightness'
+CONF_COALESCE = 'coalesce'
 CONF_CODE = 'code'
 CONF_COLOR_TEMP = 'color_temp'
 CONF_COMMAND = 'command'
@@ -334,6 +335,8 @@ URL_API_COMPONENTS = '/api/components'
 URL_API_ERROR_LOG = '/api/error_log'
 URL_API_LOG_OUT = '/api/log_out'
 URL_API_TEMPLATE = '/api/template'
+URL_API_WORKER_POOL = '/api/worker_pool'
+URL_API_RECORDER_QUEUE = '/api/recorder/queue'
 
 HTTP_OK = 200
 HTTP_CREATED = 201
@@ -6,9 +6,13 @@ of entities and react to changes.
 """
 # pylint: disable=unused-import, too-many-lines
 import asyncio
+from collections import deque
 from concurrent.futures import ThreadPoolExecutor
 import enum
 import functools as ft
+import heapq
+import itertools
+import json
 import logging
 import os
 import re
@@ -16,6 +20,7 @@ import signal
 import sys
 import threading
 import time
+import uuid
 
 from types import MappingProxyType
 
@@ -59,12 +64,20 @@ SERVICE_CALL_LIMIT = 10  # seconds
 # will be added for each component that polls devices.
 MIN_WORKER_THREAD = 2
 
+# Number of worker threads the pool may grow to when jobs are backing up.
+MAX_WORKER_THREAD = 20
+
 # Pattern for validating entity IDs (format: <domain>.<entity>)
 ENTITY_ID_PATTERN = re.compile(r"^(\w+)\.(\w+)$")
 
 # Interval at which we check if the pool is getting busy
 MONITOR_POOL_INTERVAL = 30
 
+# How a listener on the event bus is invoked
+_LISTENER_CALLBACK = 0
+_LISTENER_COROUTINE = 1
+_LISTENER_THREADED = 2
+
 _LOGGER = logging.getLogger(__name__)
 
 
@@ -90,6 +103,27 @@ def is_callback(func: Callable[..., Any]) -> bool:
     return '_hass_callback' in func.__dict__
 
 
+def _listener_type(listener: Callable[..., Any]) -> int:
+    """Return how a bus listener has to be invoked."""
+    if asyncio.iscoroutinefunction(listener):
+        return _LISTENER_COROUTINE
+    elif is_callback(listener):
+        return _LISTENER_CALLBACK
+    return _LISTENER_THREADED
+
+
+def _async_run_callbacks(callbacks, event):
+    """Run the callback listeners of an event.
+
+    This method must be run in the event loop.
+    """
+    for func in callbacks:
+        try:
+            func(event)
+        except Exception:  # pylint: disable=broad-except
+            _LOGGER.exception("Error in listener %s for %s", func, event)
+
+
 class CoreState(enum.Enum):
     """Represent the current state of Home Assistant."""
 
@@ -137,10 +171,13 @@ class HomeAssistant(object):
         self.executor = ThreadPoolExecutor(max_workers=5)
         self.loop.set_default_executor(self.executor)
         self.loop.set_exception_handler(self._async_exception_handler)
-        self.pool = pool = create_worker_pool()
-        self.bus = EventBus(pool, self.loop)
-        self.services = ServiceRegistry(self.bus, self.add_job, self.loop)
-        self.states = StateMachine(self.bus, self.loop)
+        self.pending = util.PendingWork()
+        self.pool = pool = create_worker_pool(pending=self.pending)
+        self.bus = EventBus(pool, self.loop, self.pending)
+        self.services = ServiceRegistry(
+            self.bus, self.add_job, self.loop, self.pending)
+        self.states = StateMachine(self.bus, self.loop, self.pending)
+        self.scheduler = Scheduler(self.bus, self.loop)
         self.config = Config()  # type: Config
         self.state = CoreState.not_running
         self.exit_code = None
@@ -234,16 +271,38 @@ class HomeAssistant(object):
     def async_add_job(self, target: Callable[..., None], *args: Any):
         """Add a job from within the eventloop.
 
-        target: target to call.
+        target: target to call or coroutine object to schedule.
         args: parameters for method to call.
+
+        Returns the task if a coroutine was scheduled.
+
+        This method must be run in the event loop.
         """
-        if is_callback(target):
-            self.loop.call_soon(target, *args)
+        task = None
+
+        if asyncio.iscoroutine(target):
+            task = self.loop.create_task(target)
+        elif is_callback(target):
+            self.pending.add()
+            self.loop.call_soon(self.pending.run, target, *args)
         elif asyncio.iscoroutinefunction(target):
-            self.loop.create_task(target(*args))
+            task = self.loop.create_task(target(*args))
         else:
             self.add_job(target, *args)
 
+        if task is not None:
+            self.async_track_task(task)
+
+        return task
+
+    def async_track_task(self, task):
+        """Count a task as pending work until it is done.
+
+        This method must be run in the event loop.
+        """
+        self.pending.add()
+        task.add_done_callback(lambda _: self.pending.done())
+
     def async_run_job(self, target: Callable[..., None], *args: Any):
         """Run a job from within the event loop.
 
@@ -255,51 +314,39 @@ class HomeAssistant(object):
         else:
             self.async_add_job(target, *args)
 
-    def _loop_empty(self):
-        """Python 3.4.2 empty loop compatibility function."""
-        # pylint: disable=protected-access
-        if sys.version_info < (3, 4, 3):
-            return len(self.loop._scheduled) == 0 and \
-                   len(self.loop._ready) == 0
-        else:
-            return self.loop._current_handle is None and \
-                   len(self.loop._ready) == 0
-
     def block_till_done(self):
         """Block till all pending work is done."""
-        complete = threading.Event()
+        run_coroutine_threadsafe(
+            self.async_block_till_done(), self.loop).result()
 
-        @asyncio.coroutine
-        def sleep_wait():
-            """Sleep in thread pool."""
-            yield from self.loop.run_in_executor(None, time.sleep, 0)
-
-        def notify_when_done():
-            """Notify event loop when pool done."""
-            count = 0
-            while True:
-                # Wait for the work queue to empty
-                self.pool.block_till_done()
-
-                # Verify the loop is empty
-                if self._loop_empty():
-                    count += 1
-
-                if count == 2:
-                    break
+    @asyncio.coroutine
+    def async_block_till_done(self):
+        """Block till all pending work is done.
 
-                # sleep in the loop executor, this forces execution back into
-                # the event loop to avoid the block thread from starving the
-                # async loop
-                run_coroutine_threadsafe(
-                    sleep_wait(),
-                    self.loop
-                ).result()
+        Pending work are the jobs in the worker pool, events handed to the
+        loop with fire and the callbacks and tasks scheduled by the event bus
+        and async_add_job.
 
-            complete.set()
+        This method is a coroutine.
+        """
+        while True:
+            # Give callbacks scheduled before us the chance to add work
+            yield from asyncio.sleep(0, loop=self.loop)
+
+            if not self.pending.count:
+                return
+
+            idle = asyncio.Future(loop=self.loop)
 
-        threading.Thread(name="BlockThread", target=notify_when_done).start()
-        complete.wait()
+            def set_idle():
+                """Resolve the idle future."""
+                if not idle.done():
+                    idle.set_result(None)
+
+            self.pending.notify_idle(
+                lambda: self.loop.call_soon_threadsafe(set_idle))
+
+            yield from idle
 
     def stop(self) -> None:
         """Stop Home Assistant and shuts down all threads."""
@@ -397,11 +444,19 @@ class EventBus(object):
     """Allows firing of and listening for events."""
 
     def __init__(self, pool: util.ThreadPool,
-                 loop: asyncio.AbstractEventLoop) -> None:
+                 loop: asyncio.AbstractEventLoop,
+                 pending: util.PendingWork=None) -> None:
         """Initialize a new event bus."""
+        # Per event type a tuple of (listener, listener type) pairs. The
+        # tuples are replaced, never mutated, so async_fire can iterate them
+        # while listeners are being added or removed.
         self._listeners = {}
+        # Per event type the MATCH_ALL listeners followed by the listeners
+        # of the event type, built on first fire and dropped on change.
+        self._dispatch = {}
         self._pool = pool
         self._loop = loop
+        self._pending = pending or util.PendingWork()
 
     def async_listeners(self):
         """Dict with events and the number of listeners.
@@ -423,8 +478,10 @@ class EventBus(object):
         if not self._pool.running:
             raise HomeAssistantError('Home Assistant has shut down.')
 
-        self._loop.call_soon_threadsafe(self.async_fire, event_type,
-                                        event_data, origin)
+        self._pending.add()
+        self._loop.call_soon_threadsafe(
+            self._pending.run, self.async_fire, event_type, event_data,
+            origin)
 
     def async_fire(self, event_type: str, event_data=None,
                    origin=EventOrigin.local, wait=False):
@@ -432,11 +489,10 @@ class EventBus(object):
 
         This method must be run in the event loop.
         """
-        # Copy the list of the current listeners because some listeners
-        # remove themselves as a listener while being executed which
-        # causes the iterator to be confused.
-        get = self._listeners.get
-        listeners = get(MATCH_ALL, []) + get(event_type, [])
+        listeners = self._dispatch.get(event_type)
+
+        if listeners is None:
+            listeners = self._async_build_dispatch(event_type)
 
         event = Event(event_type, event_data, origin)
 
@@ -448,19 +504,38 @@ class EventBus(object):
 
         job_priority = JobPriority.from_event_type(event_type)
 
+        callbacks = []
         sync_jobs = []
-        for func in listeners:
-            if asyncio.iscoroutinefunction(func):
-                self._loop.create_task(func(event))
-            elif is_callback(func):
-                self._loop.call_soon(func, event)
+        for func, listener_type in listeners:
+            if listener_type == _LISTENER_CALLBACK:
+                callbacks.append(func)
+            elif listener_type == _LISTENER_COROUTINE:
+                task = self._loop.create_task(func(event))
+                self._pending.add()
+                task.add_done_callback(lambda _: self._pending.done())
             else:
                 sync_jobs.append((job_priority, (func, event)))
 
+        # Run all the callbacks in a single handle
+        if callbacks:
+            self._pending.add()
+            self._loop.call_soon(
+                self._pending.run, _async_run_callbacks, callbacks, event)
+
         # Send all the sync jobs at once
         if sync_jobs:
             self._pool.add_many_jobs(sync_jobs)
 
+    def _async_build_dispatch(self, event_type):
+        """Build and store the listeners to call for an event type.
+
+        This method must be run in the event loop.
+        """
+        get = self._listeners.get
+        listeners = get(MATCH_ALL, ()) + get(event_type, ())
+        self._dispatch[event_type] = listeners
+        return listeners
+
     def listen(self, event_type, listener):
         """Listen for all events or events of a specific type.
 
@@ -485,10 +560,9 @@ class EventBus(object):
 
         This method must be run in the event loop.
         """
-        if event_type in self._listeners:
-            self._listeners[event_type].append(listener)
-        else:
-            self._listeners[event_type] = [listener]
+        self._listeners[event_type] = self._listeners.get(event_type, ()) + \
+            ((listener, _listener_type(listener)),)
+        self._async_invalidate_dispatch(event_type)
 
         def remove_listener():
             """Remove the listener."""
@@ -578,31 +652,56 @@ class EventBus(object):
 
         This method must be run in the event loop.
         """
-        try:
-            self._listeners[event_type].remove(listener)
-
-            # delete event_type list if empty
-            if not self._listeners[event_type]:
-                self._listeners.pop(event_type)
-        except (KeyError, ValueError):
-            # KeyError is key event_type listener did not exist
-            # ValueError if listener did not exist within event_type
+        listeners = self._listeners.get(event_type, ())
+
+        for index, (func, _) in enumerate(listeners):
+            if func == listener:
+                listeners = listeners[:index] + listeners[index + 1:]
+                break
+        else:
+            # Either event_type or the listener within it did not exist
             _LOGGER.warning('Unable to remove unknown listener %s',
                             listener)
+            return
+
+        # delete event_type tuple if empty
+        if listeners:
+            self._listeners[event_type] = listeners
+        else:
+            self._listeners.pop(event_type)
+
+        self._async_invalidate_dispatch(event_type)
+
+    def _async_invalidate_dispatch(self, event_type):
+        """Drop the dispatch tables affected by a listener change.
+
+        This method must be run in the event loop.
+        """
+        if event_type == MATCH_ALL:
+            self._dispatch.clear()
+        else:
+            self._dispatch.pop(event_type, None)
 
 
 class State(object):
     """Object to represent a state within the state machine.
 
     entity_id: the entity that is represented.
+    domain: the domain of the entity.
+    object_id: the object id of the entity.
     state: the state of the entity
     attributes: extra information on entity and state
     last_changed: last time the state was changed, not the attributes.
     last_updated: last time this object was updated.
+
+    States are immutable. Attribute mappings are shared between states when
+    passed in as a MappingProxyType and the dict and JSON representations
+    are built once, on first use.
     """
 
-    __slots__ = ['entity_id', 'state', 'attributes',
-                 'last_changed', 'last_updated']
+    # pylint: disable=too-many-instance-attributes
+    __slots__ = ['entity_id', 'domain', 'object_id', 'state', 'attributes',
+                 'last_changed', 'last_updated', '_as_dict', '_as_json']
 
     # pylint: disable=too-many-arguments
     def __init__(self, entity_id, state, attributes=None, last_changed=None,
@@ -614,21 +713,19 @@ class State(object):
                 "Format should be <domain>.<object_id>").format(entity_id))
 
         self.entity_id = entity_id.lower()
+        self.domain, self.object_id = split_entity_id(self.entity_id)
         self.state = str(state)
-        self.attributes = MappingProxyType(attributes or {})
-        self.last_updated = last_updated or dt_util.utcnow()
 
-        self.last_changed = last_changed or self.last_updated
+        if isinstance(attributes, MappingProxyType):
+            self.attributes = attributes
+        else:
+            self.attributes = MappingProxyType(dict(attributes or {}))
 
-    @property
-    def domain(self):
-        """Domain of this state."""
-        return split_entity_id(self.entity_id)[0]
+        self.last_updated = last_updated or dt_util.utcnow()
 
-    @property
-    def object_id(self):
-        """Object id of this state."""
-        return split_entity_id(self.entity_id)[1]
+        self.last_changed = last_changed or self.last_updated
+        self._as_dict = None
+        self._as_json = None
 
     @property
     def name(self):
@@ -640,14 +737,32 @@ class State(object):
     def as_dict(self):
         """Return a dict representation of the State.
 
-        To be used for JSON serialization.
+        To be used for JSON serialization. The dict is cached and shared
+        between callers, it should not be modified.
         Ensures: state == State.from_dict(state.as_dict())
         """
-        return {'entity_id': self.entity_id,
-                'state': self.state,
-                'attributes': dict(self.attributes),
-                'last_changed': self.last_changed,
-                'last_updated': self.last_updated}
+        if self._as_dict is None:
+            self._as_dict = {'entity_id': self.entity_id,
+                             'state': self.state,
+                             'attributes': dict(self.attributes),
+                             'last_changed': self.last_changed,
+                             'last_updated': self.last_updated}
+
+        return self._as_dict
+
+    def as_json(self):
+        """Return the JSON representation of the State.
+
+        The JSON is cached, so a state is serialized at most once.
+        """
+        if self._as_json is None:
+            # pylint: disable=cyclic-import
+            from homeassistant.remote import JSONEncoder
+
+            self._as_json = json.dumps(
+                self.as_dict(), sort_keys=True, cls=JSONEncoder)
+
+        return self._as_json
 
     @classmethod
     def from_dict(cls, json_dict):
@@ -689,14 +804,53 @@ class State(object):
             dt_util.as_local(self.last_changed).isoformat())
 
 
+def _attributes_delta(old, new):
+    """Return the attributes that differ between two attribute mappings.
+
+    Added and changed attributes map to their new value, removed attributes
+    map to None.
+    """
+    delta = {}
+    kept = 0
+
+    for key, value in new.items():
+        if key in old:
+            kept += 1
+
+            if old[key] == value:
+                continue
+
+        delta[key] = value
+
+    if kept != len(old):
+        for key in old:
+            if key not in new:
+                delta[key] = None
+
+    return delta
+
+
 class StateMachine(object):
     """Helper class that tracks the state of different entities."""
 
-    def __init__(self, bus, loop):
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, bus, loop, pending=None):
         """Initialize state machine."""
         self._states = {}
+        # Per domain a dict with the states of the entities in the domain.
+        self._domains = {}
         self._bus = bus
         self._loop = loop
+        self._pending = pending or util.PendingWork()
+        # Per entity id (or MATCH_ALL) a tuple of state_changed listeners.
+        # Tuples are replaced on change so dispatch can iterate them safely.
+        self._entity_listeners = {}
+        self._unsub_dispatcher = None
+        # Per entity id or domain the coalescing window in seconds. The dict
+        # is replaced on change so it can be configured from any thread.
+        self._coalesce = {}
+        # Per entity id with an open window the (old state, timer handle).
+        self._coalesced = {}
 
     def entity_ids(self, domain_filter=None):
         """List of entity ids that are being tracked."""
@@ -706,25 +860,66 @@ class StateMachine(object):
         return future.result()
 
     def async_entity_ids(self, domain_filter=None):
-        """List of entity ids that are being tracked."""
+        """List of entity ids that are being tracked.
+
+        This method must be run in the event loop.
+        """
         if domain_filter is None:
             return list(self._states.keys())
 
-        domain_filter = domain_filter.lower()
+        return list(self._domains.get(domain_filter.lower(), ()))
+
+    def coalesce(self, entity_id_or_domain, window):
+        """Coalesce the state_changed events of an entity or a domain.
+
+        The first state change of an entity opens a window of window seconds.
+        Further changes inside the window are collapsed, when it closes a
+        single state_changed event from the state before the window to the
+        latest state is fired. Setting a state with force_update closes the
+        window right away. Entity settings take precedence over domain
+        settings, so a window of 0 excludes an entity of a coalesced domain.
+        A window of None removes the setting again.
+
+        Async friendly.
+        """
+        windows = dict(self._coalesce)
+
+        if window is None:
+            windows.pop(entity_id_or_domain.lower(), None)
+        else:
+            windows[entity_id_or_domain.lower()] = window
+
+        self._coalesce = windows
 
-        return [state.entity_id for state in self._states.values()
-                if state.domain == domain_filter]
+    def async_entity_listeners(self):
+        """Dict with entity ids and the number of state_changed listeners.
+
+        This method must be run in the event loop.
+        """
+        return {key: len(self._entity_listeners[key])
+                for key in self._entity_listeners}
+
+    @property
+    def entity_listeners(self):
+        """Dict with entity ids and the number of state_changed listeners."""
+        return run_callback_threadsafe(
+            self._loop, self.async_entity_listeners
+        ).result()
 
-    def all(self):
-        """Create a list of all states."""
-        return run_callback_threadsafe(self._loop, self.async_all).result()
+    def all(self, domain_filter=None):
+        """Create a list of all states, optionally of a single domain."""
+        return run_callback_threadsafe(
+            self._loop, self.async_all, domain_filter).result()
 
-    def async_all(self):
-        """Create a list of all states.
+    def async_all(self, domain_filter=None):
+        """Create a list of all states, optionally of a single domain.
 
         This method must be run in the event loop.
         """
-        return list(self._states.values())
+        if domain_filter is None:
+            return list(self._states.values())
+
+        return list(self._domains.get(domain_filter.lower(), {}).values())
 
     def get(self, entity_id):
         """Retrieve state of entity_id or None if not found.
@@ -768,13 +963,16 @@ class StateMachine(object):
         """
         entity_id = entity_id.lower()
 
-        old_state = self._states.pop(entity_id, None)
+        if entity_id in self._coalesced:
+            self._async_close_window(entity_id)
+
+        old_state = self._async_pop_state(entity_id)
 
         if old_state is None:
             return False
 
         event_data = {
-            'entity_id': entity_id,
+            'entity_id': old_state.entity_id,
             'old_state': old_state,
             'new_state': None,
         }
@@ -805,6 +1003,10 @@ class StateMachine(object):
         If you just update the attributes and not the state, last changed will
         not be affected.
 
+        The state_changed event carries the attributes that were added or
+        changed in changed_attributes. Removed attributes are included with
+        the value None.
+
         This method must be run in the event loop.
         """
         entity_id = entity_id.lower()
@@ -813,37 +1015,192 @@ class StateMachine(object):
 
         old_state = self._states.get(entity_id)
 
-        is_existing = old_state is not None
-        same_state = (is_existing and old_state.state == new_state and
-                      not force_update)
-        same_attr = is_existing and old_state.attributes == attributes
+        if old_state is None:
+            same_state = False
+            changed_attributes = dict(attributes)
+        else:
+            same_state = old_state.state == new_state and not force_update
+
+            if attributes is old_state.attributes:
+                changed_attributes = {}
+            else:
+                changed_attributes = _attributes_delta(
+                    old_state.attributes, attributes)
 
-        if same_state and same_attr:
-            return
+            if not changed_attributes:
+                if same_state:
+                    return
+
+                # Share the unchanged mapping with the new state
+                attributes = old_state.attributes
 
         # If state did not exist or is different, set it
         last_changed = old_state.last_changed if same_state else None
 
         state = State(entity_id, new_state, attributes, last_changed)
-        self._states[entity_id] = state
+        self._async_put_state(state)
+
+        if self._coalesce and \
+           self._async_coalesce_change(state, old_state, force_update):
+            return
 
         event_data = {
             'entity_id': entity_id,
             'old_state': old_state,
             'new_state': state,
+            'changed_attributes': changed_attributes,
         }
 
         self._bus.async_fire(EVENT_STATE_CHANGED, event_data)
 
+    def _async_coalesce_change(self, state, old_state, force_update):
+        """Hold back the state_changed event of a coalesced entity.
+
+        Returns True if the event is fired later, when the window closes.
+        """
+        entity_id = state.entity_id
+
+        if entity_id in self._coalesced:
+            if not force_update:
+                return True
+
+            self._async_close_window(entity_id, True)
+            return True
+
+        window = self._coalesce.get(entity_id)
+
+        if window is None:
+            window = self._coalesce.get(state.domain)
+
+        if not window or force_update:
+            return False
+
+        self._pending.add()
+        self._coalesced[entity_id] = (old_state, self._loop.call_later(
+            window, self._async_close_window, entity_id))
+        return True
+
+    def _async_close_window(self, entity_id, force_update=False):
+        """Fire the coalesced state_changed event of an entity."""
+        old_state, timer = self._coalesced.pop(entity_id)
+        timer.cancel()
+
+        try:
+            state = self._states[entity_id]
+
+            if old_state is None:
+                changed_attributes = dict(state.attributes)
+            else:
+                changed_attributes = _attributes_delta(
+                    old_state.attributes, state.attributes)
+
+                if state.state == old_state.state and \
+                   not changed_attributes and not force_update:
+                    return
+
+            self._bus.async_fire(EVENT_STATE_CHANGED, {
+                'entity_id': entity_id,
+                'old_state': old_state,
+                'new_state': state,
+                'changed_attributes': changed_attributes,
+            })
+        finally:
+            self._pending.done()
+
+    def _async_put_state(self, state):
+        """Store a state and add it to the domain index."""
+        self._states[state.entity_id] = state
+
+        domain_states = self._domains.get(state.domain)
+
+        if domain_states is None:
+            domain_states = self._domains[state.domain] = {}
+
+        domain_states[state.entity_id] = state
+
+    def _async_pop_state(self, entity_id):
+        """Remove and return a state, None if it does not exist."""
+        state = self._states.pop(entity_id, None)
+
+        if state is not None:
+            domain_states = self._domains[state.domain]
+            del domain_states[entity_id]
+
+            if not domain_states:
+                del self._domains[state.domain]
+
+        return state
+
+    def async_track_entity_ids(self, entity_ids, listener):
+        """Call listener with the state_changed events of entity_ids.
+
+        entity_ids is a tuple of lowercase entity ids or MATCH_ALL. Listeners
+        are called from within the event loop, only for the entities they
+        registered for.
+
+        Returns a function that can be called to remove the listener.
+
+        This method must be run in the event loop.
+        """
+        if self._unsub_dispatcher is None:
+            self._unsub_dispatcher = self._bus.async_listen(
+                EVENT_STATE_CHANGED, self._async_dispatch_state_changed)
+
+        keys = (MATCH_ALL,) if entity_ids == MATCH_ALL else entity_ids
+        entity_listeners = self._entity_listeners
+
+        for key in keys:
+            entity_listeners[key] = \
+                entity_listeners.get(key, ()) + (listener,)
+
+        def remove_listener():
+            """Remove the listener."""
+            for key in keys:
+                listeners = entity_listeners.get(key, ())
+
+                if listener not in listeners:
+                    continue
+
+                index = listeners.index(listener)
+                listeners = listeners[:index] + listeners[index + 1:]
+
+                if listeners:
+                    entity_listeners[key] = listeners
+                else:
+                    entity_listeners.pop(key)
+
+        return remove_listener
+
+    @callback
+    def _async_dispatch_state_changed(self, event):
+        """Call the listeners that track the entity of a state_changed event.
+
+        This method must be run in the event loop.
+        """
+        get = self._entity_listeners.get
+
+        for listeners in (get(MATCH_ALL, ()),
+                          get(event.data.get('entity_id'), ())):
+            for listener in listeners:
+                try:
+                    listener(event)
+                except Exception:  # pylint: disable=broad-except
+                    # A failing listener should not affect the others
+                    _LOGGER.exception("Error dispatching %s", event)
+
 
 # pylint: disable=too-few-public-methods
 class Service(object):
     """Represents a callable service."""
 
+    # pylint: disable=too-many-instance-attributes
     __slots__ = ['func', 'description', 'fields', 'schema',
-                 'is_callback', 'is_coroutinefunction']
+                 'is_callback', 'is_coroutinefunction', 'max_concurrency',
+                 'max_queue', 'in_flight', 'queue', 'rejected', 'latency']
 
-    def __init__(self, func, description, fields, schema):
+    # pylint: disable=too-many-arguments
+    def __init__(self, func, description, fields, schema,
+                 max_concurrency=None, max_queue=None):
         """Initialize a service."""
         self.func = func
         self.description = description or ''
@@ -851,6 +1208,12 @@ class Service(object):
         self.schema = schema
         self.is_callback = is_callback(func)
         self.is_coroutinefunction = asyncio.iscoroutinefunction(func)
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.queue = deque()
+        self.rejected = 0
+        self.latency = util.Histogram()
 
     def as_dict(self):
         """Return dictionary representation of this service."""
@@ -859,6 +1222,25 @@ class Service(object):
             'fields': self.fields,
         }
 
+    def stats_as_dict(self):
+        """Return dictionary representation of the call statistics."""
+        stats = {
+            'max_concurrency': self.max_concurrency,
+            'max_queue': self.max_queue,
+            'in_flight': self.in_flight,
+            'queued': len(self.queue),
+            'rejected': self.rejected,
+            'calls': self.latency.count,
+            'p50': self.latency.percentile(50),
+            'p99': self.latency.percentile(99),
+        }
+
+        # Memoized schemas report how often validation was skipped
+        if hasattr(self.schema, 'cache_info'):
+            stats['schema_cache'] = self.schema.cache_info()
+
+        return stats
+
 
 # pylint: disable=too-few-public-methods
 class ServiceCall(object):
@@ -885,13 +1267,16 @@ class ServiceCall(object):
 class ServiceRegistry(object):
     """Offers services over the eventbus."""
 
-    def __init__(self, bus, add_job, loop):
+    def __init__(self, bus, add_job, loop, pending=None):
         """Initialize a service registry."""
         self._services = {}
         self._add_job = add_job
         self._bus = bus
         self._loop = loop
+        self._pending = pending or util.PendingWork()
         self._cur_id = 0
+        # Unique across processes so remote call ids never match
+        self._id_prefix = '{}-'.format(uuid.uuid4().hex)
         run_callback_threadsafe(
             loop,
             bus.async_listen, EVENT_CALL_SERVICE, self._event_to_service_call,
@@ -910,13 +1295,32 @@ class ServiceRegistry(object):
                          in self._services[domain].items()}
                 for domain in self._services}
 
+    @property
+    def stats(self):
+        """Dict with per domain the call statistics of the services."""
+        return run_callback_threadsafe(
+            self._loop, self.async_stats,
+        ).result()
+
+    def async_stats(self):
+        """Dict with per domain the call statistics of the services.
+
+        Calls in flight and queued, rejected calls and the p50 and p99 of
+        the time in seconds from calling a service till it was executed.
+
+        This method must be run in the event loop.
+        """
+        return {domain: {key: value.stats_as_dict() for key, value
+                         in self._services[domain].items()}
+                for domain in self._services}
+
     def has_service(self, domain, service):
         """Test if specified service exists."""
         return service.lower() in self._services.get(domain.lower(), [])
 
     # pylint: disable=too-many-arguments
     def register(self, domain, service, service_func, description=None,
-                 schema=None):
+                 schema=None, max_concurrency=None, max_queue=None):
         """
         Register a service.
 
@@ -924,15 +1328,19 @@ class ServiceRegistry(object):
         the service and a key 'fields' to describe the fields.
 
         Schema is called to coerce and validate the service data.
+
+        Max concurrency limits the calls that are executed at the same time,
+        further calls are queued. Once max queue calls are waiting, new
+        calls are rejected.
         """
         run_callback_threadsafe(
             self._loop,
             self.async_register, domain, service, service_func, description,
-            schema
+            schema, max_concurrency, max_queue
         ).result()
 
     def async_register(self, domain, service, service_func, description=None,
-                       schema=None):
+                       schema=None, max_concurrency=None, max_queue=None):
         """
         Register a service.
 
@@ -941,13 +1349,18 @@ class ServiceRegistry(object):
 
         Schema is called to coerce and validate the service data.
 
+        Max concurrency limits the calls that are executed at the same time,
+        further calls are queued. Once max queue calls are waiting, new
+        calls are rejected.
+
         This method must be run in the event loop.
         """
         domain = domain.lower()
         service = service.lower()
         description = description or {}
         service_obj = Service(service_func, description.get('description'),
-                              description.get('fields', {}), schema)
+                              description.get('fields', {}), schema,
+                              max_concurrency, max_queue)
 
         if domain in self._services:
             self._services[domain][service] = service_obj
@@ -969,19 +1382,21 @@ class ServiceRegistry(object):
         If blocking = True, will return boolean if service executed
         succesfully within SERVICE_CALL_LIMIT.
 
-        This method will fire an event to call the service.
-        This event will be picked up by this ServiceRegistry and any
-        other ServiceRegistry that is listening on the EventBus.
+        Services of this registry are called directly. An EVENT_CALL_SERVICE
+        event is fired for observers and for other ServiceRegistry instances
+        that are listening on the EventBus.
 
         Because the service is sent as an event you are not allowed to use
         the keys ATTR_DOMAIN and ATTR_SERVICE in your service_data.
         """
-        return run_coroutine_threadsafe(
+        result = run_coroutine_threadsafe(
             self.async_call(domain, service, service_data, blocking),
             self._loop
         ).result()
 
-    @callback
+        return result if blocking else None
+
+    @asyncio.coroutine
     def async_call(self, domain, service, service_data=None, blocking=False):
         """
         Call a service.
@@ -990,54 +1405,78 @@ class ServiceRegistry(object):
         Waits a maximum of SERVICE_CALL_LIMIT.
 
         If blocking = True, will return boolean if service executed
-        succesfully within SERVICE_CALL_LIMIT.
+        succesfully within SERVICE_CALL_LIMIT. Else returns a future that
+        resolves once a service of this registry has been executed.
 
-        This method will fire an event to call the service.
-        This event will be picked up by this ServiceRegistry and any
-        other ServiceRegistry that is listening on the EventBus.
+        Services of this registry are called directly. An EVENT_CALL_SERVICE
+        event is fired for observers and for other ServiceRegistry instances
+        that are listening on the EventBus.
 
         Because the service is sent as an event you are not allowed to use
         the keys ATTR_DOMAIN and ATTR_SERVICE in your service_data.
 
         This method is a coroutine.
         """
+        domain = domain.lower()
+        service = service.lower()
         call_id = self._generate_unique_id()
 
         event_data = {
-            ATTR_DOMAIN: domain.lower(),
-            ATTR_SERVICE: service.lower(),
+            ATTR_DOMAIN: domain,
+            ATTR_SERVICE: service,
             ATTR_SERVICE_DATA: service_data,
             ATTR_SERVICE_CALL_ID: call_id,
         }
 
-        if blocking:
-            fut = asyncio.Future(loop=self._loop)
+        fut = None
+        unsub = None
+
+        if self.has_service(domain, service):
+            self._bus.async_fire(EVENT_CALL_SERVICE, event_data)
+            fut = self._async_execute_service(
+                domain, service, service_data, call_id)
+        else:
+            _LOGGER.warning('Unable to find service %s/%s', domain, service)
+
+            if blocking:
+                # Wait for a registry on the other end of the bus
+                fut = asyncio.Future(loop=self._loop)
+
+                @callback
+                def service_executed(event):
+                    """Resolve the future when the service is executed."""
+                    if event.data[ATTR_SERVICE_CALL_ID] == call_id and \
+                       not fut.done():
+                        fut.set_result(True)
 
-            @callback
-            def service_executed(event):
-                """Callback method that is called when service is executed."""
-                if event.data[ATTR_SERVICE_CALL_ID] == call_id:
-                    fut.set_result(True)
+                unsub = self._bus.async_listen(EVENT_SERVICE_EXECUTED,
+                                               service_executed)
 
-            unsub = self._bus.async_listen(EVENT_SERVICE_EXECUTED,
-                                           service_executed)
+            self._bus.async_fire(EVENT_CALL_SERVICE, event_data)
 
-        self._bus.async_fire(EVENT_CALL_SERVICE, event_data)
+        if not blocking:
+            return fut
 
-        if blocking:
-            done, _ = yield from asyncio.wait([fut], loop=self._loop,
-                                              timeout=SERVICE_CALL_LIMIT)
-            success = bool(done)
+        done, _ = yield from asyncio.wait([fut], loop=self._loop,
+                                          timeout=SERVICE_CALL_LIMIT)
+
+        if unsub is not None:
             unsub()
-            return success
 
-    @asyncio.coroutine
+        return bool(done) and fut.result()
+
+    @callback
     def _event_to_service_call(self, event):
         """Callback for SERVICE_CALLED events from the event bus."""
+        call_id = event.data.get(ATTR_SERVICE_CALL_ID)
+
+        # Calls made through async_call have been dispatched already
+        if call_id and str(call_id).startswith(self._id_prefix):
+            return
+
         service_data = event.data.get(ATTR_SERVICE_DATA) or {}
         domain = event.data.get(ATTR_DOMAIN).lower()
         service = event.data.get(ATTR_SERVICE).lower()
-        call_id = event.data.get(ATTR_SERVICE_CALL_ID)
 
         if not self.has_service(domain, service):
             if event.origin == EventOrigin.local:
@@ -1045,50 +1484,280 @@ class ServiceRegistry(object):
                                 domain, service)
             return
 
-        service_handler = self._services[domain][service]
+        self._async_execute_service(domain, service, service_data, call_id)
 
-        def fire_service_executed():
-            """Fire service executed event."""
-            if not call_id:
-                return
+    def _async_execute_service(self, domain, service, service_data, call_id):
+        """Execute a service of this registry.
 
-            data = {ATTR_SERVICE_CALL_ID: call_id}
+        Returns a future that resolves to True once the service has been
+        executed and to False if the service raised an exception or the call
+        was rejected.
 
-            if (service_handler.is_coroutinefunction or
-                    service_handler.is_callback):
-                self._bus.async_fire(EVENT_SERVICE_EXECUTED, data)
-            else:
-                self._bus.fire(EVENT_SERVICE_EXECUTED, data)
+        This method must be run in the event loop.
+        """
+        service_handler = self._services[domain][service]
+        fut = asyncio.Future(loop=self._loop)
+
+        @callback
+        def async_notify(success):
+            """Resolve the future and notify observers of the execution."""
+            if success and call_id:
+                self._bus.async_fire(EVENT_SERVICE_EXECUTED,
+                                     {ATTR_SERVICE_CALL_ID: call_id})
+
+            if not fut.done():
+                fut.set_result(success)
 
         try:
             if service_handler.schema:
-                service_data = service_handler.schema(service_data)
+                service_data = service_handler.schema(service_data or {})
         except vol.Invalid as ex:
             _LOGGER.error('Invalid service data for %s.%s: %s',
                           domain, service, humanize_error(service_data, ex))
-            fire_service_executed()
-            return
+            async_notify(True)
+            return fut
 
         service_call = ServiceCall(domain, service, service_data, call_id)
+        queued = time.monotonic()
+
+        @callback
+        def async_service_executed(success):
+            """Update the statistics and start the next queued call."""
+            service_handler.in_flight -= 1
+            service_handler.latency.add(time.monotonic() - queued)
+            async_notify(success)
+
+            if service_handler.queue:
+                self._async_run_service(
+                    service_handler, *service_handler.queue.popleft())
+
+        if service_handler.max_concurrency is not None and \
+           service_handler.in_flight >= service_handler.max_concurrency:
+            if service_handler.max_queue is not None and \
+               len(service_handler.queue) >= service_handler.max_queue:
+                service_handler.rejected += 1
+                _LOGGER.warning('Rejected call to %s.%s, %d calls queued',
+                                domain, service, len(service_handler.queue))
+                fut.set_result(False)
+            else:
+                service_handler.queue.append(
+                    (service_call, async_service_executed))
+
+            return fut
+
+        self._async_run_service(
+            service_handler, service_call, async_service_executed)
+
+        return fut
+
+    def _async_run_service(self, service_handler, service_call,
+                           async_service_executed):
+        """Run a service handler and report back when it is done.
+
+        This method must be run in the event loop.
+        """
+        service_handler.in_flight += 1
 
         if service_handler.is_callback:
-            service_handler.func(service_call)
-            fire_service_executed()
+            try:
+                service_handler.func(service_call)
+            except Exception:  # pylint: disable=broad-except
+                _LOGGER.exception('Error executing service %s', service_call)
+                async_service_executed(False)
+            else:
+                async_service_executed(True)
+
         elif service_handler.is_coroutinefunction:
-            yield from service_handler.func(service_call)
-            fire_service_executed()
+            @asyncio.coroutine
+            def execute_coroutine_service():
+                """Execute a coroutine service."""
+                try:
+                    yield from service_handler.func(service_call)
+                except Exception:  # pylint: disable=broad-except
+                    _LOGGER.exception('Error executing service %s',
+                                      service_call)
+                    async_service_executed(False)
+                else:
+                    async_service_executed(True)
+
+            task = self._loop.create_task(execute_coroutine_service())
+            self._pending.add()
+            task.add_done_callback(lambda _: self._pending.done())
+
         else:
             def execute_service():
-                """Execute a service and fires a SERVICE_EXECUTED event."""
-                service_handler.func(service_call)
-                fire_service_executed()
+                """Execute a service in the worker pool."""
+                try:
+                    service_handler.func(service_call)
+                    success = True
+                except Exception:  # pylint: disable=broad-except
+                    _LOGGER.exception('Error executing service %s',
+                                      service_call)
+                    success = False
+
+                self._pending.add()
+                self._loop.call_soon_threadsafe(
+                    self._pending.run, async_service_executed, success)
 
             self._add_job(execute_service, priority=JobPriority.EVENT_SERVICE)
 
     def _generate_unique_id(self):
         """Generate a unique service call id."""
         self._cur_id += 1
-        return "{}-{}".format(id(self), self._cur_id)
+        return "{}{}".format(self._id_prefix, self._cur_id)
+
+
+class Scheduler(object):
+    """Run callbacks once a point in UTC time has been reached.
+
+    Scheduled callbacks are kept in a heap ordered by their point in time.
+    Every time_changed event only pops the callbacks that are due, instead
+    of every callback comparing the time itself. While the timer is running
+    the loop is also woken up with call_at for the first pending callback,
+    which gives sub-second precision.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, bus, loop):
+        """Initialize the scheduler."""
+        self._bus = bus
+        self._loop = loop
+        # Entries are [point_in_time, sequence, action, queued]. The action
+        # is set to None once it ran or was cancelled, queued is cleared
+        # once the entry is popped from the heap.
+        self._heap = []
+        self._sequence = itertools.count()
+        # Number of cancelled entries that are still in the heap
+        self._cancelled = 0
+        self._unsub_time_changed = None
+        self._handle = None
+        self._running = False
+
+    def async_schedule(self, point_in_time, action):
+        """Call action with the current time once point_in_time is reached.
+
+        point_in_time has to be a timezone aware datetime and action has to
+        be safe to call from within the event loop.
+
+        Returns a function that can be called to cancel the callback.
+
+        This method must be run in the event loop.
+        """
+        if self._unsub_time_changed is None:
+            self._unsub_time_changed = self._bus.async_listen(
+                EVENT_TIME_CHANGED, self._async_time_changed)
+
+        entry = [point_in_time, next(self._sequence), action, True]
+        heapq.heappush(self._heap, entry)
+
+        if self._heap[0] is entry:
+            self._async_schedule_wakeup()
+
+        def cancel():
+            """Cancel the scheduled callback."""
+            if entry[2] is None:
+                return
+
+            entry[2] = None
+
+            # Entries that are popped already are not in the heap anymore
+            if not entry[3]:
+                return
+
+            self._cancelled += 1
+
+            # Drop cancelled entries once they make up most of the heap
+            if self._cancelled > len(self._heap) // 2:
+                self._heap = [item for item in self._heap
+                              if item[2] is not None]
+                heapq.heapify(self._heap)
+                self._cancelled = 0
+
+        return cancel
+
+    @callback
+    def async_start(self):
+        """Start waking up the loop for the next scheduled callback.
+
+        This method must be run in the event loop.
+        """
+        self._running = True
+        self._async_schedule_wakeup()
+
+    @callback
+    def async_stop(self):
+        """Stop waking up the loop for scheduled callbacks.
+
+        This method must be run in the event loop.
+        """
+        self._running = False
+
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    @callback
+    def _async_time_changed(self, event):
+        """Run the callbacks that are due at the time of the event."""
+        self._async_run_due(event.data[ATTR_NOW])
+
+    @callback
+    def _async_wakeup(self):
+        """Run the callbacks that are due now."""
+        self._handle = None
+        self._async_run_due(dt_util.utcnow())
+
+    def _async_run_due(self, now):
+        """Run all callbacks scheduled at or before now.
+
+        This method must be run in the event loop.
+        """
+        heap = self._heap
+        due = []
+
+        # Collect first so callbacks scheduled by the actions that run now
+        # have to wait for the next time they are due.
+        while heap and heap[0][0] <= now:
+            entry = heapq.heappop(heap)
+            entry[3] = False
+
+            if entry[2] is None:
+                self._cancelled -= 1
+            else:
+                due.append(entry)
+
+        for entry in due:
+            action = entry[2]
+
+            # Might have been cancelled by one of the other actions
+            if action is None:
+                continue
+
+            entry[2] = None
+
+            try:
+                action(now)
+            except Exception:  # pylint: disable=broad-except
+                # A failing callback should not affect the others
+                _LOGGER.exception("Error running scheduled %s", action)
+
+        self._async_schedule_wakeup()
+
+    def _async_schedule_wakeup(self):
+        """Wake up the loop when the first pending callback is due.
+
+        This method must be run in the event loop.
+        """
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+        if not self._running or not self._heap:
+            return
+
+        delay = (self._heap[0][0] - dt_util.utcnow()).total_seconds()
+        self._handle = self._loop.call_at(
+            self._loop.time() + max(delay, 0), self._async_wakeup)
 
 
 class Config(object):
@@ -1152,6 +1821,7 @@ def async_create_timer(hass, interval=TIMER_INTERVAL):
     def stop_timer(event):
         """Stop the timer."""
         stop_event.set()
+        hass.scheduler.async_stop()
 
     hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, stop_timer)
 
@@ -1204,11 +1874,12 @@ def async_create_timer(hass, interval=TIMER_INTERVAL):
     def start_timer(event):
         """Start our async timer."""
         hass.loop.create_task(timer(interval, stop_event))
+        hass.scheduler.async_start()
 
     hass.bus.async_listen_once(EVENT_HOMEASSISTANT_START, start_timer)
 
 
-def create_worker_pool(worker_count=None):
+def create_worker_pool(worker_count=None, pending=None):
     """Create a worker pool."""
     if worker_count is None:
         worker_count = MIN_WORKER_THREAD
@@ -1223,7 +1894,8 @@ def create_worker_pool(worker_count=None):
             # We do not want to crash our ThreadPool
             _LOGGER.exception("BusHandler:Exception doing job")
 
-    return util.ThreadPool(job_handler, worker_count)
+    return util.ThreadPool(job_handler, worker_count,
+                           max(worker_count, MAX_WORKER_THREAD), pending)
 
 
 def async_monitor_worker_pool(hass):
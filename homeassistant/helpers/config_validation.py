@@ -1,5 +1,6 @@
 """Helpers for config validation using voluptuous."""
 from collections import OrderedDict
+import copy
 from datetime import timedelta
 import os
 from urllib.parse import urlparse
@@ -344,6 +345,78 @@ def key_dependency(key, dependency):
     return validator
 
 
+def _freeze(value):
+    """Return a hashable representation of a validator input.
+
+    Raises TypeError if the value contains something unhashable.
+    """
+    if isinstance(value, dict):
+        return dict, frozenset((key, _freeze(item))
+                               for key, item in value.items())
+    elif isinstance(value, (list, tuple)):
+        return type(value), tuple(_freeze(item) for item in value)
+
+    hash(value)
+    # Keep the type so 1, 1.0 and True are validated separately.
+    return type(value), value
+
+
+class MemoizedSchema(object):
+    """Validate with a schema and remember the results of recent inputs.
+
+    Inputs are looked up by value with least recently used eviction. Inputs
+    that can not be made hashable are validated every time and invalid
+    inputs are never remembered. Every call returns a deep copy of the
+    remembered result, so callers can change it, including nested values
+    and templates.
+    """
+
+    def __init__(self, schema, maxsize=128):
+        """Initialize the memoized schema."""
+        self.schema = schema
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+
+    def __call__(self, value):
+        """Validate value or return the remembered result."""
+        try:
+            key = _freeze(value)
+            result = self._cache[key]
+        except TypeError:
+            self.misses += 1
+            return self.schema(value)
+        except KeyError:
+            self.misses += 1
+            result = self.schema(value)
+            self._cache[key] = result
+
+            if len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+        else:
+            self.hits += 1
+            self._cache.move_to_end(key)
+
+        return copy.deepcopy(result)
+
+    def cache_info(self):
+        """Return the hit statistics of the cache."""
+        calls = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / calls if calls else None,
+            'maxsize': self.maxsize,
+            'currsize': len(self._cache),
+        }
+
+    def cache_clear(self):
+        """Forget the remembered results and reset the statistics."""
+        self._cache.clear()
+        self.hits = self.misses = 0
+
+
 # Schemas
 
 PLATFORM_SCHEMA = vol.Schema({
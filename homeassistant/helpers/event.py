@@ -4,7 +4,7 @@ from datetime import timedelta
 
 from ..core import HomeAssistant, callback
 from ..const import (
-    ATTR_NOW, EVENT_STATE_CHANGED, EVENT_TIME_CHANGED, MATCH_ALL)
+    ATTR_NOW, EVENT_TIME_CHANGED, MATCH_ALL)
 from ..util import dt as dt_util
 from ..util.async import run_callback_threadsafe
 
@@ -59,10 +59,6 @@ def async_track_state_change(hass, entity_ids, action, from_state=None,
     @callback
     def state_change_listener(event):
         """The listener that listens for specific state changes."""
-        if entity_ids != MATCH_ALL and \
-           event.data.get('entity_id') not in entity_ids:
-            return
-
         if event.data.get('old_state') is not None:
             old_state = event.data['old_state'].state
         else:
@@ -78,7 +74,8 @@ def async_track_state_change(hass, entity_ids, action, from_state=None,
                                event.data.get('old_state'),
                                event.data.get('new_state'))
 
-    return hass.bus.async_listen(EVENT_STATE_CHANGED, state_change_listener)
+    return hass.states.async_track_entity_ids(entity_ids,
+                                              state_change_listener)
 
 
 track_state_change = threaded_listener_factory(async_track_state_change)
@@ -106,27 +103,12 @@ def async_track_point_in_utc_time(hass, action, point_in_time):
     point_in_time = dt_util.as_utc(point_in_time)
 
     @callback
-    def point_in_time_listener(event):
-        """Listen for matching time_changed events."""
-        now = event.data[ATTR_NOW]
-
-        if now < point_in_time or hasattr(point_in_time_listener, 'run'):
-            return
-
-        # Set variable so that we will never run twice.
-        # Because the event bus might have to wait till a thread comes
-        # available to execute this listener it might occur that the
-        # listener gets lined up twice to be executed. This will make
-        # sure the second time it does nothing.
-        point_in_time_listener.run = True
-        async_unsub()
-
+    def point_in_time_listener(now):
+        """Run the action once point_in_time has been reached."""
         hass.async_run_job(action, now)
 
-    async_unsub = hass.bus.async_listen(EVENT_TIME_CHANGED,
-                                        point_in_time_listener)
-
-    return async_unsub
+    return hass.scheduler.async_schedule(point_in_time,
+                                         point_in_time_listener)
 
 
 track_point_in_utc_time = threaded_listener_factory(
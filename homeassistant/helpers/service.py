@@ -24,6 +24,9 @@ CONF_SERVICE_DATA_TEMPLATE = 'data_template'
 
 _LOGGER = logging.getLogger(__name__)
 
+# Scripts and automations call the same few services over and over.
+SERVICE_SCHEMA = cv.MemoizedSchema(cv.SERVICE_SCHEMA)
+
 
 def service(domain, service_name):
     """Decorator factory to register a service."""
@@ -50,7 +53,7 @@ def async_call_from_config(hass, config, blocking=False, variables=None,
     """Call a service based on a config hash."""
     if validate_config:
         try:
-            config = cv.SERVICE_SCHEMA(config)
+            config = SERVICE_SCHEMA(config)
         except vol.Invalid as ex:
             _LOGGER.error("Invalid config for calling service: %s", ex)
             return
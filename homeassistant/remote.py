@@ -28,6 +28,7 @@ from homeassistant.const import (
     URL_API_SERVICES_SERVICE, URL_API_STATES, URL_API_STATES_ENTITY,
     HTTP_HEADER_CONTENT_TYPE, CONTENT_TYPE_JSON)
 from homeassistant.exceptions import HomeAssistantError
+import homeassistant.util as util
 
 METHOD_GET = "get"
 METHOD_POST = "post"
@@ -124,11 +125,14 @@ class HomeAssistant(ha.HomeAssistant):
         self.remote_api = remote_api
 
         self.loop = loop or asyncio.get_event_loop()
-        self.pool = pool = ha.create_worker_pool()
+        self.pending = util.PendingWork()
+        self.pool = pool = ha.create_worker_pool(pending=self.pending)
 
-        self.bus = EventBus(remote_api, pool, self.loop)
-        self.services = ha.ServiceRegistry(self.bus, self.add_job, self.loop)
+        self.bus = EventBus(remote_api, pool, self.loop, self.pending)
+        self.services = ha.ServiceRegistry(
+            self.bus, self.add_job, self.loop, self.pending)
         self.states = StateMachine(self.bus, self.loop, self.remote_api)
+        self.scheduler = ha.Scheduler(self.bus, self.loop)
         self.config = ha.Config()
         self.state = ha.CoreState.not_running
 
@@ -180,9 +184,9 @@ class EventBus(ha.EventBus):
     """EventBus implementation that forwards fire_event to remote API."""
 
     # pylint: disable=too-few-public-methods
-    def __init__(self, api, pool, loop):
+    def __init__(self, api, pool, loop, pending=None):
         """Initalize the eventbus."""
-        super().__init__(pool, loop)
+        super().__init__(pool, loop, pending)
         self._api = api
 
     def fire(self, event_type, event_data=None, origin=ha.EventOrigin.local):
@@ -279,15 +283,18 @@ class StateMachine(ha.StateMachine):
 
     def mirror(self):
         """Discard current data and mirrors the remote state machine."""
-        self._states = {state.entity_id: state for state
-                        in get_states(self._api)}
+        self._states = {}
+        self._domains = {}
+
+        for state in get_states(self._api):
+            self._async_put_state(state)
 
     def _state_changed_listener(self, event):
         """Listen for state changed events and applies them."""
         if event.data['new_state'] is None:
-            self._states.pop(event.data['entity_id'], None)
+            self._async_pop_state(event.data['entity_id'])
         else:
-            self._states[event.data['entity_id']] = event.data['new_state']
+            self._async_put_state(event.data['new_state'])
 
 
 class JSONEncoder(json.JSONEncoder):
@@ -0,0 +1,348 @@
+"""Script to run benchmarks against the Home Assistant core."""
+import argparse
+import asyncio
+from datetime import timedelta
+import json
+import logging
+import shutil
+import tempfile
+from timeit import default_timer as timer
+import tracemalloc
+from typing import List
+
+from homeassistant import core
+from homeassistant.const import EVENT_HOMEASSISTANT_START, __version__
+from homeassistant.helpers.template import Template
+
+BENCHMARKS = {}
+
+TEMPLATES = {
+    'state': "{{ states('sensor.benchmark_0') }}",
+    'domain_loop': "{% for state in states.sensor %}{{ state.state }}"
+                   "{% endfor %}",
+    'filter': "{{ states.sensor.benchmark_0.state | float * 2 }}",
+}
+
+
+def run(script_args: List) -> int:
+    """Run one or all benchmarks and print the results as JSON."""
+    parser = argparse.ArgumentParser(
+        description="Run Home Assistant benchmarks.")
+    parser.add_argument(
+        'name', nargs='?', default='all',
+        choices=['all'] + sorted(BENCHMARKS))
+    parser.add_argument(
+        '--events', type=int, default=10000,
+        help="Number of events to fire or states to set")
+    parser.add_argument(
+        '--listeners', type=int, default=50,
+        help="Number of listeners to register")
+    parser.add_argument(
+        '--entities', type=int, default=5000,
+        help="Number of entities to create")
+    parser.add_argument(
+        '--calls', type=int, default=1000,
+        help="Number of blocking service calls to make")
+    parser.add_argument(
+        '--renders', type=int, default=10000,
+        help="Number of times to render each template")
+    parser.add_argument(
+        '--script',
+        choices=['benchmark'])
+
+    args = parser.parse_args()
+
+    # The bus logs every event it handles at info level
+    logging.getLogger().setLevel(logging.WARNING)
+
+    names = sorted(BENCHMARKS) if args.name == 'all' else [args.name]
+    results = {}
+
+    for name in names:
+        loop = asyncio.new_event_loop()
+        hass = core.HomeAssistant(loop)
+
+        try:
+            results[name] = loop.run_until_complete(
+                BENCHMARKS[name](hass, args))
+        finally:
+            hass.pool.stop()
+            hass.executor.shutdown()
+            loop.close()
+
+    print(json.dumps({
+        'version': __version__,
+        'benchmarks': results,
+    }, indent=2, sort_keys=True))
+    return 0
+
+
+def benchmark(func):
+    """Decorator to mark a coroutine as a benchmark."""
+    BENCHMARKS[func.__name__] = func
+    return func
+
+
+def _rate(count, runtime, unit):
+    """Return the result of a throughput benchmark."""
+    return {
+        unit: count,
+        'seconds': round(runtime, 6),
+        '{}_per_second'.format(unit): round(count / runtime, 1),
+    }
+
+
+def _latency(samples):
+    """Return the distribution of latency samples in milliseconds."""
+    samples = sorted(samples)
+
+    def percentile(percent):
+        """Return the sample at percent."""
+        return round(
+            samples[min(len(samples) - 1,
+                        int(len(samples) * percent / 100))] * 1000, 4)
+
+    return {
+        'calls': len(samples),
+        'mean_ms': round(sum(samples) / len(samples) * 1000, 4),
+        'p50_ms': percentile(50),
+        'p99_ms': percentile(99),
+        'max_ms': round(samples[-1] * 1000, 4),
+    }
+
+
+@asyncio.coroutine
+def _fire_events(hass, args, listener):
+    """Register listener args.listeners times and fire args.events events."""
+    event_type = 'benchmark_event'
+
+    for _ in range(args.listeners):
+        hass.bus.async_listen(event_type, listener)
+
+    # Fire in batches and yield in between so the loop can run the
+    # scheduled listeners without queuing every handle at once.
+    batch = 100
+    start = timer()
+
+    for fired in range(args.events):
+        hass.bus.async_fire(event_type)
+
+        if fired % batch == 0:
+            yield from asyncio.sleep(0, loop=hass.loop)
+
+    yield from hass.async_block_till_done()
+
+    result = _rate(args.events, timer() - start, 'events')
+    result['listeners'] = args.listeners
+    return result
+
+
+@benchmark
+@asyncio.coroutine
+def fire_event_callback(hass, args):
+    """Fire events at a bus with callback listeners registered."""
+    calls = 0
+
+    @core.callback
+    def listener(_):
+        """Count the calls."""
+        nonlocal calls
+        calls += 1
+
+    result = yield from _fire_events(hass, args, listener)
+    assert calls == args.events * args.listeners
+    return result
+
+
+@benchmark
+@asyncio.coroutine
+def fire_event_coroutine(hass, args):
+    """Fire events at a bus with coroutine listeners registered."""
+    calls = 0
+
+    @asyncio.coroutine
+    def listener(_):
+        """Count the calls."""
+        nonlocal calls
+        calls += 1
+
+    result = yield from _fire_events(hass, args, listener)
+    assert calls == args.events * args.listeners
+    return result
+
+
+@benchmark
+@asyncio.coroutine
+def fire_event_thread(hass, args):
+    """Fire events at a bus with listeners that run in the worker pool."""
+    calls = []
+
+    def listener(_):
+        """Count the calls."""
+        calls.append(1)
+
+    result = yield from _fire_events(hass, args, listener)
+    assert len(calls) == args.events * args.listeners
+    return result
+
+
+@benchmark
+@asyncio.coroutine
+def async_set(hass, args):
+    """Set changing states of many entities."""
+    entity_ids = ['sensor.benchmark_{}'.format(idx)
+                  for idx in range(args.entities)]
+    attributes = {'unit_of_measurement': 'W'}
+    start = timer()
+
+    for idx in range(args.events):
+        hass.states.async_set(
+            entity_ids[idx % args.entities], idx, attributes)
+
+    yield from hass.async_block_till_done()
+
+    result = _rate(args.events, timer() - start, 'states')
+    result['entities'] = args.entities
+    return result
+
+
+@benchmark
+@asyncio.coroutine
+def service_call(hass, args):
+    """Measure the round trip of blocking service calls."""
+    @asyncio.coroutine
+    def handler(_):
+        """Handle the service call."""
+
+    hass.services.async_register('benchmark', 'call', handler)
+    samples = []
+
+    for _ in range(args.calls):
+        start = timer()
+        yield from hass.services.async_call(
+            'benchmark', 'call', {}, blocking=True)
+        samples.append(timer() - start)
+
+    return _latency(samples)
+
+
+@benchmark
+@asyncio.coroutine
+def template_render(hass, args):
+    """Render templates that read the state machine."""
+    for idx in range(100):
+        hass.states.async_set('sensor.benchmark_{}'.format(idx), idx)
+
+    result = {}
+
+    for name, source in sorted(TEMPLATES.items()):
+        tpl = Template(source, hass)
+        tpl.async_render()
+        start = timer()
+
+        for _ in range(args.renders):
+            tpl.async_render()
+
+        result[name] = _rate(args.renders, timer() - start, 'renders')
+
+    return result
+
+
+@benchmark
+@asyncio.coroutine
+def state_as_json(hass, args):
+    """Serialize the states of many entities for several consumers.
+
+    Every state is read args.events / args.entities times, like the API, the
+    event stream and the recorder do for the same state change.
+    """
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+
+    for idx in range(args.entities):
+        hass.states.async_set('sensor.benchmark_{}'.format(idx), idx, {
+            'unit_of_measurement': 'W',
+            'friendly_name': 'Benchmark {}'.format(idx),
+        })
+
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    memory = sum(stat.size_diff for stat
+                 in after.compare_to(before, 'lineno'))
+
+    states = hass.states.async_all()
+    reads = max(args.events // args.entities, 1)
+    start = timer()
+
+    for _ in range(reads):
+        for state in states:
+            state.as_json()
+
+    result = _rate(reads * len(states), timer() - start, 'states')
+    result['entities'] = args.entities
+    result['memory_kib'] = round(memory / 1024, 1)
+    return result
+
+
+@benchmark
+@asyncio.coroutine
+def recorder(hass, args):
+    """Record state changes in SQLite and query history meanwhile.
+
+    Inserts args.events state changes, then measures args.calls history
+    queries while the recorder writes another args.events state changes.
+    """
+    from homeassistant.components import history, recorder as rec
+
+    entity_ids = ['sensor.benchmark_{}'.format(idx)
+                  for idx in range(min(args.entities, 100))]
+    config_dir = hass.config.config_dir = tempfile.mkdtemp()
+
+    @asyncio.coroutine
+    def set_states():
+        """Change states in batches so the recorder is kept busy."""
+        for idx in range(args.events):
+            hass.states.async_set(entity_ids[idx % len(entity_ids)], idx)
+
+            if idx % 100 == 0:
+                yield from asyncio.sleep(0, loop=hass.loop)
+
+    def query():
+        """Query the history of the last hour of one entity."""
+        start = timer()
+        history.get_significant_states(
+            core.dt_util.utcnow() - timedelta(hours=1),
+            entity_id=entity_ids[0])
+        return timer() - start
+
+    try:
+        yield from hass.loop.run_in_executor(None, rec.setup, hass, {
+            rec.DOMAIN: {rec.CONF_DB_URL: 'sqlite:///{}/benchmark.db'.format(
+                config_dir)}})
+        instance = rec.get_instance()
+        hass.bus.async_fire(EVENT_HOMEASSISTANT_START)
+        yield from hass.loop.run_in_executor(
+            None, instance.block_till_db_ready)
+
+        start = timer()
+        yield from set_states()
+        yield from hass.async_block_till_done()
+        yield from hass.loop.run_in_executor(
+            None, instance.block_till_done)
+        result = _rate(args.events, timer() - start, 'states')
+
+        writer = hass.async_add_job(set_states())
+        samples = []
+        for _ in range(args.calls):
+            samples.append((yield from hass.loop.run_in_executor(
+                None, query)))
+        yield from writer
+
+        result['query'] = _latency(samples)
+        return result
+    finally:
+        if rec.get_instance() is not None:
+            yield from hass.loop.run_in_executor(
+                None, rec.get_instance().shutdown, None)
+        shutil.rmtree(config_dir)
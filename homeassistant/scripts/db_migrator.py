@@ -1,6 +1,7 @@
 """Script to convert an old-format home-assistant.db to a new format one."""
 
 import argparse
+import json
 import os.path
 import sqlite3
 import sys
@@ -9,6 +10,7 @@ from datetime import datetime
 from typing import Optional, List
 
 import homeassistant.config as config_util
+from homeassistant.const import EVENT_STATE_CHANGED
 import homeassistant.util.dt as dt_util
 # pylint: disable=unused-import
 from homeassistant.components.recorder import REQUIREMENTS  # NOQA
@@ -47,9 +49,228 @@ def print_progress(iteration: int, total: int, prefix: str='', suffix: str='',
         print("\n")
 
 
+# Rows converted per transaction
+CHUNK_SIZE = 1000
+
+# Number of attribute hashes to remember the row id of
+ATTRIBUTES_CACHE_SIZE = 10000
+
+
+def shared_attributes_id(session, attributes: str, cache: dict) -> int:
+    """Return the id of the state_attributes row that holds attributes."""
+    from homeassistant.components.recorder.models import get_attributes_id
+
+    if len(cache) > ATTRIBUTES_CACHE_SIZE:
+        cache.clear()
+    return get_attributes_id(session, attributes, cache)
+
+
+def strip_event_data(event_type: str, event_data: str) -> str:
+    """Remove the states from the data of a state_changed event."""
+    if event_type != EVENT_STATE_CHANGED:
+        return event_data
+    return json.dumps({'entity_id': json.loads(event_data).get('entity_id')})
+
+
+def _normalize_states(session) -> None:
+    """Move the attributes of states rows into state_attributes."""
+    from sqlalchemy import text
+
+    select_states = text(
+        "SELECT state_id, attributes FROM states "
+        "WHERE attributes_id IS NULL AND state_id > :last_id "
+        "ORDER BY state_id LIMIT :limit")
+    update_state = text(
+        "UPDATE states SET attributes_id = :attributes_id, attributes = NULL "
+        "WHERE state_id = :state_id")
+
+    num_rows = session.execute(
+        "SELECT count(*) FROM states WHERE attributes_id IS NULL").scalar()
+    print("Moving attributes of {} states".format(num_rows))
+
+    cache = {}  # type: dict
+    last_id = converted = 0
+    while True:
+        rows = session.execute(select_states, {
+            'last_id': last_id, 'limit': CHUNK_SIZE}).fetchall()
+        if not rows:
+            break
+
+        for state_id, attributes in rows:
+            session.execute(update_state, {
+                'attributes_id': shared_attributes_id(
+                    session, attributes or '{}', cache),
+                'state_id': state_id,
+            })
+
+        session.commit()
+        last_id = rows[-1][0]
+        converted += len(rows)
+        print_progress(converted, num_rows)
+
+
+def _normalize_events(session) -> None:
+    """Remove the states from the data of state_changed events."""
+    from sqlalchemy import text
+
+    select_events = text(
+        "SELECT event_id, event_data FROM events "
+        "WHERE event_type = :event_type AND event_id > :last_id "
+        "ORDER BY event_id LIMIT :limit")
+    select_event_ids = text(
+        "SELECT event_id FROM states "
+        "WHERE event_id >= :first_id AND event_id <= :last_id")
+    update_event = text(
+        "UPDATE events SET event_data = :event_data "
+        "WHERE event_id = :event_id")
+
+    num_rows = session.execute(
+        text("SELECT count(*) FROM events WHERE event_type = :event_type"),
+        {'event_type': EVENT_STATE_CHANGED}).scalar()
+    print("Removing states from {} state_changed events".format(num_rows))
+
+    last_id = converted = 0
+    while True:
+        rows = session.execute(select_events, {
+            'event_type': EVENT_STATE_CHANGED,
+            'last_id': last_id,
+            'limit': CHUNK_SIZE}).fetchall()
+        if not rows:
+            break
+
+        # The new state can only be restored from a states row
+        with_state = {row[0] for row in session.execute(select_event_ids, {
+            'first_id': rows[0][0], 'last_id': rows[-1][0]})}
+
+        for event_id, event_data in rows:
+            if event_id in with_state:
+                session.execute(update_event, {
+                    'event_data': strip_event_data(
+                        EVENT_STATE_CHANGED, event_data),
+                    'event_id': event_id,
+                })
+
+        session.commit()
+        last_id = rows[-1][0]
+        converted += len(rows)
+        print_progress(converted, num_rows)
+
+
+def normalize(session) -> None:
+    """Move the attributes and event states of a new format database.
+
+    Rows are read in chunks ordered by id, so memory use does not depend on
+    the size of the database.
+    """
+    from homeassistant.components.recorder import migrate_schema
+
+    migrate_schema(session.get_bind())
+    _normalize_states(session)
+    _normalize_events(session)
+
+
+def _count_rows(conn, table: str) -> int:
+    """Return the number of rows in a table of the old format database."""
+    cursor = conn.cursor()
+    cursor.execute("SELECT count(*) FROM {}".format(table))
+    num_rows = cursor.fetchone()[0]
+    cursor.close()
+    return num_rows
+
+
+def _copy_recorder_runs(conn, session) -> None:
+    """Copy the recorder_runs table into the new format database."""
+    from homeassistant.components.recorder import models
+
+    num_rows = _count_rows(conn, 'recorder_runs')
+    print("Converting {} recorder_runs".format(num_rows))
+
+    cursor = conn.cursor()
+    converted = 0
+    for row in cursor.execute("SELECT * FROM recorder_runs"):  # type: ignore
+        converted += 1
+        session.add(models.RecorderRuns(
+            start=ts_to_dt(row[1]),
+            end=ts_to_dt(row[2]),
+            closed_incorrect=row[3],
+            created=ts_to_dt(row[4])
+        ))
+        if converted % CHUNK_SIZE == 0:
+            session.commit()
+            print_progress(converted, num_rows)
+    print_progress(converted, num_rows)
+    session.commit()
+    cursor.close()
+
+
+def _copy_events(conn, session, append: bool) -> dict:
+    """Copy the events table into the new format database.
+
+    When appending, returns a mapping of old to new event ids.
+    """
+    from homeassistant.components.recorder import models
+
+    num_rows = _count_rows(conn, 'events')
+    print("Converting {} events".format(num_rows))
+
+    id_mapping = {}
+
+    cursor = conn.cursor()
+    converted = 0
+    for row in cursor.execute("SELECT * FROM events"):  # type: ignore
+        converted += 1
+        event = models.Events(
+            event_type=row[1],
+            event_data=strip_event_data(row[1], row[2]),
+            origin=row[3],
+            created=ts_to_dt(row[4]),
+            time_fired=ts_to_dt(row[5]),
+        )
+        session.add(event)
+        if append:
+            session.flush()
+            id_mapping[row[0]] = event.event_id
+        if converted % CHUNK_SIZE == 0:
+            session.commit()
+            print_progress(converted, num_rows)
+    print_progress(converted, num_rows)
+    session.commit()
+    cursor.close()
+    return id_mapping
+
+
+def _copy_states(conn, session, id_mapping: dict) -> None:
+    """Copy the states table into the new format database."""
+    from homeassistant.components.recorder import models
+
+    num_rows = _count_rows(conn, 'states')
+    print("Converting {} states".format(num_rows))
+
+    cache = {}  # type: dict
+    cursor = conn.cursor()
+    converted = 0
+    for row in cursor.execute("SELECT * FROM states"):  # type: ignore
+        converted += 1
+        session.add(models.States(
+            entity_id=row[1],
+            state=row[2],
+            attributes_id=shared_attributes_id(
+                session, row[3] or '{}', cache),
+            last_changed=ts_to_dt(row[4]),
+            last_updated=ts_to_dt(row[5]),
+            event_id=id_mapping.get(row[6], row[6]),
+            domain=row[7]
+        ))
+        if converted % CHUNK_SIZE == 0:
+            session.commit()
+            print_progress(converted, num_rows)
+    print_progress(converted, num_rows)
+    session.commit()
+    cursor.close()
+
+
 def run(script_args: List) -> int:
     """The actual script body."""
-    # pylint: disable=too-many-locals,invalid-name,too-many-statements
     from sqlalchemy import create_engine
     from sqlalchemy.orm import sessionmaker
     from homeassistant.components.recorder import models
@@ -71,6 +292,12 @@ def run(script_args: List) -> int:
         type=str,
         help="Connect to URI and import (implies --append)"
              "eg: mysql://localhost/homeassistant")
+    parser.add_argument(
+        '--normalize',
+        action='store_true',
+        default=False,
+        help="Move the attributes and event states of the new format "
+             "database into the deduplicated layout")
     parser.add_argument(
         '--script',
         choices=['db_migrator'])
@@ -89,6 +316,18 @@ def run(script_args: List) -> int:
     src_db = '{}/home-assistant.db'.format(config_dir)
     dst_db = '{}/home-assistant_v2.db'.format(config_dir)
 
+    if args.normalize:
+        if not args.uri and not os.path.exists(dst_db):
+            print("Fatal Error: New format database '{}' does not "
+                  "exist".format(dst_db))
+            return 1
+
+        engine = create_engine(args.uri or "sqlite:///{}".format(dst_db),
+                               echo=False)
+        models.Base.metadata.create_all(engine)
+        normalize(sessionmaker(bind=engine)())
+        return 0
+
     if not os.path.exists(src_db):
         print("Fatal Error: Old format database '{}' does not exist".format(
             src_db))
@@ -101,91 +340,14 @@ def run(script_args: List) -> int:
         return 1
 
     conn = sqlite3.connect(src_db)
-    uri = args.uri or "sqlite:///{}".format(dst_db)
-
-    engine = create_engine(uri, echo=False)
+    engine = create_engine(args.uri or "sqlite:///{}".format(dst_db),
+                           echo=False)
     models.Base.metadata.create_all(engine)
-    session_factory = sessionmaker(bind=engine)
-    session = session_factory()
+    session = sessionmaker(bind=engine)()
 
-    append = args.append or args.uri
+    append = bool(args.append or args.uri)
 
-    c = conn.cursor()
-    c.execute("SELECT count(*) FROM recorder_runs")
-    num_rows = c.fetchone()[0]
-    print("Converting {} recorder_runs".format(num_rows))
-    c.close()
-
-    c = conn.cursor()
-    n = 0
-    for row in c.execute("SELECT * FROM recorder_runs"):  # type: ignore
-        n += 1
-        session.add(models.RecorderRuns(
-            start=ts_to_dt(row[1]),
-            end=ts_to_dt(row[2]),
-            closed_incorrect=row[3],
-            created=ts_to_dt(row[4])
-        ))
-        if n % 1000 == 0:
-            session.commit()
-            print_progress(n, num_rows)
-    print_progress(n, num_rows)
-    session.commit()
-    c.close()
-
-    c = conn.cursor()
-    c.execute("SELECT count(*) FROM events")
-    num_rows = c.fetchone()[0]
-    print("Converting {} events".format(num_rows))
-    c.close()
-
-    id_mapping = {}
-
-    c = conn.cursor()
-    n = 0
-    for row in c.execute("SELECT * FROM events"):  # type: ignore
-        n += 1
-        o = models.Events(
-            event_type=row[1],
-            event_data=row[2],
-            origin=row[3],
-            created=ts_to_dt(row[4]),
-            time_fired=ts_to_dt(row[5]),
-        )
-        session.add(o)
-        if append:
-            session.flush()
-            id_mapping[row[0]] = o.event_id
-        if n % 1000 == 0:
-            session.commit()
-            print_progress(n, num_rows)
-    print_progress(n, num_rows)
-    session.commit()
-    c.close()
-
-    c = conn.cursor()
-    c.execute("SELECT count(*) FROM states")
-    num_rows = c.fetchone()[0]
-    print("Converting {} states".format(num_rows))
-    c.close()
-
-    c = conn.cursor()
-    n = 0
-    for row in c.execute("SELECT * FROM states"):  # type: ignore
-        n += 1
-        session.add(models.States(
-            entity_id=row[1],
-            state=row[2],
-            attributes=row[3],
-            last_changed=ts_to_dt(row[4]),
-            last_updated=ts_to_dt(row[5]),
-            event_id=id_mapping.get(row[6], row[6]),
-            domain=row[7]
-        ))
-        if n % 1000 == 0:
-            session.commit()
-            print_progress(n, num_rows)
-    print_progress(n, num_rows)
-    session.commit()
-    c.close()
+    _copy_recorder_runs(conn, session)
+    id_mapping = _copy_events(conn, session, append)
+    _copy_states(conn, session, id_mapping)
     return 0
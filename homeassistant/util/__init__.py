@@ -1,15 +1,17 @@
 """Helper methods for various modules."""
+import bisect
+from collections import deque
 from collections.abc import MutableSet
 from itertools import chain
 import threading
-import queue
+import time
 from datetime import datetime
 import re
 import enum
 import socket
 import random
 import string
-from functools import wraps
+from functools import partial, wraps
 from types import MappingProxyType
 
 from typing import Any, Optional, TypeVar, Callable, Sequence, KeysView, Union
@@ -304,25 +306,157 @@ class Throttle(object):
         return wrapper
 
 
+class Histogram(object):
+    """Count values in buckets with fixed upper bounds."""
+
+    # Upper bounds in seconds, values above the last bound are counted in an
+    # extra overflow bucket.
+    BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30)
+
+    def __init__(self, buckets: Optional[Sequence[float]]=None) -> None:
+        """Initialize the histogram."""
+        self.buckets = tuple(buckets or self.BUCKETS)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value: float) -> None:
+        """Add a value to the histogram."""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, percent: float) -> Optional[float]:
+        """Return the upper bound of the bucket that holds the percentile.
+
+        Values in the overflow bucket are reported as the maximum value seen.
+        """
+        if not self.count:
+            return None
+
+        rank = self.count * percent / 100
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+
+        return self.max
+
+    def as_dict(self) -> dict:
+        """Return a dict representation of the histogram."""
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else None,
+            'max': self.max,
+            'buckets': dict(zip(
+                [str(bound) for bound in self.buckets] + ['inf'],
+                self.counts)),
+        }
+
+
+def _job_target_name(job: Any) -> str:
+    """Return the name of the function a job will call."""
+    target = job[0] if isinstance(job, tuple) and job else job
+
+    while isinstance(target, partial):
+        target = target.func
+
+    return '{}.{}'.format(
+        getattr(target, '__module__', None),
+        getattr(target, '__qualname__', type(target).__name__))
+
+
+class PendingWork(object):
+    """Thread-safe count of work that has been accepted but not finished."""
+
+    def __init__(self):
+        """Initialize the counter."""
+        self._lock = threading.Lock()
+        self._count = 0
+        self._waiters = []
+
+    @property
+    def count(self):
+        """Return the amount of pending work."""
+        return self._count
+
+    def add(self, count=1):
+        """Register new pending work."""
+        with self._lock:
+            self._count += count
+
+    def done(self):
+        """Mark a piece of pending work as finished."""
+        with self._lock:
+            self._count -= 1
+
+            if self._count or not self._waiters:
+                return
+
+            waiters, self._waiters = self._waiters, []
+
+        for waiter in waiters:
+            waiter()
+
+    def run(self, target, *args):
+        """Run target and mark it as finished."""
+        try:
+            target(*args)
+        finally:
+            self.done()
+
+    def notify_idle(self, waiter):
+        """Call waiter as soon as no work is pending.
+
+        The waiter is called right away if there is no pending work, else
+        from the thread that finishes the last piece of work.
+        """
+        with self._lock:
+            if self._count:
+                self._waiters.append(waiter)
+                return
+
+        waiter()
+
+
 class ThreadPool(object):
-    """A priority queue-based thread pool."""
+    """A thread pool with a FIFO lane per job priority."""
 
-    # pylint: disable=too-many-instance-attributes
-    def __init__(self, job_handler, worker_count=0):
+    # pylint: disable=too-many-instance-attributes, too-many-arguments
+    def __init__(self, job_handler, worker_count=0, max_worker_count=None,
+                 pending=None):
         """Initialize the pool.
 
         job_handler: method to be called from worker thread to handle job
         worker_count: number of threads to run that handle jobs
-        busy_callback: method to be called when queue gets too big.
-                       Parameters: worker_count, list of current_jobs,
-                                   pending_jobs_count
+        max_worker_count: number of threads the pool may grow to when all
+                          workers are busy and jobs are queueing up
+        pending: PendingWork instance to register queued jobs with
         """
         self._job_handler = job_handler
+        self._pending = pending
 
         self.worker_count = 0
-        self._work_queue = queue.PriorityQueue()
-        self.current_jobs = []
-        self._quit_task = object()
+        self.max_worker_count = max_worker_count
+
+        self._lock = threading.Lock()
+        self._work_available = threading.Condition(self._lock)
+        self._all_done = threading.Condition(self._lock)
+        # Per priority a deque of (queued at, job), lowest priority first.
+        self._lanes = {}
+        self._priorities = []
+        self._queue_size = 0
+        self._unfinished = 0
+        self._idle = 0
+        self._quit_requests = 0
+        # Per worker thread the (started at, job) it is working on.
+        self._current_jobs = {}
+        # Per job target the wait time and run time histograms.
+        self._stats = {}
 
         self.running = True
 
@@ -332,46 +466,65 @@ class ThreadPool(object):
     @property
     def queue_size(self):
         """Return estimated number of jobs that are waiting to be processed."""
-        return self._work_queue.qsize()
+        return self._queue_size
+
+    @property
+    def current_jobs(self):
+        """Return a list of (started at, job) the workers are running."""
+        with self._lock:
+            return list(self._current_jobs.values())
+
+    @property
+    def job_stats(self):
+        """Return per job target the queue wait and run time histograms."""
+        with self._lock:
+            return {target: {'wait': wait.as_dict(), 'run': run.as_dict()}
+                    for target, (wait, run) in self._stats.items()}
 
     def add_worker(self):
         """Add worker to the thread pool and reset warning limit."""
-        if not self.running:
-            raise RuntimeError("ThreadPool not running")
+        with self._lock:
+            if not self.running:
+                raise RuntimeError("ThreadPool not running")
 
-        threading.Thread(
-            target=self._worker, daemon=True,
-            name='ThreadPool Worker {}'.format(self.worker_count)).start()
-
-        self.worker_count += 1
+            self._start_worker()
 
     def remove_worker(self):
         """Remove worker from the thread pool and reset warning limit."""
-        if not self.running:
-            raise RuntimeError("ThreadPool not running")
+        with self._lock:
+            if not self.running:
+                raise RuntimeError("ThreadPool not running")
 
-        self._work_queue.put(PriorityQueueItem(0, self._quit_task))
-
-        self.worker_count -= 1
+            self._quit_requests += 1
+            self._unfinished += 1
+            self.worker_count -= 1
+            self._work_available.notify()
 
     def add_job(self, priority, job):
         """Add a job to the queue."""
-        if not self.running:
-            raise RuntimeError("ThreadPool not running")
+        with self._lock:
+            if not self.running:
+                raise RuntimeError("ThreadPool not running")
 
-        self._work_queue.put(PriorityQueueItem(priority, job))
+            self._put(priority, job)
+            self._work_available.notify()
 
     def add_many_jobs(self, jobs):
         """Add a list of jobs to the queue."""
-        if not self.running:
-            raise RuntimeError("ThreadPool not running")
+        with self._lock:
+            if not self.running:
+                raise RuntimeError("ThreadPool not running")
+
+            for priority, job in jobs:
+                self._put(priority, job)
 
-        for priority, job in jobs:
-            self._work_queue.put(PriorityQueueItem(priority, job))
+            self._work_available.notify(len(jobs))
 
     def block_till_done(self):
         """Block till current work is done."""
-        self._work_queue.join()
+        with self._lock:
+            while self._unfinished:
+                self._all_done.wait()
 
     def stop(self):
         """Finish all the jobs and stops all the threads."""
@@ -389,39 +542,89 @@ class ThreadPool(object):
         # Wait till all workers have quit
         self.block_till_done()
 
+    def _start_worker(self):
+        """Start a worker thread. Lock has to be held."""
+        threading.Thread(
+            target=self._worker, daemon=True,
+            name='ThreadPool Worker {}'.format(self.worker_count)).start()
+
+        self.worker_count += 1
+
+    def _put(self, priority, job):
+        """Queue a job in the lane of its priority. Lock has to be held."""
+        lane = self._lanes.get(priority)
+
+        if lane is None:
+            lane = self._lanes[priority] = deque()
+            bisect.insort(self._priorities, priority)
+
+        lane.append((time.monotonic(), job))
+        self._queue_size += 1
+        self._unfinished += 1
+
+        if self._pending is not None:
+            self._pending.add()
+
+        # Grow the pool if there are more jobs waiting than the idle workers
+        # plus one job for every worker can take care of.
+        if self.max_worker_count is not None and \
+           self._queue_size > self._idle + self.worker_count and \
+           self.worker_count < self.max_worker_count:
+            self._start_worker()
+
+    def _pop(self):
+        """Take the oldest job of the lowest priority. Lock has to be held."""
+        for priority in self._priorities:
+            lane = self._lanes[priority]
+            if lane:
+                self._queue_size -= 1
+                return lane.popleft()
+
+    def _task_done(self):
+        """Mark a job as done. Lock has to be held."""
+        self._unfinished -= 1
+
+        if not self._unfinished:
+            self._all_done.notify_all()
+
     def _worker(self):
         """Handle jobs for the thread pool."""
-        while True:
-            # Get new item from work_queue
-            job = self._work_queue.get().item
+        ident = threading.get_ident()
 
-            if job is self._quit_task:
-                self._work_queue.task_done()
-                return
+        while True:
+            with self._lock:
+                while not self._quit_requests and not self._queue_size:
+                    self._idle += 1
+                    self._work_available.wait()
+                    self._idle -= 1
 
-            # Add to current running jobs
-            job_log = (utcnow(), job)
-            self.current_jobs.append(job_log)
+                if self._quit_requests:
+                    self._quit_requests -= 1
+                    self._task_done()
+                    return
 
-            # Do the job
-            self._job_handler(job)
+                queued, job = self._pop()
+                self._current_jobs[ident] = (utcnow(), job)
 
-            # Remove from current running job
-            self.current_jobs.remove(job_log)
+            started = time.monotonic()
 
-            # Tell work_queue the task is done
-            self._work_queue.task_done()
+            try:
+                # Do the job
+                self._job_handler(job)
+            finally:
+                finished = time.monotonic()
 
+                with self._lock:
+                    del self._current_jobs[ident]
 
-class PriorityQueueItem(object):
-    """Holds a priority and a value. Used within PriorityQueue."""
+                    name = _job_target_name(job)
+                    stats = self._stats.get(name)
+                    if stats is None:
+                        stats = self._stats[name] = (Histogram(), Histogram())
+                    stats[0].add(started - queued)
+                    stats[1].add(finished - started)
 
-    # pylint: disable=too-few-public-methods
-    def __init__(self, priority, item):
-        """Initialize the queue."""
-        self.priority = priority
-        self.item = item
+                    self._task_done()
 
-    def __lt__(self, other):
-        """Return the ordering."""
-        return self.priority < other.priority
+                if self._pending is not None:
+                    self._pending.done()
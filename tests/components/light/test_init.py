@@ -256,6 +256,84 @@ class TestLight(unittest.TestCase):
         _, data = dev2.last_call('turn_on')
         self.assertEqual({}, data)
 
+    def test_services_batched_per_platform(self):
+        """Test lights of a platform are switched in one batch."""
+        batches = []
+
+        class BatchLight(light.Light):
+            """Light that switches in batches."""
+
+            def __init__(self, name, is_on):
+                """Initialize the light."""
+                self._name = name
+                self._is_on = is_on
+
+            @property
+            def name(self):
+                """Return the name of the light."""
+                return self._name
+
+            @property
+            def should_poll(self):
+                """No polling needed."""
+                return False
+
+            @property
+            def is_on(self):
+                """Return true if light is on."""
+                return self._is_on
+
+            @classmethod
+            def turn_on_many(cls, lights, **kwargs):
+                """Turn on the lights in one batch."""
+                batches.append(('turn_on', [lgt.name for lgt in lights],
+                                kwargs))
+                for lgt in lights:
+                    lgt._is_on = True
+
+            @classmethod
+            def turn_off_many(cls, lights, **kwargs):
+                """Turn off the lights in one batch."""
+                batches.append(('turn_off', [lgt.name for lgt in lights],
+                                kwargs))
+                for lgt in lights:
+                    lgt._is_on = False
+
+        platform = loader.get_component('light.test')
+        platform.init()
+        platform.DEVICES.extend([
+            BatchLight('Batch 1', False),
+            BatchLight('Batch 2', True),
+            BatchLight('Batch 3', False),
+        ])
+        self.assertTrue(
+            setup_component(self.hass, light.DOMAIN,
+                            {light.DOMAIN: {CONF_PLATFORM: 'test'}}))
+
+        dev1, dev2, dev3 = platform.DEVICES[:3]
+
+        light.turn_on(self.hass, brightness=100)
+        self.hass.block_till_done()
+
+        self.assertEqual([('turn_on', ['Batch 1', 'Batch 2', 'Batch 3'],
+                           {light.ATTR_BRIGHTNESS: 100})], batches)
+        for dev in (dev1, dev2, dev3):
+            self.assertEqual({light.ATTR_BRIGHTNESS: 100},
+                             dev.last_call('turn_on')[1])
+
+        batches.clear()
+        light.turn_off(self.hass, 'light.batch_1')
+        light.toggle(self.hass, ['light.batch_1', 'light.batch_2'])
+        self.hass.block_till_done()
+
+        self.assertEqual([
+            ('turn_off', ['Batch 1'], {}),
+            ('turn_off', ['Batch 2'], {}),
+            ('turn_on', ['Batch 1'], {}),
+        ], batches)
+        self.assertEqual([True, False, True],
+                         [dev.is_on for dev in platform.DEVICES[3:]])
+
     def test_broken_light_profiles(self):
         """Test light profiles."""
         platform = loader.get_component('light.test')
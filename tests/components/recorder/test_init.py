@@ -1,11 +1,21 @@
 """The tests for the Recorder component."""
 # pylint: disable=protected-access
 import json
+import os
+import time
 from datetime import datetime, timedelta
 import unittest
+from unittest.mock import MagicMock, patch
 
-from homeassistant.const import MATCH_ALL
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.exc import OperationalError
+
+import homeassistant.core as ha
+from homeassistant.const import (
+    MATCH_ALL, EVENT_STATE_CHANGED, EVENT_TIME_CHANGED)
+import homeassistant.util.dt as dt_util
 from homeassistant.components import recorder
+from homeassistant.remote import JSONEncoder
 from homeassistant.bootstrap import _setup_component
 from tests.common import get_test_home_assistant
 
@@ -84,6 +94,8 @@ class TestRecorder(unittest.TestCase):
                 time_fired=timestamp,
             ))
 
+        self.session.commit()
+
     def test_saving_state(self):
         """Test saving and restoring a state."""
         entity_id = 'test.recorder'
@@ -140,6 +152,327 @@ class TestRecorder(unittest.TestCase):
         assert event.time_fired.replace(microsecond=0) == \
             db_event.time_fired.replace(microsecond=0)
 
+    def test_execute_rolls_back_read_session(self):
+        """Test a failed query rolls back the session it ran on."""
+        failing = MagicMock()
+        failing.__iter__.side_effect = OperationalError('query', {}, None)
+
+        with patch('homeassistant.components.recorder.Session') as session, \
+                patch('homeassistant.components.recorder.ReadSession') \
+                as read_session, \
+                patch('homeassistant.components.recorder.QUERY_RETRY_WAIT',
+                      0):
+            assert [] == recorder.execute(failing)
+
+        assert recorder.RETRIES == read_session.rollback.call_count
+        assert not session.rollback.called
+
+    def test_saving_batch(self):
+        """Test queued events are saved in one transaction."""
+        commits = []
+        commit = recorder._INSTANCE._commit
+
+        def mock_commit(work):
+            """Count the transactions."""
+            commits.append(work)
+            return commit(work)
+
+        with patch.object(recorder._INSTANCE, '_commit', mock_commit):
+            for idx in range(3):
+                self.hass.states.set('test.batch_{}'.format(idx), idx)
+            self.hass.bus.fire('EVENT_TEST')
+
+            self.hass.block_till_done()
+            recorder._INSTANCE.block_till_done()
+
+        assert len(commits) == 1
+
+        states = recorder.query('States').all()
+        assert ['0', '1', '2'] == sorted(state.state for state in states)
+
+        for state in states:
+            event = recorder.query('Events').get(state.event_id)
+            assert event.event_type == EVENT_STATE_CHANGED
+            assert json.loads(event.event_data)['entity_id'] == \
+                state.entity_id
+
+        assert 1 == recorder.query('Events').filter_by(
+            event_type='EVENT_TEST').count()
+
+    def test_saving_shared_attributes(self):
+        """Test states with equal attributes share one attributes row."""
+        attributes = {'unit_of_measurement': 'W', 'friendly_name': 'Power'}
+
+        self.hass.states.set('sensor.power_1', '10', attributes)
+        self.hass.states.set('sensor.power_2', '20', attributes)
+        self.hass.states.set('sensor.power_1', '30', attributes)
+        self.hass.block_till_done()
+        recorder._INSTANCE.block_till_done()
+
+        db_states = recorder.query('States').all()
+
+        assert 3 == len(db_states)
+        assert 1 == len({state.attributes_id for state in db_states})
+        assert 1 == recorder.query('StateAttributes').count()
+        assert [attributes] * 3 == [
+            dict(state.attributes) for state
+            in recorder.execute(recorder.query('States'))]
+
+    def test_saving_state_changed_event(self):
+        """Test state_changed events are restored with their new state."""
+        self.hass.states.set('test.recorder', 'on', {'test_attr': 5})
+        self.hass.block_till_done()
+        recorder._INSTANCE.block_till_done()
+
+        db_event = recorder.query('Events').filter_by(
+            event_type=EVENT_STATE_CHANGED).one()
+
+        assert {'entity_id': 'test.recorder'} == json.loads(
+            db_event.event_data)
+        assert self.hass.states.get('test.recorder').as_dict() == \
+            db_event.to_native().data['new_state']
+
+    def test_saving_statistics(self):
+        """Test numeric states are rolled up per period and kept."""
+        hour = datetime(2016, 1, 1, 10, tzinfo=dt_util.UTC)
+
+        def set_state(state, minutes):
+            with patch('homeassistant.core.dt_util.utcnow',
+                       return_value=hour + timedelta(minutes=minutes)):
+                self.hass.states.set('sensor.power', state)
+            self.hass.block_till_done()
+            recorder._INSTANCE.block_till_done()
+
+        def rollups():
+            return [(row['period'], row['start'], row['count'], row['min'],
+                     row['max'], row['mean'], row['last'])
+                    for row in recorder.execute(recorder.query(
+                        'Statistics').order_by('period', 'start'))]
+
+        set_state('10', 1)
+        set_state('20', 2)
+        set_state('unknown', 7)
+        set_state('30', 8)
+        set_state('40', 61)
+
+        five_minutes = timedelta(minutes=5)
+        next_hour = hour + timedelta(hours=1)
+        assert [
+            (300, hour, 2, 10, 20, 15, 20),
+            (300, hour + five_minutes, 1, 30, 30, 30, 30),
+            (300, next_hour, 1, 40, 40, 40, 40),
+            (3600, hour, 3, 10, 30, 20, 30),
+            (3600, next_hour, 1, 40, 40, 40, 40),
+        ] == rollups()
+
+        # A late state is merged into the stored rollup
+        set_state('50', 30)
+        assert (3600, hour, 4, 10, 50, 27.5, 50) == rollups()[4]
+
+        # Rollups outlive the states
+        recorder._INSTANCE.purge_days = 1
+        with patch('homeassistant.components.recorder.dt_util.utcnow',
+                   return_value=dt_util.utcnow() + timedelta(days=2)):
+            recorder._INSTANCE._purge_old_data()
+        assert 0 == recorder.query('States').count()
+        assert 6 == len(rollups())
+
+    def test_recent_states(self):
+        """Test the latest states of the latest used entities are kept."""
+        rec = recorder._INSTANCE
+        rec.recent = recorder.RecentStates(depth=2, max_entities=2)
+
+        def set_state(entity_id, state):
+            self.hass.states.set(entity_id, state)
+            self.hass.block_till_done()
+            rec.block_till_done()
+
+        for state in ('1', '2', '3'):
+            set_state('test.one', state)
+        set_state('test.two', 'on')
+
+        assert ['2', '3'] == [
+            state.state for state in recorder.recent_states('test.one')]
+
+        # test.two is used least recently and forgotten
+        set_state('test.three', 'on')
+        assert [] == recorder.recent_states('test.two')
+        assert ['2', '3'] == [
+            state.state for state in recorder.recent_states('test.one')]
+
+        # The removal of an entity is only recorded in the database
+        self.hass.states.remove('test.one')
+        self.hass.block_till_done()
+        rec.block_till_done()
+        assert [] == recorder.recent_states('test.one')
+
+        assert ['test.one', 'test.three', 'test.two'] == sorted(
+            recorder.run_information().entity_ids())
+
+    def test_batch_bounded_by_size(self):
+        """Test a batch holds at most batch_size items."""
+        rec = recorder.Recorder(self.hass, purge_days=None, uri='sqlite://',
+                                batch_size=2, commit_interval=10)
+
+        for idx in range(3):
+            rec.queue.put(idx)
+
+        assert [0, 1] == rec._get_batch()
+
+        # A flush closes the batch without waiting for commit_interval
+        rec.queue.put(recorder._FLUSH)
+        assert [2, recorder._FLUSH] == rec._get_batch()
+
+    def test_migrate_schema(self):
+        """Test the new column and index are added to an old states table."""
+        engine = create_engine('sqlite://')
+        engine.execute('CREATE TABLE states (state_id INTEGER PRIMARY KEY, '
+                       'entity_id VARCHAR(255), attributes TEXT, '
+                       'created DATETIME)')
+
+        recorder.migrate_schema(engine)
+
+        assert 'attributes_id' in [
+            column['name'] for column
+            in inspect(engine).get_columns('states')]
+        assert 'states__entity_created' in [
+            index['name'] for index
+            in inspect(engine).get_indexes('states')]
+
+    def test_queue_overflow_drop(self):
+        """Test events that do not fit in the queue are dropped."""
+        rec = recorder.Recorder(self.hass, purge_days=None, uri='sqlite://',
+                                queue_size=2)
+
+        for idx in range(3):
+            rec.event_listener(ha.Event('test_event', {'idx': idx}))
+        rec.event_listener(ha.Event(EVENT_TIME_CHANGED))
+
+        assert [0, 1] == [rec.queue.get().data['idx'] for _ in range(2)]
+        assert {
+            'queue_depth': 0,
+            'queue_size': 2,
+            'spilling': False,
+            'dropped': 1,
+            'spilled': 0,
+            'replayed': 0,
+        } == rec.queue_stats
+
+    def test_filters(self):
+        """Test excluded events are not queued."""
+        config = recorder.CONFIG_SCHEMA({recorder.DOMAIN: {
+            recorder.CONF_INCLUDE: {
+                recorder.CONF_DOMAINS: ['sensor', 'light'],
+                recorder.CONF_ENTITIES: 'switch.included',
+            },
+            recorder.CONF_EXCLUDE: {
+                recorder.CONF_DOMAINS: 'light',
+                recorder.CONF_ENTITIES: 'sensor.excluded',
+                recorder.CONF_EVENT_TYPES: 'call_service',
+            },
+        }})[recorder.DOMAIN]
+        rec = recorder.Recorder(
+            self.hass, purge_days=None, uri='sqlite://',
+            include=config[recorder.CONF_INCLUDE],
+            exclude=config[recorder.CONF_EXCLUDE])
+
+        for entity_id in ('sensor.included', 'sensor.excluded',
+                          'switch.included', 'switch.other', 'light.other'):
+            rec.event_listener(ha.Event(EVENT_STATE_CHANGED, {
+                'entity_id': entity_id}))
+        for event_type in ('call_service', 'test_event', EVENT_TIME_CHANGED):
+            rec.event_listener(ha.Event(event_type))
+
+        queued = []
+        while not rec.queue.empty():
+            event = rec.queue.get()
+            queued.append(event.data.get('entity_id', event.event_type))
+
+        assert ['sensor.included', 'switch.included', 'test_event'] == queued
+
+    def test_queue_overflow_spill(self):
+        """Test spilled events are recorded once the queue has room."""
+        rec = recorder._INSTANCE
+        rec.spill_path = self.hass.config.path('test_recorder.spill')
+        rec.overflow = recorder.OVERFLOW_SPILL
+        rec.queue_size = 0
+
+        self.hass.states.set('test.spilled', 'on', {'test_attr': 5})
+        self.hass.bus.fire('EVENT_TEST')
+        self.hass.block_till_done()
+        rec._wait_for_spills()
+
+        assert 0 == rec.queue.qsize()
+        assert 2 == rec.spilled
+        assert os.path.isfile(rec.spill_path)
+
+        rec.queue_size = recorder.DEFAULT_QUEUE_SIZE
+        rec.block_till_done()
+
+        for _ in range(50):
+            if rec.replayed == 2:
+                break
+            time.sleep(0.1)
+
+        assert not os.path.isfile(rec.spill_path)
+        assert [self.hass.states.get('test.spilled')] == recorder.execute(
+            recorder.query('States'))
+        assert 1 == recorder.query('Events').filter_by(
+            event_type='EVENT_TEST').count()
+
+    def test_shutdown_stops_spill_worker(self):
+        """Test the spill worker is shut down with the recorder."""
+        rec = recorder._INSTANCE
+        rec.spill_path = self.hass.config.path('test_recorder.spill')
+        rec.overflow = recorder.OVERFLOW_SPILL
+        rec.queue_size = 0
+
+        self.hass.bus.fire('EVENT_TEST')
+        self.hass.block_till_done()
+        rec._wait_for_spills()
+        executor = rec._spill_executor
+
+        rec.shutdown(None)
+        # Let tearDown shut the stopped recorder down again
+        recorder._INSTANCE = rec
+        os.remove(rec.spill_path)
+
+        with self.assertRaises(RuntimeError):
+            executor.submit(lambda: None)
+
+        # Events that can not be spilled anymore are dropped
+        rec.event_listener(ha.Event('EVENT_TEST'))
+        assert 1 == rec.spilled
+        assert 1 == rec.dropped
+        assert 0 == rec._spill_pending
+
+    def test_interrupted_replay(self):
+        """Test a journal left by a replay goes before the next journal."""
+        rec = recorder._INSTANCE
+        rec.spill_path = self.hass.config.path('test_recorder.spill')
+
+        for path, event_type in ((rec.spill_path + '.replay', 'first'),
+                                 (rec.spill_path, 'second')):
+            with open(path, 'w') as journal:
+                journal.write(json.dumps(
+                    ha.Event(event_type).as_dict(), cls=JSONEncoder) + '\n')
+
+        rec._spilling = True
+        rec.block_till_done()
+
+        for _ in range(50):
+            if rec.replayed == 2:
+                break
+            time.sleep(0.1)
+
+        assert not os.path.isfile(rec.spill_path)
+        assert not os.path.isfile(rec.spill_path + '.replay')
+        events = recorder.get_model('Events')
+        assert ['first', 'second'] == [
+            row.event_type for row in recorder.query('Events').filter(
+                events.event_type.in_(['first', 'second'])).order_by(
+                    events.event_id)]
+
     def test_purge_old_states(self):
         """Test deleting old states."""
         self._add_test_states()
@@ -168,6 +501,77 @@ class TestRecorder(unittest.TestCase):
         # now we should only have 3 events left
         self.assertEqual(events.count(), 3)
 
+    @patch('homeassistant.components.recorder.PURGE_CHUNK_SIZE', 2)
+    def test_purge_in_chunks(self):
+        """Test purging deletes rows in chunks and reports statistics."""
+        self._add_test_states()
+        self._add_test_events()
+        state_attributes = recorder.get_model('StateAttributes')
+        self.session.add(state_attributes(hash='unused', shared_attrs='{}'))
+        self.session.commit()
+
+        recorder._INSTANCE.purge_days = 4
+        steps = list(recorder._INSTANCE._purge_steps())
+
+        # 3 states, 2 events and 1 attributes row, a chunk holds 2 rows
+        assert len(steps) >= 5
+        assert recorder.query('States').count() == 2
+        assert recorder.query('StateAttributes').count() == 0
+
+        stats = recorder._INSTANCE.last_purge
+        assert stats['states'] == 3
+        assert stats['events'] == 2
+        assert stats['attributes'] == 1
+        assert stats['lock_seconds'] <= stats['seconds']
+        assert stats['rows_per_second'] > 0
+
+    @patch('homeassistant.components.recorder.PURGE_CHUNK_SIZE', 1)
+    def test_purge_forgets_deleted_attributes(self):
+        """Test a batch in between purge chunks does not use deleted rows."""
+        rec = recorder._INSTANCE
+        attributes = {'unit_of_measurement': 'W'}
+        state_attributes = recorder.get_model('StateAttributes')
+
+        self.hass.states.set('sensor.power', '10', attributes)
+        self.hass.block_till_done()
+        rec.block_till_done()
+
+        # The attributes row is unused but its id is still cached
+        self.session.query(recorder.get_model('States')).delete()
+        self.session.add(state_attributes(hash='unused', shared_attrs='{}'))
+        self.session.commit()
+
+        rec.purge_days = 4
+        steps = rec._purge_steps()
+        while recorder.query(state_attributes).count() == 2:
+            next(steps)
+
+        rec._save_batch([ha.Event(EVENT_STATE_CHANGED, {
+            'entity_id': 'sensor.power',
+            'new_state': ha.State('sensor.power', '20', attributes)})])
+        for _ in steps:
+            pass
+
+        assert [attributes] == [
+            dict(state.attributes) for state
+            in recorder.execute(recorder.query('States'))]
+
+    def test_purge_between_batches(self):
+        """Test the recorder thread purges when asked through its queue."""
+        self._add_test_states()
+        recorder._INSTANCE.purge_days = 4
+
+        recorder._INSTANCE.queue.put(recorder._PURGE)
+        recorder._INSTANCE.block_till_done()
+
+        for _ in range(50):
+            if recorder._INSTANCE.last_purge is not None:
+                break
+            time.sleep(0.1)
+
+        assert recorder._INSTANCE.last_purge['states'] == 3
+        assert recorder.query('States').count() == 2
+
     def test_purge_disabled(self):
         """Test leaving purge_days disabled."""
         self._add_test_states()
@@ -186,3 +590,62 @@ class TestRecorder(unittest.TestCase):
         # we should have all of our states still
         self.assertEqual(states.count(), 5)
         self.assertEqual(events.count(), 5)
+
+
+class TestRecorderSQLiteFile(unittest.TestCase):
+    """Test the recorder with a SQLite database file."""
+
+    def setUp(self):  # pylint: disable=invalid-name
+        """Setup things to be run when tests are started."""
+        self.hass = get_test_home_assistant()
+        _setup_component(self.hass, recorder.DOMAIN, {
+            recorder.DOMAIN: {recorder.CONF_DB_URL: 'sqlite:///{}'.format(
+                self.hass.config.path('test_recorder.db'))}})
+        self.hass.start()
+        recorder._verify_instance()
+
+    def tearDown(self):  # pylint: disable=invalid-name
+        """Stop everything that was started."""
+        recorder._INSTANCE.shutdown(None)
+        self.hass.stop()
+
+        for suffix in ('', '-wal', '-shm'):
+            path = self.hass.config.path('test_recorder.db' + suffix)
+            if os.path.isfile(path):
+                os.remove(path)
+
+    def test_connections_tuned(self):
+        """Test the writer uses WAL and the readers can not write."""
+        engine = recorder._INSTANCE.engine
+
+        assert 'wal' == engine.execute('PRAGMA journal_mode').scalar()
+        assert 1 == engine.execute('PRAGMA synchronous').scalar()
+        assert 2 == engine.execute('PRAGMA auto_vacuum').scalar()
+        assert 0 == engine.execute('PRAGMA query_only').scalar()
+        assert 1 == recorder.ReadSession.execute(
+            'PRAGMA query_only').scalar()
+
+    def test_purge_frees_pages(self):
+        """Test purging gives free pages back without a full vacuum."""
+        self.hass.states.set('test.recorder', 'on', {'data': 'x' * 100000})
+        self.hass.block_till_done()
+        recorder._INSTANCE.block_till_done()
+        engine = recorder._INSTANCE.engine
+
+        with patch('homeassistant.components.recorder.dt_util.utcnow',
+                   return_value=dt_util.utcnow() + timedelta(days=10)):
+            recorder._INSTANCE.purge_days = 4
+            recorder._INSTANCE._purge_old_data()
+
+        assert 0 == recorder.query('StateAttributes').count()
+        assert 0 == engine.execute('PRAGMA freelist_count').scalar()
+
+    def test_read_committed_states(self):
+        """Test the read connections see the states the recorder wrote."""
+        self.hass.states.set('test.recorder', 'on')
+        self.hass.block_till_done()
+        recorder._INSTANCE.block_till_done()
+
+        states = recorder.execute(recorder.query('States'))
+
+        assert ['on'] == [state.state for state in states]
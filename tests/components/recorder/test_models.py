@@ -1,4 +1,5 @@
 """The tests for the Recorder component."""
+import json
 import unittest
 from datetime import datetime
 
@@ -47,6 +48,17 @@ class TestEvents(unittest.TestCase):
         })
         assert event == Events.from_event(event).to_native()
 
+    def test_from_state_changed_event(self):
+        """Test the states are not stored with a state_changed event."""
+        event = ha.Event(EVENT_STATE_CHANGED, {
+            'entity_id': 'sensor.temperature',
+            'old_state': ha.State('sensor.temperature', '18'),
+            'new_state': ha.State('sensor.temperature', '19'),
+        })
+
+        assert {'entity_id': 'sensor.temperature'} == \
+            Events.from_event(event).to_native().data
+
 
 class TestStates(unittest.TestCase):
     """Test States model."""
@@ -78,6 +90,16 @@ class TestStates(unittest.TestCase):
         assert db_state.last_changed == event.time_fired
         assert db_state.last_updated == event.time_fired
 
+    def test_without_attributes(self):
+        """Test a row without any attributes has empty attributes."""
+        now = datetime(2016, 7, 9, 11, 0, 0, tzinfo=dt.UTC)
+        db_state = States(entity_id='sensor.temperature', state='18',
+                          attributes=None, last_changed=now,
+                          last_updated=now)
+
+        assert {} == json.loads(db_state.to_json())['attributes']
+        assert {} == db_state.to_native().attributes
+
 
 class TestRecorderRuns(unittest.TestCase):
     """Test recorder run model."""
@@ -5,7 +5,7 @@ import json
 import tempfile
 import time
 import unittest
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
 import requests
 
@@ -242,6 +242,35 @@ class TestAPI(unittest.TestCase):
                            headers=HA_HEADERS)
         self.assertEqual(hass.config.components, req.json())
 
+    def test_api_get_worker_pool(self):
+        """Test the return of the worker pool statistics."""
+        hass.bus.fire('test_event')
+        hass.block_till_done()
+
+        req = requests.get(_url(const.URL_API_WORKER_POOL),
+                           headers=HA_HEADERS)
+        data = req.json()
+
+        self.assertEqual(hass.pool.worker_count, data['worker_count'])
+        self.assertIn('queue_size', data)
+        self.assertTrue(any(
+            '<lambda>' in target and stats['run']['count'] >= 1
+            for target, stats in data['jobs'].items()))
+
+    def test_api_get_recorder_queue(self):
+        """Test the return of the recorder queue statistics."""
+        req = requests.get(_url(const.URL_API_RECORDER_QUEUE),
+                           headers=HA_HEADERS)
+        self.assertEqual(404, req.status_code)
+
+        stats = {'queue_depth': 3, 'dropped': 1, 'spilled': 2}
+        with patch('homeassistant.components.recorder.get_instance',
+                   return_value=MagicMock(queue_stats=stats)):
+            req = requests.get(_url(const.URL_API_RECORDER_QUEUE),
+                               headers=HA_HEADERS)
+        self.assertEqual(200, req.status_code)
+        self.assertEqual(stats, req.json())
+
     def test_api_get_error_log(self):
         """Test the return of the error log."""
         test_content = 'Test String°'
@@ -280,6 +309,24 @@ class TestAPI(unittest.TestCase):
 
             self.assertEqual(local, serv_domain["services"])
 
+    def test_api_get_services_stats(self):
+        """Test the services come with their call statistics."""
+        hass.services.register("test_domain", "limited", lambda call: None,
+                               max_concurrency=2, max_queue=5)
+        hass.services.call("test_domain", "limited", blocking=True)
+
+        req = requests.get(_url(const.URL_API_SERVICES),
+                           headers=HA_HEADERS)
+
+        stats = next(serv_domain["stats"] for serv_domain in req.json()
+                     if serv_domain["domain"] == "test_domain")["limited"]
+
+        self.assertEqual(2, stats["max_concurrency"])
+        self.assertEqual(5, stats["max_queue"])
+        self.assertEqual(0, stats["in_flight"])
+        self.assertEqual(0, stats["queued"])
+        self.assertEqual(1, stats["calls"])
+
     def test_api_call_service_no_data(self):
         """Test if the API allows us to call a service."""
         test_value = []
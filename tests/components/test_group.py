@@ -328,7 +328,7 @@ class TestComponentsGroup(unittest.TestCase):
 
         assert sorted(self.hass.states.entity_ids()) == \
             ['group.empty_group', 'group.second_group', 'group.test_group']
-        assert self.hass.bus.listeners['state_changed'] == 3
+        assert sum(self.hass.states.entity_listeners.values()) == 3
 
         with patch('homeassistant.config.load_yaml_config_file', return_value={
                 'group': {
@@ -341,4 +341,4 @@ class TestComponentsGroup(unittest.TestCase):
             self.hass.block_till_done()
 
         assert self.hass.states.entity_ids() == ['group.hello']
-        assert self.hass.bus.listeners['state_changed'] == 1
+        assert sum(self.hass.states.entity_listeners.values()) == 1
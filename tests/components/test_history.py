@@ -1,6 +1,7 @@
 """The tests the History component."""
 # pylint: disable=protected-access,too-many-public-methods
 from datetime import timedelta
+import json
 import unittest
 from unittest.mock import patch, sentinel
 
@@ -8,6 +9,7 @@ from homeassistant.bootstrap import setup_component
 import homeassistant.core as ha
 import homeassistant.util.dt as dt_util
 from homeassistant.components import history, recorder
+from homeassistant.remote import JSONEncoder
 
 from tests.common import (
     mock_http_component, mock_state_change_event, get_test_home_assistant)
@@ -204,3 +206,171 @@ class TestComponentHistory(unittest.TestCase):
 
         hist = history.get_significant_states(zero, four)
         assert states == hist
+
+    def test_stream_significant_states(self):
+        """Test streaming the significant states as JSON."""
+        self.init_recorder()
+        zero = dt_util.utcnow()
+        one = zero + timedelta(seconds=1)
+        two = one + timedelta(seconds=1)
+
+        def set_state(entity_id, state, **kwargs):
+            self.hass.states.set(entity_id, state, **kwargs)
+            self.wait_recording_done()
+
+        # Before the period, becomes the start state of the light
+        set_state('light.kitchen', 'on', attributes={'brightness': 100})
+
+        with patch('homeassistant.components.recorder.dt_util.utcnow',
+                   return_value=two):
+            for idx in range(3):
+                set_state('sensor.power', idx, attributes={'unit': 'W'})
+            set_state('script.cannot_cancel_this_one', 'off')
+            set_state('script.can_cancel_this_one', 'on',
+                      attributes={'can_cancel': True})
+
+        with patch('homeassistant.components.history.STREAM_BUFFER_SIZE',
+                   2):
+            pieces = list(history.stream_significant_states(one))
+
+        self.assertLess(1, len(pieces))
+
+        expected = json.loads(json.dumps(
+            list(history.get_significant_states(one).values()),
+            cls=JSONEncoder))
+
+        def key(entity_states):
+            """Sort the lists by entity."""
+            return entity_states[0]['entity_id']
+
+        self.assertEqual(sorted(expected, key=key),
+                         sorted(json.loads(''.join(pieces)), key=key))
+
+    def test_stream_downsampled_states(self):
+        """Test aggregating numeric states and compressing other states."""
+        self.init_recorder()
+        start = dt_util.utcnow()
+        end = start + timedelta(minutes=2)
+        power = 'sensor.power'
+
+        def set_state(entity_id, state, minutes, **kwargs):
+            with patch('homeassistant.core.dt_util.utcnow',
+                       return_value=start + timedelta(minutes=minutes)):
+                self.hass.states.set(entity_id, state, **kwargs)
+            self.wait_recording_done()
+
+        for idx, value in enumerate((10, 20, 30)):
+            set_state(power, value, 0.1 * (idx + 1),
+                      attributes={'unit': 'W'})
+        set_state(power, 'unavailable', 0.5)
+        set_state(power, 'unavailable', 0.6, attributes={'reason': 'lost'})
+        set_state(power, 40, 1.1, attributes={'unit': 'kW'})
+        set_state(power, 60, 1.2, attributes={'unit': 'kW'})
+
+        states = json.loads(''.join(history.stream_significant_states(
+            start, end, power, max_points=2)))[0]
+
+        # The first bucket ends unavailable, the second with numbers
+        self.assertEqual(
+            [('unavailable', 3, None, None, None), ('50.0', None, 40, 50, 60)],
+            [(state['state'], state.get('changes'), state.get('min'),
+              state.get('mean'), state.get('max')) for state in states])
+        self.assertEqual(start.isoformat(), states[0]['last_changed'])
+        self.assertEqual((start + timedelta(minutes=1)).isoformat(),
+                         states[1]['last_updated'])
+        self.assertEqual({'unit': 'kW'}, states[1]['attributes'])
+
+    def test_stream_downsampled_flapping_states(self):
+        """Test a flapping entity returns at most max_points states."""
+        self.init_recorder()
+        # The start state has to be recorded after the recorder started
+        start = dt_util.utcnow() + timedelta(minutes=2)
+        end = start + timedelta(minutes=60)
+        motion = 'binary_sensor.motion'
+
+        def set_state(state, minutes):
+            with patch('homeassistant.core.dt_util.utcnow',
+                       return_value=start + timedelta(minutes=minutes)):
+                self.hass.states.set(motion, state)
+            self.wait_recording_done()
+
+        # Before the period, becomes the start state
+        set_state('off', -1)
+        # Flips every minute from the second bucket to the end of the period
+        for minute in range(16, 61):
+            set_state('on' if minute % 2 else 'off', minute)
+
+        states = json.loads(''.join(history.stream_significant_states(
+            start, end, motion, max_points=4)))[0]
+
+        # The start state and the last state of every other bucket
+        self.assertEqual(
+            [('off', None, start), ('on', 13, start + timedelta(minutes=15)),
+             ('off', 15, start + timedelta(minutes=30)),
+             ('on', 15, start + timedelta(minutes=45))],
+            [(state['state'], state.get('changes'),
+              dt_util.parse_datetime(state['last_changed']))
+             for state in states])
+
+        states = json.loads(''.join(history.stream_significant_states(
+            start, end, motion, max_points=1)))[0]
+        self.assertEqual([('on', 43)], [
+            (state['state'], state['changes']) for state in states])
+
+    def test_get_statistics(self):
+        """Test getting the rollups of numeric states."""
+        self.init_recorder()
+        start = dt_util.utcnow().replace(minute=0, second=0, microsecond=0) \
+            - timedelta(hours=3)
+
+        for hours, state in enumerate((10, 20, 30)):
+            with patch('homeassistant.core.dt_util.utcnow',
+                       return_value=start + timedelta(hours=hours)):
+                self.hass.states.set('sensor.power', state)
+            self.wait_recording_done()
+
+        stats = history.get_statistics(
+            start + timedelta(minutes=30), start + timedelta(hours=2),
+            'sensor.power')
+
+        self.assertEqual(
+            [(start, 10), (start + timedelta(hours=1), 20)],
+            [(rollup['start'], rollup['mean'])
+             for rollup in stats['sensor.power']])
+        self.assertEqual(3, len(
+            history.get_statistics(start, period=300)['sensor.power']))
+
+    def test_recent_states(self):
+        """Test history of recent states is served without querying."""
+        self.init_recorder()
+        entity_id = 'sensor.power'
+
+        for idx in range(7):
+            self.hass.states.set(entity_id, idx, {'unit': 'W'})
+            self.wait_recording_done()
+
+            if idx == 2:
+                middle = dt_util.utcnow()
+
+        def query_history():
+            """Query recent history of the entity."""
+            return (history.last_5_states(entity_id),
+                    history.get_state(middle, entity_id),
+                    history.get_significant_states(middle, None, entity_id),
+                    json.loads(''.join(history.stream_significant_states(
+                        middle, None, entity_id))))
+
+        with patch('homeassistant.components.recorder.query',
+                   side_effect=AssertionError('Queried the database')):
+            recent = query_history()
+
+        self.assertEqual(['6', '5', '4', '3', '2'],
+                         [state.state for state in recent[0]])
+        self.assertEqual('2', recent[1].state)
+        self.assertEqual(['2', '3', '4', '5', '6'],
+                         [state.state for state
+                          in recent[2][entity_id]])
+
+        # Without recent states the database has the same answers
+        recorder._INSTANCE.recent.clear()
+        self.assertEqual(recent, query_history())
@@ -436,3 +436,72 @@ def test_enum():
         schema('value3')
 
     TestEnum['value1']
+
+
+def test_memoized_schema():
+    """Test memoized schema remembers valid results."""
+    calls = []
+
+    def validator(value):
+        """Count the validations."""
+        calls.append(value)
+        return vol.Schema({'brightness': vol.Coerce(int)})(value)
+
+    schema = cv.MemoizedSchema(validator, maxsize=2)
+
+    assert schema({'brightness': '100'}) == {'brightness': 100}
+    assert schema({'brightness': '100'}) == {'brightness': 100}
+    assert len(calls) == 1
+
+    # Results are copied so callers can not change the remembered result
+    schema({'brightness': '100'})['brightness'] = 0
+    assert schema({'brightness': '100'}) == {'brightness': 100}
+
+    # Equal values of a different type are validated separately
+    schema({'brightness': 1})
+    schema({'brightness': True})
+    assert len(calls) == 3
+
+    # Least recently used result was evicted
+    schema({'brightness': '100'})
+    assert len(calls) == 4
+
+    for _ in range(2):
+        with pytest.raises(vol.Invalid):
+            schema({'brightness': 'high'})
+    assert len(calls) == 6
+
+    assert schema.cache_info() == {
+        'hits': 3,
+        'misses': 6,
+        'hit_rate': 3 / 9,
+        'maxsize': 2,
+        'currsize': 2,
+    }
+
+    # Nested values and templates are not shared between calls
+    schema = cv.MemoizedSchema(cv.SERVICE_SCHEMA)
+    payload = {
+        'service': 'light.turn_on',
+        'entity_id': ['light.a', 'light.b'],
+        'data': {'rgb': [1, 2, 3]},
+        'data_template': {'brightness': '{{ 100 }}'},
+    }
+    result = schema(payload)
+    result['entity_id'].append('light.evil')
+    result['data']['rgb'][0] = 99
+    again = schema(payload)
+    assert again['entity_id'] == ['light.a', 'light.b']
+    assert again['data']['rgb'] == [1, 2, 3]
+    assert (again['data_template']['brightness'] is not
+            result['data_template']['brightness'])
+    assert schema.cache_info()['hits'] == 1
+
+    # Unhashable input is validated every time
+    schema = cv.MemoizedSchema(lambda value: value)
+    schema({'entity_id': {'light.kitchen'}})
+    schema({'entity_id': {'light.kitchen'}})
+    assert schema.cache_info()['misses'] == 2
+
+    schema.cache_clear()
+    assert schema.cache_info()['currsize'] == 0
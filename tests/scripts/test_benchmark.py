@@ -0,0 +1,41 @@
+"""Test benchmark script."""
+from io import StringIO
+import json
+import logging
+import unittest
+from unittest.mock import patch
+
+import homeassistant.scripts.benchmark as benchmark
+
+
+class TestBenchmark(unittest.TestCase):
+    """Test the benchmark script."""
+
+    def setUp(self):  # pylint: disable=invalid-name
+        """Remember the log level the script changes."""
+        self.level = logging.getLogger().level
+
+    def tearDown(self):  # pylint: disable=invalid-name
+        """Restore the log level."""
+        logging.getLogger().setLevel(self.level)
+
+    def test_run_all(self):
+        """Test all benchmarks run and report JSON."""
+        argv = ['hass', '--script', 'benchmark', '--events', '20',
+                '--listeners', '2', '--entities', '10', '--calls', '5',
+                '--renders', '5']
+
+        with patch('sys.argv', argv), \
+                patch('sys.stdout', new_callable=StringIO) as stdout:
+            self.assertEqual(0, benchmark.run(argv[3:]))
+
+        result = json.loads(stdout.getvalue())
+
+        self.assertEqual(sorted(benchmark.BENCHMARKS),
+                         sorted(result['benchmarks']))
+        self.assertEqual(
+            20, result['benchmarks']['fire_event_thread']['events'])
+        self.assertEqual(5, result['benchmarks']['service_call']['calls'])
+        self.assertEqual(
+            sorted(benchmark.TEMPLATES),
+            sorted(result['benchmarks']['template_render']))
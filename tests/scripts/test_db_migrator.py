@@ -0,0 +1,78 @@
+"""Test db_migrator script."""
+from io import StringIO
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from homeassistant.components.recorder import models
+import homeassistant.scripts.db_migrator as db_migrator
+
+
+class TestDbMigrator(unittest.TestCase):
+    """Test the db_migrator script."""
+
+    def setUp(self):  # pylint: disable=invalid-name
+        """Create an old format database."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.config_dir = self.tmp_dir.name
+
+        conn = sqlite3.connect(
+            os.path.join(self.config_dir, 'home-assistant.db'))
+        conn.execute(
+            "CREATE TABLE recorder_runs (run_id INTEGER PRIMARY KEY, "
+            "start REAL, end REAL, closed_incorrect INTEGER, created REAL)")
+        conn.execute(
+            "CREATE TABLE events (event_id INTEGER PRIMARY KEY, "
+            "event_type TEXT, event_data TEXT, origin TEXT, created REAL, "
+            "time_fired REAL)")
+        conn.execute(
+            "CREATE TABLE states (state_id INTEGER PRIMARY KEY, "
+            "entity_id TEXT, state TEXT, attributes TEXT, "
+            "last_changed REAL, last_updated REAL, event_id INTEGER, "
+            "domain TEXT)")
+        conn.execute(
+            "INSERT INTO recorder_runs VALUES (1, 1000, 2000, 0, 1000)")
+        for event_id, attributes in ((1, '{"unit": "W"}'), (2, None)):
+            conn.execute(
+                "INSERT INTO events VALUES (?, ?, ?, 'LOCAL', ?, ?)",
+                (event_id, 'state_changed', json.dumps({
+                    'entity_id': 'sensor.power',
+                    'new_state': {'state': '5'}}),
+                 1000 + event_id, 1000 + event_id))
+            conn.execute(
+                "INSERT INTO states VALUES (?, 'sensor.power', '5', ?, ?, ?, "
+                "?, 'sensor')",
+                (event_id, attributes, 1000 + event_id, 1000 + event_id,
+                 event_id))
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):  # pylint: disable=invalid-name
+        """Remove the databases."""
+        self.tmp_dir.cleanup()
+
+    def test_migrate_states_without_attributes(self):
+        """Test legacy states rows with NULL attributes are migrated."""
+        argv = ['hass', '--script', 'db_migrator', '-c', self.config_dir]
+
+        with patch('sys.argv', argv), patch('sys.stdout', new=StringIO()):
+            self.assertEqual(0, db_migrator.run(argv[3:]))
+
+        engine = create_engine('sqlite:///{}'.format(
+            os.path.join(self.config_dir, 'home-assistant_v2.db')))
+        session = sessionmaker(bind=engine)()
+        states = session.query(models.States).order_by(
+            models.States.state_id).all()
+
+        self.assertEqual(
+            [{'unit': 'W'}, {}],
+            [state.to_native().attributes for state in states])
+        self.assertEqual(
+            {'entity_id': 'sensor.power'},
+            json.loads(session.query(models.Events).first().event_data))
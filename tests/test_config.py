@@ -277,6 +277,26 @@ class TestConfig(unittest.TestCase):
         assert config.units.name == CONF_UNIT_SYSTEM_IMPERIAL
         assert config.time_zone.zone == 'America/New_York'
 
+    def test_loading_configuration_coalesce(self):
+        """Test coalescing windows are handed to the state machine."""
+        hass = mock.Mock(config=Config())
+
+        config_util.process_ha_core_config(hass, {
+            'latitude': 60,
+            'longitude': 50,
+            'elevation': 25,
+            'name': 'Huis',
+            CONF_UNIT_SYSTEM: CONF_UNIT_SYSTEM_METRIC,
+            'time_zone': 'America/New_York',
+            'coalesce': {
+                'sensor': 2,
+                'sensor.power': '00:00:05',
+            },
+        })
+
+        assert sorted(hass.states.coalesce.mock_calls) == [
+            mock.call('sensor', 2), mock.call('sensor.power', 5)]
+
     def test_loading_configuration_temperature_unit(self):
         """Test backward compatibility when loading core config."""
         config = Config()
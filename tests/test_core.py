@@ -2,6 +2,8 @@
 # pylint: disable=protected-access,too-many-public-methods
 # pylint: disable=too-few-public-methods
 import asyncio
+import json
+import threading
 import unittest
 from unittest.mock import patch, MagicMock
 from datetime import datetime, timedelta
@@ -11,6 +13,8 @@ import pytz
 import homeassistant.core as ha
 from homeassistant.exceptions import InvalidEntityFormatError
 import homeassistant.util.dt as dt_util
+from homeassistant.util.async import (
+    run_callback_threadsafe, run_coroutine_threadsafe)
 from homeassistant.util.unit_system import (METRIC_SYSTEM)
 from homeassistant.const import (
     __version__, EVENT_STATE_CHANGED, ATTR_FRIENDLY_NAME, CONF_UNIT_SYSTEM)
@@ -60,6 +64,23 @@ def test_async_add_job_add_threaded_job_to_pool(mock_iscoro):
     assert len(hass.add_job.mock_calls) == 1
 
 
+def test_async_add_job_schedule_coroutine():
+    """Test that we schedule coroutine objects and track the task."""
+    hass = MagicMock()
+
+    @asyncio.coroutine
+    def job():
+        pass
+
+    coro = job()
+    task = ha.HomeAssistant.async_add_job(hass, coro)
+    hass.loop.create_task.assert_called_once_with(coro)
+    assert task is hass.loop.create_task.return_value
+    assert len(hass.async_track_task.mock_calls) == 1
+    assert len(hass.add_job.mock_calls) == 0
+    coro.close()
+
+
 def test_async_run_job_calls_callback():
     """Test that the callback annotation is respected."""
     hass = MagicMock()
@@ -97,6 +118,41 @@ class TestHomeAssistant(unittest.TestCase):
         """Stop everything that was started."""
         self.hass.stop()
 
+    def test_block_till_done_waits_for_pool_and_loop(self):
+        """Test block_till_done waits for jobs that schedule more work."""
+        calls = []
+        event = threading.Event()
+
+        @ha.callback
+        def async_listener(evt):
+            """Hand work to the worker pool."""
+            self.hass.async_add_job(thread_listener, evt)
+
+        def thread_listener(evt):
+            """Block until released and fire the next event."""
+            event.wait()
+            self.hass.bus.fire('test_event_2')
+
+        @asyncio.coroutine
+        def coro_listener(evt):
+            """Record the call after yielding to the loop."""
+            yield from asyncio.sleep(0, loop=self.hass.loop)
+            calls.append(evt)
+
+        self.hass.bus.listen('test_event', async_listener)
+        self.hass.bus.listen('test_event_2', coro_listener)
+        self.hass.bus.fire('test_event')
+        threading.Timer(0.1, event.set).start()
+        self.hass.block_till_done()
+
+        self.assertEqual(1, len(calls))
+        self.assertEqual(0, self.hass.pending.count)
+
+    def test_block_till_done_when_idle(self):
+        """Test block_till_done returns when nothing is pending."""
+        self.assertEqual(0, self.hass.pending.count)
+        self.hass.block_till_done()
+
     # This test hangs on `loop.add_signal_handler`
     # def test_start_and_sigterm(self):
     #     """Start the test."""
@@ -266,6 +322,66 @@ class TestEventBus(unittest.TestCase):
         self.hass.block_till_done()
         assert len(coroutine_calls) == 1
 
+    def test_match_all_listener_added_after_fire(self):
+        """Test that MATCH_ALL listeners join already dispatched events."""
+        calls = []
+
+        @ha.callback
+        def listener(event):
+            calls.append(event.event_type)
+
+        self.bus.listen('test_dispatch', listener)
+        self.bus.fire('test_dispatch')
+        self.hass.block_till_done()
+        assert calls == ['test_dispatch']
+
+        unsub = self.bus.listen(ha.MATCH_ALL, listener)
+        self.bus.fire('test_dispatch')
+        self.hass.block_till_done()
+        assert calls == ['test_dispatch'] * 3
+
+        unsub()
+        self.bus.fire('test_dispatch')
+        self.hass.block_till_done()
+        assert calls == ['test_dispatch'] * 4
+
+    def test_listener_removed_while_firing(self):
+        """Test a listener removing another listener during dispatch."""
+        calls = []
+
+        @ha.callback
+        def first_listener(event):
+            calls.append('first')
+            self.bus.async_remove_listener('test_remove', second_listener)
+
+        @ha.callback
+        def second_listener(event):
+            calls.append('second')
+
+        self.bus.listen('test_remove', first_listener)
+        self.bus.listen('test_remove', second_listener)
+
+        self.bus.fire('test_remove')
+        self.hass.block_till_done()
+        self.bus.fire('test_remove')
+        self.hass.block_till_done()
+        assert calls == ['first', 'second', 'first']
+
+
+def test_listener_type():
+    """Test listeners are classified by how they are invoked."""
+    @asyncio.coroutine
+    def coro_listener(event):
+        pass
+
+    def thread_listener(event):
+        pass
+
+    assert ha._listener_type(coro_listener) == ha._LISTENER_COROUTINE
+    assert ha._listener_type(ha.callback(lambda event: None)) == \
+        ha._LISTENER_CALLBACK
+    assert ha._listener_type(thread_listener) == ha._LISTENER_THREADED
+
 
 class TestState(unittest.TestCase):
     """Test State methods."""
@@ -303,6 +419,31 @@ class TestState(unittest.TestCase):
         state = ha.State('domain.hello', 'world', {'some': 'attr'})
         self.assertEqual(state, ha.State.from_dict(state.as_dict()))
 
+    def test_dict_conversion_cached(self):
+        """Test the dict and JSON representation are built once."""
+        state = ha.State('domain.hello', 'world', {'some': 'attr'},
+                         datetime(1984, 12, 8, 12, 0, 0, tzinfo=pytz.utc))
+        self.assertIs(state.as_dict(), state.as_dict())
+        self.assertIs(state.as_json(), state.as_json())
+        self.assertEqual(state, ha.State.from_dict(
+            json.loads(state.as_json())))
+        self.assertEqual(
+            '1984-12-08T12:00:00+00:00',
+            json.loads(state.as_json())['last_changed'])
+
+    def test_attributes_copy_on_write(self):
+        """Test attributes are copied from dicts and shared between states."""
+        attributes = {'some': 'attr'}
+        state = ha.State('domain.hello', 'world', attributes)
+        attributes['some'] = 'other'
+        self.assertEqual('attr', state.attributes['some'])
+
+        new_state = ha.State('domain.hello', 'moon', state.attributes)
+        self.assertIs(state.attributes, new_state.attributes)
+
+        with self.assertRaises(AttributeError):
+            state.extra = 1
+
     def test_dict_conversion_with_wrong_data(self):
         """Test conversion with wrong data."""
         self.assertIsNone(ha.State.from_dict(None))
@@ -371,6 +512,22 @@ class TestStateMachine(unittest.TestCase):
         states = sorted(state.entity_id for state in self.states.all())
         self.assertEqual(['light.bowl', 'switch.ac'], states)
 
+    def test_domain_index(self):
+        """Test the domain index follows set and remove."""
+        self.states.set('light.Kitchen', 'off')
+        self.assertEqual(['light.bowl', 'light.kitchen'],
+                         sorted(self.states.entity_ids('LIGHT')))
+        self.assertEqual(['switch.ac'],
+                         [state.entity_id for state
+                          in self.states.all('switch')])
+
+        self.states.remove('light.bowl')
+        self.states.remove('switch.ac')
+        self.assertEqual(['light.kitchen'], self.states.entity_ids('light'))
+        self.assertEqual([], self.states.entity_ids('switch'))
+        self.assertEqual([], self.states.all('switch'))
+        self.assertNotIn('switch', self.states._domains)
+
     def test_remove(self):
         """Test remove method."""
         events = []
@@ -433,6 +590,140 @@ class TestStateMachine(unittest.TestCase):
         self.hass.block_till_done()
         self.assertEqual(1, len(events))
 
+    def test_changed_attributes(self):
+        """Test state_changed carries the attribute delta."""
+        events = []
+        self.hass.bus.listen(EVENT_STATE_CHANGED, lambda ev: events.append(ev))
+
+        self.states.set('light.bowl', 'on', {'brightness': 100, 'rgb': 1})
+        self.states.set('light.bowl', 'on', {'brightness': 100, 'rgb': 1})
+        self.states.set('light.bowl', 'on', {'brightness': 150})
+        self.states.set('light.bowl', 'off', {'brightness': 150})
+        self.states.set('light.new', 'on', {'brightness': 50})
+        self.hass.block_till_done()
+
+        self.assertEqual(
+            [{'brightness': 100, 'rgb': 1},
+             {'brightness': 150, 'rgb': None},
+             {},
+             {'brightness': 50}],
+            [event.data['changed_attributes'] for event in events])
+
+        # Unchanged attributes are shared with the previous state
+        self.assertIs(events[2].data['old_state'].attributes,
+                      events[2].data['new_state'].attributes)
+
+    def test_coalesce(self):
+        """Test state changes inside a window collapse into one event."""
+        events = []
+        self.hass.bus.listen(EVENT_STATE_CHANGED, lambda ev: events.append(ev))
+        self.states.coalesce('light', 0.05)
+
+        self.states.set('light.bowl', 'off')
+        self.states.set('light.bowl', 'on', {'brightness': 100})
+        self.states.set('light.bowl', 'on', {'brightness': 150})
+        self.states.set('switch.ac', 'on')
+        self.hass.block_till_done()
+
+        self.assertEqual(['switch.ac', 'light.bowl'],
+                         [event.data['entity_id'] for event in events])
+        self.assertEqual('on', events[1].data['old_state'].state)
+        self.assertEqual(150, events[1].data['new_state'].attributes[
+            'brightness'])
+        self.assertEqual({'brightness': 150},
+                         events[1].data['changed_attributes'])
+
+        # Changes that end up at the old state are dropped
+        self.states.set('light.bowl', 'off')
+        self.states.set('light.bowl', 'on', {'brightness': 150})
+        self.hass.block_till_done()
+        self.assertEqual(2, len(events))
+
+    def test_coalesce_force_update_and_remove(self):
+        """Test force_update and remove close the window right away."""
+        events = []
+        self.hass.bus.listen(EVENT_STATE_CHANGED, lambda ev: events.append(ev))
+        self.states.coalesce('light', 10)
+        self.states.coalesce('light.Bowl', 0)
+        self.states.coalesce('light.kitchen', 10)
+        self.states.coalesce('light.kitchen', None)
+        self.states.coalesce('light.kitchen', 10)
+
+        self.states.set('light.bowl', 'off')
+        self.states.set('light.kitchen', 'on')
+        self.states.set('light.kitchen', 'off', None, True)
+        self.states.set('light.living', 'on')
+        self.states.remove('light.living')
+        self.hass.block_till_done()
+
+        self.assertEqual(
+            [('light.bowl', 'on', 'off'),
+             ('light.kitchen', None, 'off'),
+             ('light.living', None, 'on'),
+             ('light.living', 'on', None)],
+            [(event.data['entity_id'],
+              getattr(event.data['old_state'], 'state', None),
+              getattr(event.data['new_state'], 'state', None))
+             for event in events])
+
+    def test_track_entity_ids(self):
+        """Test state_changed listeners are dispatched per entity id."""
+        bowl_calls = []
+        all_calls = []
+
+        def track():
+            """Register the listeners."""
+            unsub = self.states.async_track_entity_ids(
+                ('light.bowl',), bowl_calls.append)
+            self.states.async_track_entity_ids(
+                ha.MATCH_ALL, all_calls.append)
+            return unsub
+
+        unsub_bowl = run_callback_threadsafe(
+            self.hass.loop, track).result()
+        self.assertEqual({'light.bowl': 1, ha.MATCH_ALL: 1},
+                         self.states.entity_listeners)
+
+        self.states.set('switch.ac', 'on')
+        self.hass.block_till_done()
+        self.assertEqual(0, len(bowl_calls))
+        self.assertEqual(1, len(all_calls))
+
+        self.states.set('light.bowl', 'off')
+        self.hass.block_till_done()
+        self.assertEqual(1, len(bowl_calls))
+        self.assertEqual('light.bowl', bowl_calls[0].data['entity_id'])
+        self.assertEqual(2, len(all_calls))
+
+        run_callback_threadsafe(self.hass.loop, unsub_bowl).result()
+        self.assertEqual({ha.MATCH_ALL: 1}, self.states.entity_listeners)
+
+        self.states.set('light.bowl', 'on')
+        self.hass.block_till_done()
+        self.assertEqual(1, len(bowl_calls))
+        self.assertEqual(3, len(all_calls))
+
+    def test_track_entity_ids_failing_listener(self):
+        """Test a failing listener does not stop dispatch to others."""
+        calls = []
+
+        def failing_listener(event):
+            """Raise an error."""
+            raise ValueError()
+
+        def track():
+            """Register the listeners."""
+            self.states.async_track_entity_ids(
+                ('light.bowl',), failing_listener)
+            self.states.async_track_entity_ids(
+                ('light.bowl',), calls.append)
+
+        run_callback_threadsafe(self.hass.loop, track).result()
+
+        self.states.set('light.bowl', 'off')
+        self.hass.block_till_done()
+        self.assertEqual(1, len(calls))
+
 
 class TestServiceCall(unittest.TestCase):
     """Test ServiceCall class."""
@@ -534,6 +825,242 @@ class TestServiceRegistry(unittest.TestCase):
         self.hass.block_till_done()
         self.assertEqual(1, len(calls))
 
+    def test_call_direct_dispatch(self):
+        """Test local calls run directly and still fire the bus events."""
+        calls = []
+        events = []
+
+        @ha.callback
+        def service_handler(call):
+            """Service handler."""
+            calls.append(call)
+
+        self.services.register('test_domain', 'register_calls',
+                               service_handler)
+
+        @ha.callback
+        def listener(event):
+            """Record the event."""
+            events.append(event)
+
+        self.hass.bus.listen(ha.EVENT_CALL_SERVICE, listener)
+        self.hass.bus.listen(ha.EVENT_SERVICE_EXECUTED, listener)
+
+        fut = run_coroutine_threadsafe(
+            self.services.async_call('test_domain', 'register_calls',
+                                     {'hello': 'world'}),
+            self.hass.loop).result()
+        self.assertEqual(1, len(calls))
+        self.assertTrue(fut.result())
+
+        self.hass.block_till_done()
+        self.assertEqual(1, len(calls))
+        self.assertEqual(
+            [ha.EVENT_CALL_SERVICE, ha.EVENT_SERVICE_EXECUTED],
+            [event.event_type for event in events])
+        self.assertEqual(calls[0].call_id,
+                         events[1].data[ha.ATTR_SERVICE_CALL_ID])
+
+    def test_call_with_foreign_call_id(self):
+        """Test calls fired with an id that looks like ours still run."""
+        calls = []
+
+        self.services.register('test_domain', 'register_calls',
+                               lambda call: calls.append(call))
+
+        self.hass.bus.fire(ha.EVENT_CALL_SERVICE, {
+            ha.ATTR_DOMAIN: 'test_domain',
+            ha.ATTR_SERVICE: 'register_calls',
+            ha.ATTR_SERVICE_CALL_ID: '{}-1'.format(id(self.services)),
+        })
+        self.hass.block_till_done()
+        self.assertEqual(1, len(calls))
+
+    def test_call_service_raising(self):
+        """Test a failing service makes a blocking call return False."""
+        def service_handler(call):
+            """Service handler."""
+            raise ValueError
+
+        self.services.register('test_domain', 'fail', service_handler)
+        self.assertFalse(
+            self.services.call('test_domain', 'fail', blocking=True))
+
+    def test_call_service_from_event(self):
+        """Test services are called from events fired on the bus."""
+        calls = []
+        self.services.register('test_domain', 'register_calls',
+                               lambda call: calls.append(call))
+
+        self.hass.bus.fire(ha.EVENT_CALL_SERVICE, {
+            ha.ATTR_DOMAIN: 'test_domain',
+            ha.ATTR_SERVICE: 'register_calls',
+        })
+        self.hass.block_till_done()
+        self.assertEqual(1, len(calls))
+
+    def test_call_service_concurrency_limit(self):
+        """Test calls over the concurrency limit are queued or rejected."""
+        calls = []
+        gate = asyncio.Event(loop=self.hass.loop)
+
+        @asyncio.coroutine
+        def service_handler(call):
+            """Service handler that waits till the gate opens."""
+            calls.append(call.data['idx'])
+            yield from gate.wait()
+
+        self.services.register('test_domain', 'limited', service_handler,
+                               max_concurrency=1, max_queue=1)
+
+        @asyncio.coroutine
+        def call_service():
+            """Call the service three times without blocking."""
+            results = []
+            for idx in range(3):
+                results.append((yield from self.services.async_call(
+                    'test_domain', 'limited', {'idx': idx})))
+            return results, self.services.async_stats()
+
+        results, stats = run_coroutine_threadsafe(
+            call_service(), self.hass.loop).result()
+        stats = stats['test_domain']['limited']
+
+        self.assertTrue(results[2].done())
+        self.assertFalse(results[2].result())
+        self.assertEqual(1, stats['in_flight'])
+        self.assertEqual(1, stats['queued'])
+        self.assertEqual(1, stats['rejected'])
+        self.assertEqual(0, stats['calls'])
+
+        self.hass.loop.call_soon_threadsafe(gate.set)
+        self.hass.block_till_done()
+
+        stats = self.services.stats['test_domain']['limited']
+        self.assertEqual([0, 1], calls)
+        self.assertTrue(results[0].result())
+        self.assertTrue(results[1].result())
+        self.assertEqual(0, stats['in_flight'])
+        self.assertEqual(0, stats['queued'])
+        self.assertEqual(2, stats['calls'])
+        self.assertIsNotNone(stats['p99'])
+
+
+class TestScheduler(unittest.TestCase):
+    """Test the Scheduler."""
+
+    def setUp(self):     # pylint: disable=invalid-name
+        """Setup things to be run when tests are started."""
+        self.hass = get_test_home_assistant()
+        self.scheduler = self.hass.scheduler
+
+    def tearDown(self):  # pylint: disable=invalid-name
+        """Stop down stuff we started."""
+        self.hass.stop()
+
+    def schedule(self, point_in_time, action):
+        """Schedule action from within the event loop."""
+        return run_callback_threadsafe(
+            self.hass.loop, self.scheduler.async_schedule, point_in_time,
+            action).result()
+
+    def fire_time_changed(self, now):
+        """Fire a time changed event."""
+        self.hass.bus.fire(ha.EVENT_TIME_CHANGED, {ha.ATTR_NOW: now})
+        self.hass.block_till_done()
+
+    def test_only_due_callbacks_run(self):
+        """Test that callbacks run in order once they are due."""
+        now = dt_util.utcnow()
+        calls = []
+
+        self.schedule(now + timedelta(seconds=20),
+                      lambda now: calls.append('late'))
+        self.schedule(now + timedelta(seconds=10),
+                      lambda now: calls.append('early'))
+
+        self.fire_time_changed(now + timedelta(seconds=5))
+        self.assertEqual([], calls)
+
+        self.fire_time_changed(now + timedelta(seconds=10))
+        self.assertEqual(['early'], calls)
+
+        self.fire_time_changed(now + timedelta(seconds=30))
+        self.assertEqual(['early', 'late'], calls)
+
+        self.fire_time_changed(now + timedelta(seconds=40))
+        self.assertEqual(['early', 'late'], calls)
+
+    def test_cancel(self):
+        """Test that cancelled callbacks do not run."""
+        now = dt_util.utcnow()
+        calls = []
+
+        cancel = self.schedule(now + timedelta(seconds=10), calls.append)
+        run_callback_threadsafe(self.hass.loop, cancel).result()
+
+        self.fire_time_changed(now + timedelta(seconds=20))
+        self.assertEqual([], calls)
+
+    def test_cancel_due_callback_from_action(self):
+        """Test cancelling a due callback from another due callback."""
+        now = dt_util.utcnow()
+        calls = []
+        cancels = []
+
+        def cancel_other(now):
+            """Cancel the other due callback and compact the heap."""
+            calls.append('first')
+            cancels[0]()
+            for cancel in cancels[1:]:
+                cancel()
+
+        self.schedule(now, cancel_other)
+        cancels.append(self.schedule(now + timedelta(seconds=1),
+                                     lambda now: calls.append('second')))
+        cancels.extend(self.schedule(now + timedelta(seconds=20), calls.append)
+                       for _ in range(2))
+
+        self.fire_time_changed(now + timedelta(seconds=5))
+        self.assertEqual(['first'], calls)
+        self.assertEqual(0, self.scheduler._cancelled)
+
+        self.fire_time_changed(now + timedelta(seconds=30))
+        self.assertEqual(['first'], calls)
+        self.assertEqual(0, self.scheduler._cancelled)
+
+    def test_scheduled_while_running_waits(self):
+        """Test callbacks scheduled by a due callback wait for their turn."""
+        now = dt_util.utcnow()
+        calls = []
+
+        def reschedule(now):
+            """Schedule ourselves again in the past."""
+            calls.append(now)
+            self.scheduler.async_schedule(now, reschedule)
+
+        self.schedule(now, reschedule)
+
+        self.fire_time_changed(now)
+        self.assertEqual(1, len(calls))
+
+        self.fire_time_changed(now)
+        self.assertEqual(2, len(calls))
+
+    def test_wakeup_with_call_at(self):
+        """Test the loop is woken up for a callback once started."""
+        event = threading.Event()
+
+        self.schedule(dt_util.utcnow() + timedelta(milliseconds=50),
+                      lambda now: event.set())
+        run_callback_threadsafe(
+            self.hass.loop, self.scheduler.async_start).result()
+
+        self.assertTrue(event.wait(5))
+
+        run_callback_threadsafe(
+            self.hass.loop, self.scheduler.async_stop).result()
+
 
 class TestConfig(unittest.TestCase):
     """Test configuration methods."""
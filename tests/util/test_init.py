@@ -1,5 +1,6 @@
 """Test Home Assistant util methods."""
 # pylint: disable=too-many-public-methods
+import threading
 import unittest
 from unittest.mock import patch
 from datetime import datetime, timedelta
@@ -259,3 +260,107 @@ class TestUtil(unittest.TestCase):
 
         self.assertTrue(tester.hello())
         self.assertTrue(tester.goodbye())
+
+
+class TestPendingWork(unittest.TestCase):
+    """Test the PendingWork counter."""
+
+    def test_notify_idle(self):
+        """Test waiters are called once all work is done."""
+        pending = util.PendingWork()
+        calls = []
+
+        pending.notify_idle(lambda: calls.append('idle'))
+        self.assertEqual(['idle'], calls)
+
+        pending.add(2)
+        pending.notify_idle(lambda: calls.append('done'))
+        pending.done()
+        self.assertEqual(['idle'], calls)
+
+        pending.run(calls.append, 'run')
+        self.assertEqual(['idle', 'run', 'done'], calls)
+        self.assertEqual(0, pending.count)
+
+    def test_run_marks_done_on_error(self):
+        """Test a failing target is still marked as done."""
+        pending = util.PendingWork()
+        pending.add()
+
+        def fail():
+            raise ValueError
+
+        with self.assertRaises(ValueError):
+            pending.run(fail)
+
+        self.assertEqual(0, pending.count)
+
+
+class TestHistogram(unittest.TestCase):
+    """Test the Histogram."""
+
+    def test_add_and_percentile(self):
+        """Test values are counted in their buckets."""
+        hist = util.Histogram((1, 2, 4))
+        self.assertIsNone(hist.percentile(50))
+
+        for value in (0.5, 0.5, 1.5, 3, 10):
+            hist.add(value)
+
+        self.assertEqual([2, 1, 1, 1], hist.counts)
+        self.assertEqual(5, hist.count)
+        self.assertEqual(10, hist.max)
+        self.assertEqual(1, hist.percentile(40))
+        self.assertEqual(2, hist.percentile(60))
+        self.assertEqual(10, hist.percentile(99))
+        self.assertEqual(
+            {'1': 2, '2': 1, '4': 1, 'inf': 1}, hist.as_dict()['buckets'])
+
+
+class TestThreadPool(unittest.TestCase):
+    """Test the ThreadPool."""
+
+    def test_priority_lanes(self):
+        """Test jobs run by priority and in order within a priority."""
+        calls = []
+        pool = util.ThreadPool(lambda job: calls.append(job))
+
+        pool.add_job(2, 'low 1')
+        pool.add_many_jobs([(1, 'high 1'), (2, 'low 2'), (1, 'high 2')])
+        self.assertEqual(4, pool.queue_size)
+
+        pool.add_worker()
+        pool.stop()
+
+        self.assertEqual(['high 1', 'high 2', 'low 1', 'low 2'], calls)
+        self.assertEqual(0, pool.queue_size)
+
+    def test_grows_when_busy(self):
+        """Test the pool adds workers up to the maximum when backed up."""
+        release = threading.Event()
+        pool = util.ThreadPool(lambda job: release.wait(), 1, 3)
+
+        for _ in range(10):
+            pool.add_job(0, 'job')
+
+        self.assertEqual(3, pool.worker_count)
+
+        release.set()
+        pool.stop()
+
+    def test_job_stats(self):
+        """Test wait and run time are recorded per job target."""
+        def job_target():
+            """Do nothing."""
+
+        pool = util.ThreadPool(lambda job: job[0](), 1)
+        pool.add_job(0, (job_target,))
+        pool.add_job(0, (job_target,))
+        pool.block_till_done()
+
+        stats = pool.job_stats
+        name = '{}.{}'.format(__name__, job_target.__qualname__)
+        self.assertEqual(2, stats[name]['wait']['count'])
+        self.assertEqual(2, stats[name]['run']['count'])
+        self.assertEqual([], pool.current_jobs)
+        pool.stop()